@@ -6,7 +6,7 @@ packages = [
     # Bibliotecas de terceiros
     "lxml", "openpyxl", "PIL", "ttkbootstrap", "configparser", 
     "requests", "firebase_admin", "bcrypt", "cryptography", "pytz",
-    "pandas", "reportlab", "docx",
+    "pandas", "pyarrow", "xlsxwriter", "reportlab", "docx",
     "googleapiclient", "google_auth_oauthlib", "google_auth_httplib2",
 ]
 
@@ -28,7 +28,15 @@ build_exe_options = {
         "dp_logic",
         "client_logic",
         "support_logic",
-        "report_logic"
+        "report_logic",
+        "cache_logic",
+        "watch_logic",
+        "columnar_logic",
+        "export_logic",
+        "job_logic",
+        "format_logic",
+        "metrics_logic",
+        "source_logic"
     ],
 }
 
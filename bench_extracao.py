@@ -0,0 +1,591 @@
+# =============================================================================
+# --- ARQUIVO: bench_extracao.py ---
+# (Benchmark do pipeline de extração: gera um corpus sintético de NFe/eventos no
+#  formato das notas de test_assets e mede extração, dashboard e Excel por etapa)
+#
+# Uso:
+#   python bench_extracao.py --arquivos 2000 --itens 8 --json bench_resultados.json
+#   python bench_extracao.py --somente-texto          (só o micro-benchmark do infCpl)
+#   python bench_extracao.py --latencia-ms 2 --profundidade 16   (simula pasta de rede; mede a leitura antecipada)
+# Cada execução é acrescentada ao JSON e comparada com a anterior de mesmos parâmetros.
+# =============================================================================
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import timeit
+import logging
+import platform
+import tempfile
+import argparse
+import statistics
+import tracemalloc
+import zipfile
+from datetime import datetime, timedelta
+
+from lxml import etree
+from openpyxl import Workbook
+from openpyxl.styles import Border, Side
+
+import core_logic
+import columnar_logic
+import export_logic
+import source_logic
+
+PASTA_ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_assets")
+NAMESPACE_NFE = "http://www.portalfiscal.inf.br/nfe"
+
+
+# =============================================================================
+# --- Gerador de corpus sintético ---
+# =============================================================================
+
+_CLIENTES = ["LEDMIDIA", "VITALCORE", "ACME", "BETAMED", "NORTEX", "SOLARIS", "MAXTRADE", "ORBITA"]
+_EMISSORES = [("4.00", "ti@narwalsistemas.com.br"), ("DIMNFE-4.00", "suporte@dimnfe.com.br"), ("2.1.7", "contato@sefaznet.com.br"), ("UniNFe 5.0", None)]
+_UFS = ["SP", "RJ", "MG", "ES", "SC", "PR", "RO", "AM", "EX"]
+_TEXTOS_LIVRES = [
+    "PIS e COFINS aplicado aliquota zero de acordo com o Anexo V da Instrução Normativa RFB nº 2.121/2022.",
+    "ICMS DIFERIDO CONFORME ART. 31 DO RICMS/RO.",
+    "Val Aprox Tributos R$ 32.540,71 (32,03%) Fonte: IBPT.",
+    "OUTRAS DESPESAS: ... TAXA SISCOMEX R$ 154,23.",
+    "Mercadoria destinada a comercialização. Não incide ST.",
+    "DATA DE REGISTRO DA DI {data}. VALOR CAMBIO=R$ 5,4759.",
+]
+
+def _formatar_br(valor):
+    """12345.6 -> '12.345,60'"""
+    return f"{valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+def _chave_acesso(cuf, data, cnpj, serie, nnf, cnf, tp_emis=1):
+    """Monta a chave de 44 dígitos com o dígito verificador (módulo 11), como nas notas reais."""
+    base = f"{cuf:02d}{data:%y%m}{cnpj}55{serie:03d}{nnf:09d}{tp_emis}{cnf:08d}"
+    soma = sum(int(d) * p for d, p in zip(reversed(base), [2, 3, 4, 5, 6, 7, 8, 9] * 6))
+    dv = 11 - soma % 11
+    return base + str(0 if dv >= 10 else dv)
+
+def _codigo_processo_baguncado(rnd, cliente, tipo, seq, ano):
+    """O mesmo processo escrito dos jeitos que aparecem no infCpl."""
+    return rnd.choice([
+        f"{cliente}{tipo}{seq:03d}{ano}", f"{cliente}.{tipo}.{seq:03d}.{ano}", f"{cliente} {tipo}-{seq:03d}/{ano}",
+        f"PROCESSO: {cliente} {tipo} {seq:03d}/{ano}", f"REF. PROCESSO {cliente}.{tipo}{seq:03d}-{ano}",
+    ])
+
+def _texto_complementar(rnd, processo, entrada, afrmm, frete, trading, tamanho_extra):
+    partes = [f"NºDA DI={rnd.randint(20, 25)}/{rnd.randint(1000000, 9999999)}-{rnd.randint(0, 9)}"]
+    partes += [t.format(data=f"{rnd.randint(1, 28):02d}/0{rnd.randint(1, 9)}/2025") for t in rnd.sample(_TEXTOS_LIVRES, rnd.randint(1, 3))]
+    if processo: partes.insert(rnd.randint(0, len(partes)), processo)
+    if afrmm: partes.append(f"VALOR AFRMM=R$ {_formatar_br(afrmm)}")
+    if entrada and frete: partes.append(f"FRETE NACIONAL R$ {_formatar_br(frete)}")
+    if trading: partes.append(f"SERVICO TRADING R$ {_formatar_br(trading)}")
+    partes += rnd.choices(_TEXTOS_LIVRES, k=tamanho_extra)
+    return " ".join(partes)
+
+def _xml_nota(rnd, numero, itens, processos, data_base):
+    """Uma nfeProc completa (NFe + protNFe) no layout 4.00. Retorna (chave, xml_sem_namespace_declarado)."""
+    entrada = rnd.random() < 0.5
+    cliente, tipo, seq, ano = rnd.choice(processos)
+    data = data_base + timedelta(days=rnd.randint(0, 180), seconds=rnd.randint(0, 86400))
+    cnpj_emit = "20104331000260"
+    chave = _chave_acesso(11, data, cnpj_emit, 1, numero, rnd.randint(0, 99999999))
+    ver_proc, email = rnd.choice(_EMISSORES)
+    cfop = "3102" if entrada else rnd.choice(["5102", "6102"])
+    uf = rnd.choice(_UFS)
+
+    dets, v_prod, v_ipi, v_pis, v_cofins, v_ii, v_outro = [], 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+    afrmm = round(rnd.uniform(50, 900), 2) if entrada and rnd.random() < 0.6 else 0.0
+    afrmm_no_item = afrmm and rnd.random() < 0.5
+    for n in range(1, itens + 1):
+        vp = round(rnd.uniform(100, 50000), 2); ipi, pis, cofins = round(vp * 0.075, 2), round(vp * 0.021, 2), round(vp * 0.0965, 2)
+        ii = round(vp * 0.14, 2) if entrada else 0.0; outro = round(rnd.uniform(0, 500), 2) if entrada else 0.0
+        v_prod += vp; v_ipi += ipi; v_pis += pis; v_cofins += cofins; v_ii += ii; v_outro += outro
+        di = ""
+        if entrada:
+            v_afrmm_item = f"{afrmm:.2f}" if (afrmm_no_item and n == 1) else "0.00"
+            di = (f"<DI><nDI>{rnd.randint(10**9, 10**10 - 1)}</nDI><dDI>{data:%Y-%m-%d}</dDI><xLocDesemb>VITORIA</xLocDesemb><UFDesemb>ES</UFDesemb>"
+                  f"<dDesemb>{data:%Y-%m-%d}</dDesemb><tpViaTransp>1</tpViaTransp><vAFRMM>{v_afrmm_item}</vAFRMM><tpIntermedio>1</tpIntermedio>"
+                  f"<adi><nAdicao>{n}</nAdicao><nSeqAdic>1</nSeqAdic><cFabricante>FAB{n:04d}</cFabricante></adi></DI>")
+        inf_ad_prod = f"<infAdProd>PROCESSO: {cliente} {tipo}-{seq:03d}/{ano} ITEM {n}</infAdProd>" if rnd.random() < 0.1 else ""
+        dets.append(
+            f'<det nItem="{n}"><prod><cProd>SKU{n:05d}</cProd><cEAN>SEM GTIN</cEAN><xProd>PRODUTO SINTETICO {n} - LINHA {rnd.randint(1, 99)}</xProd>'
+            f"<NCM>85299020</NCM><CFOP>{cfop}</CFOP><uCom>UN</uCom><qCom>{rnd.randint(1, 500)}.0000</qCom><vUnCom>{vp:.10f}</vUnCom><vProd>{vp:.2f}</vProd>"
+            f"<cEANTrib>SEM GTIN</cEANTrib><uTrib>KG</uTrib><qTrib>1.0000</qTrib><vUnTrib>{vp:.10f}</vUnTrib>{f'<vOutro>{outro:.2f}</vOutro>' if outro else ''}<indTot>1</indTot>{di}</prod>"
+            f"<imposto><vTotTrib>{ipi + pis + cofins:.2f}</vTotTrib><ICMS><ICMS51><orig>1</orig><CST>51</CST><vBC>0.00</vBC><vICMS>0.00</vICMS></ICMS51></ICMS>"
+            f"<IPI><cEnq>999</cEnq><IPITrib><CST>00</CST><vBC>{vp:.2f}</vBC><pIPI>7.5000</pIPI><vIPI>{ipi:.2f}</vIPI></IPITrib></IPI>"
+            f"{f'<II><vBC>{vp:.2f}</vBC><vDespAdu>0.00</vDespAdu><vII>{ii:.2f}</vII><vIOF>0.00</vIOF></II>' if entrada else ''}"
+            f"<PIS><PISOutr><CST>50</CST><vBC>{vp:.2f}</vBC><pPIS>2.1000</pPIS><vPIS>{pis:.2f}</vPIS></PISOutr></PIS>"
+            f"<COFINS><COFINSOutr><CST>50</CST><vBC>{vp:.2f}</vBC><pCOFINS>9.6500</pCOFINS><vCOFINS>{cofins:.2f}</vCOFINS></COFINSOutr></COFINS></imposto>{inf_ad_prod}</det>")
+
+    v_nf = v_prod + v_ipi + v_pis + v_cofins + v_ii + v_outro
+    frete = round(rnd.uniform(200, 5000), 2) if entrada and rnd.random() < 0.3 else 0.0
+    trading = round(rnd.uniform(500, 8000), 2) if entrada and rnd.random() < 0.4 else 0.0
+    processo = _codigo_processo_baguncado(rnd, cliente, tipo, seq, ano) if rnd.random() < 0.9 else ""
+    inf_cpl = _texto_complementar(rnd, processo, entrada, 0.0 if afrmm_no_item else afrmm, frete, trading, rnd.randint(0, 6))
+    resp_tec = f"<infRespTec><CNPJ>15426652000160</CNPJ><xContato>Suporte</xContato><email>{email}</email><fone>4834339753</fone></infRespTec>" if email else ""
+    c_stat = "100" if rnd.random() < 0.97 else "101"
+    xml = (
+        f'<nfeProc{{NS}} versao="4.00"><NFe><infNFe versao="4.00" Id="NFe{chave}">'
+        f"<ide><cUF>11</cUF><cNF>{chave[35:43]}</cNF><natOp>{cfop} - OPERACAO</natOp><mod>55</mod><serie>1</serie><nNF>{numero}</nNF>"
+        f"<dhEmi>{data:%Y-%m-%dT%H:%M:%S}-03:00</dhEmi><tpNF>{0 if entrada else 1}</tpNF><idDest>{3 if uf == 'EX' else 2}</idDest><cMunFG>1100205</cMunFG>"
+        f"<tpImp>1</tpImp><tpEmis>1</tpEmis><cDV>{chave[-1]}</cDV><tpAmb>1</tpAmb><finNFe>1</finNFe><indFinal>0</indFinal><indPres>9</indPres><procEmi>0</procEmi><verProc>{ver_proc}</verProc></ide>"
+        f"<emit><CNPJ>{cnpj_emit}</CNPJ><xNome>CUSTOMS TRADING - FILIAL</xNome><xFant>CUSTOMS TRADING</xFant><enderEmit><xLgr>AVENIDA JATUARANA</xLgr><nro>4756</nro>"
+        f"<xBairro>CALADINHO</xBairro><cMun>1100205</cMun><xMun>Porto Velho</xMun><UF>RO</UF><CEP>76808110</CEP></enderEmit><IE>00000006077374</IE><CRT>3</CRT></emit>"
+        f"<dest>{'<idEstrangeiro>EXT' + str(numero) + '</idEstrangeiro>' if uf == 'EX' else '<CNPJ>' + str(rnd.randint(10**13, 10**14 - 1)) + '</CNPJ>'}"
+        f"<xNome>{cliente} COMERCIO E IMPORTACAO LTDA</xNome><enderDest><xLgr>RUA SINTETICA</xLgr><nro>{rnd.randint(1, 9999)}</nro><xBairro>CENTRO</xBairro>"
+        f"<cMun>9999999</cMun><xMun>Cidade</xMun><UF>{uf}</UF></enderDest><indIEDest>9</indIEDest></dest>"
+        + "".join(dets) +
+        f"<total><ICMSTot><vBC>0.00</vBC><vICMS>0.00</vICMS><vICMSDeson>0.00</vICMSDeson><vFCP>0.00</vFCP><vBCST>0.00</vBCST><vST>0.00</vST>"
+        f"<vProd>{v_prod:.2f}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg><vDesc>0.00</vDesc><vII>{v_ii:.2f}</vII><vIPI>{v_ipi:.2f}</vIPI><vIPIDevol>0.00</vIPIDevol>"
+        f"<vPIS>{v_pis:.2f}</vPIS><vCOFINS>{v_cofins:.2f}</vCOFINS><vOutro>{v_outro:.2f}</vOutro><vNF>{v_nf:.2f}</vNF><vTotTrib>{v_ipi + v_pis + v_cofins:.2f}</vTotTrib></ICMSTot></total>"
+        f"<transp><modFrete>0</modFrete><vol><qVol>{rnd.randint(1, 50)}</qVol><esp>OUTROS</esp></vol></transp><pag><detPag><tPag>90</tPag><vPag>0.00</vPag></detPag></pag>"
+        f"<infAdic><infCpl>{_escapar(inf_cpl)}</infCpl></infAdic>{resp_tec}</infNFe></NFe>"
+        f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><verAplic>SVRS202501</verAplic><chNFe>{chave}</chNFe><dhRecbto>{data:%Y-%m-%dT%H:%M:%S}-03:00</dhRecbto>'
+        f"<nProt>1{rnd.randint(10**13, 10**14 - 1)}</nProt><cStat>{c_stat}</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe></nfeProc>"
+    )
+    return chave, xml
+
+def _xml_evento_cancelamento(rnd, chave, data_base):
+    data = data_base + timedelta(days=rnd.randint(1, 200))
+    return (
+        f'<procEventoNFe{{NS}} versao="1.00"><evento versao="1.00"><infEvento Id="ID110111{chave}01"><cOrgao>11</cOrgao><tpAmb>1</tpAmb>'
+        f"<CNPJ>20104331000260</CNPJ><chNFe>{chave}</chNFe><dhEvento>{data:%Y-%m-%dT%H:%M:%S}-03:00</dhEvento><tpEvento>110111</tpEvento><nSeqEvento>1</nSeqEvento>"
+        f"<verEvento>1.00</verEvento><detEvento versao=\"1.00\"><descEvento>Cancelamento</descEvento><nProt>1{rnd.randint(10**13, 10**14 - 1)}</nProt>"
+        f"<xJust>Erro na emissao da nota fiscal</xJust></detEvento></infEvento></evento>"
+        f"<retEvento versao=\"1.00\"><infEvento><tpAmb>1</tpAmb><cStat>135</cStat><xMotivo>Evento registrado e vinculado a NF-e</xMotivo><chNFe>{chave}</chNFe>"
+        f"<tpEvento>110111</tpEvento></infEvento></retEvento></procEventoNFe>"
+    )
+
+def _escapar(texto):
+    return texto.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def gerar_corpus(pasta, arquivos=500, itens=5, namespace=True, proporcao_eventos=0.05, semente=42):
+    """
+    Grava 'arquivos' XMLs em 'pasta': notas nfeProc com 'itens' itens cada (variando de 1 a 2x) e, na
+    proporção pedida, eventos de cancelamento (procEventoNFe 110111) de notas do próprio corpus.
+    Retorna a lista de caminhos gerados.
+    """
+    rnd = random.Random(semente)
+    os.makedirs(pasta, exist_ok=True)
+    declaracao_ns = f' xmlns="{NAMESPACE_NFE}"' if namespace else ""
+    data_base = datetime(2025, 1, 1)
+    n_processos = max(1, arquivos // 10)
+    processos = [(rnd.choice(_CLIENTES), rnd.choice(["IMP", "IMP", "IMP", "EXP"]), seq, rnd.choice([2024, 2025])) for seq in range(1, n_processos + 1)]
+    n_eventos = int(arquivos * proporcao_eventos)
+    caminhos, chaves = [], []
+    for numero in range(1, arquivos - n_eventos + 1):
+        chave, xml = _xml_nota(rnd, numero, max(1, rnd.randint(itens // 2 or 1, itens * 2 - itens // 2)), processos, data_base)
+        caminho = os.path.join(pasta, f"NFe{chave}.xml")
+        with open(caminho, "w", encoding="utf-8") as f: f.write('<?xml version="1.0" encoding="UTF-8"?>' + xml.replace("{NS}", declaracao_ns))
+        caminhos.append(caminho); chaves.append(chave)
+    for chave in rnd.sample(chaves, min(n_eventos, len(chaves))):
+        caminho = os.path.join(pasta, f"110111{chave}01-procEventoNFe.xml")
+        with open(caminho, "w", encoding="utf-8") as f: f.write('<?xml version="1.0" encoding="UTF-8"?>' + _xml_evento_cancelamento(rnd, chave, data_base).replace("{NS}", declaracao_ns))
+        caminhos.append(caminho)
+    return caminhos
+
+# =============================================================================
+# --- Medição ---
+# =============================================================================
+
+def pico_memoria_mb():
+    """Pico de memória residente do processo (MB), ou None se a plataforma não informar."""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t), ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t), ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        contadores = PROCESS_MEMORY_COUNTERS(); contadores.cb = ctypes.sizeof(contadores)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(contadores), contadores.cb)
+        return round(contadores.PeakWorkingSetSize / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+class Etapa:
+    """Cronometra um trecho: tempo de parede, pico de RSS ao final e, opcionalmente, pico alocado no Python (tracemalloc)."""
+    def __init__(self, nome, resultados, itens=None, rastrear_memoria=False):
+        self.nome, self.resultados, self.itens, self.rastrear_memoria = nome, resultados, itens, rastrear_memoria
+        self.extras = {}
+    def __enter__(self):
+        if self.rastrear_memoria: tracemalloc.start()
+        self.inicio = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        segundos = time.perf_counter() - self.inicio
+        registro = {"segundos": round(segundos, 4), "pico_rss_mb": pico_memoria_mb()}
+        if self.itens: registro["arquivos_por_segundo"] = round(self.itens / segundos, 1) if segundos else None
+        if self.rastrear_memoria:
+            registro["pico_python_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1); tracemalloc.stop()
+        registro.update(self.extras)
+        self.resultados[self.nome] = registro
+        return False
+
+def _percentis_ms(duracoes):
+    if not duracoes: return {}
+    ordenadas = sorted(duracoes)
+    def p(q): return round(ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000, 3)
+    return {"p50_ms": p(0.50), "p95_ms": p(0.95), "max_ms": round(ordenadas[-1] * 1000, 3), "media_ms": round(statistics.fmean(ordenadas) * 1000, 3)}
+
+def gerar_planilha(dados_extraidos, caminho, formato=export_logic.FORMATO_PADRAO):
+    """Gera a Planilha Completa no formato pedido (export_logic). Retorna (tempo de gravação, arquivos gerados)."""
+    planilha = core_logic.montar_planilha_completa(dados_extraidos, {}, export_logic.criar_escritor(formato))
+    inicio = time.perf_counter(); planilha.save(caminho)
+    return time.perf_counter() - inicio, getattr(planilha, 'arquivos', None) or [caminho]
+
+def gerar_planilha_legado(dados_extraidos, caminho):
+    """Abas Entrada/Saída montadas célula a célula num Workbook comum, como era antes do modo streaming."""
+    wb = Workbook()
+    saida_ws, entrada_ws = wb.create_sheet("Saída"), wb.create_sheet("Entrada"); del wb['Sheet']
+    cabecalhos = core_logic.CABECALHOS_COMPLETOS
+    core_logic.setup_headers(entrada_ws, cabecalhos); core_logic.setup_headers(saida_ws, cabecalhos)
+    row_in, row_out = 2, 2
+    for dados in dados_extraidos:
+        if dados['tipo_nota'] == "Saída": core_logic.write_data_to_excel(saida_ws, row_out, dados, cabecalhos); row_out += 1
+        else: core_logic.write_data_to_excel(entrada_ws, row_in, dados, cabecalhos); row_in += 1
+    core_logic.add_totals_row(entrada_ws, cabecalhos); core_logic.add_totals_row(saida_ws, cabecalhos)
+    inicio = time.perf_counter(); wb.save(caminho)
+    return time.perf_counter() - inicio
+
+def simular_latencia(segundos):
+    """Atrasa cada abertura de XML em 'segundos', como numa pasta de rede (só neste processo)."""
+    if segundos <= 0: return
+    abrir, ler_conteudo = source_logic.abrir, source_logic.ler_conteudo
+    def abrir_lento(caminho): time.sleep(segundos); return abrir(caminho)
+    def ler_conteudo_lento(caminho, limite_mmap=None): time.sleep(segundos); return ler_conteudo(caminho, limite_mmap)
+    source_logic.abrir, source_logic.ler_conteudo = abrir_lento, ler_conteudo_lento
+
+def executar_pipeline(caminhos, pasta_saida, motor=None, workers=1, rastrear_memoria=False, excel_legado=False, profundidade=None):
+    """Roda extração, dashboard e Excel sobre o corpus e devolve {etapa: métricas}."""
+    etapas = {}
+    total = len(caminhos)
+    profundidade = source_logic.PROFUNDIDADE_LEITURA if profundidade is None else profundidade
+
+    duracoes, dados_extraidos, tempos = [], [], {}
+    with Etapa("extracao", etapas, total, rastrear_memoria) as etapa:
+        for caminho in caminhos:
+            inicio = time.perf_counter()
+            dados = core_logic.extrair_dados_nf(caminho, motor, tempos)
+            duracoes.append(time.perf_counter() - inicio)
+            if dados: dados_extraidos.append(dados)
+        etapa.extras.update(_percentis_ms(duracoes)); etapa.extras["notas_extraidas"] = len(dados_extraidos)
+        etapa.extras.update({f"ms_{nome}": round(tempos.get(nome, 0.0) * 1000, 3) for nome in core_logic.ETAPAS_EXTRACAO})
+        etapa.extras["mb_lidos"] = round(sum(os.path.getsize(c) for c in caminhos) / (1024 * 1024), 2)
+
+    # Mesma extração em um processo, sem e com leitura antecipada (a diferença é a espera de E/S escondida).
+    for nome, profundidade_etapa in (("leitura_sequencial", 0), ("leitura_antecipada", profundidade)):
+        with Etapa(nome, etapas, total) as etapa:
+            core_logic.extrair_lote(caminhos, workers=1, usar_cache=False, motor=motor, profundidade_leitura=profundidade_etapa)
+            etapa.extras["profundidade"] = profundidade_etapa
+
+    with Etapa("triagem", etapas, total) as etapa:
+        triagem = core_logic.triar_arquivos(caminhos, profundidade)
+        etapa.extras["ignorados"] = len(triagem.ignorados)
+
+    with Etapa("deduplicacao", etapas, total) as etapa:
+        deduplicacao = core_logic.deduplicar_por_chave(triagem.arquivos, triagem.classificacoes)
+        etapa.extras["duplicados"] = len(deduplicacao.duplicados); etapa.extras["pareados"] = deduplicacao.pareados
+
+    if workers != 1:
+        with Etapa("extracao_lote", etapas, total) as etapa:
+            core_logic.extrair_lote(caminhos, workers=workers or None, usar_cache=False, motor=motor, profundidade_leitura=profundidade)
+            etapa.extras["workers"] = workers or os.cpu_count()
+
+    # Mesmo corpus dentro de um .zip: listagem e extração lendo os membros direto do pacote.
+    caminho_zip = os.path.join(pasta_saida, "bench_corpus.zip")
+    with zipfile.ZipFile(caminho_zip, "w", zipfile.ZIP_DEFLATED) as pacote:
+        for caminho in caminhos: pacote.write(caminho, os.path.basename(caminho))
+    try:
+        with Etapa("extracao_zip", etapas, total, rastrear_memoria) as etapa:
+            membros = source_logic.listar_xmls([caminho_zip]).arquivos
+            extraidos_zip = core_logic.extrair_lote(membros, workers=workers or None, usar_cache=False, motor=motor, profundidade_leitura=profundidade)
+            etapa.extras["notas_extraidas"] = sum(1 for dados in extraidos_zip if dados)
+            etapa.extras["mb_zip"] = round(os.path.getsize(caminho_zip) / (1024 * 1024), 2)
+    finally:
+        source_logic.fechar_pacotes(); os.remove(caminho_zip)
+
+    with Etapa("dashboard", etapas, len(dados_extraidos), rastrear_memoria):
+        core_logic.calcular_dados_dashboard(dados_extraidos)
+
+    with Etapa("dashboard_colunar", etapas, len(dados_extraidos), rastrear_memoria) as etapa:
+        tabela = columnar_logic.TabelaNotas(enumerate(dados_extraidos))
+        inicio = time.perf_counter(); tabela.resumo_dashboard()
+        etapa.extras["segundos_carga"] = round(time.perf_counter() - inicio, 4)
+        # "Recalcular" da tela: com a tabela já montada, só refaz os group-by.
+        inicio = time.perf_counter(); tabela.resumo_dashboard(); tabela.contagem_saida_por_processo()
+        etapa.extras["ms_recalculo"] = round((time.perf_counter() - inicio) * 1000, 3)
+
+    with Etapa("excel", etapas, len(dados_extraidos), rastrear_memoria) as etapa:
+        segundos, arquivos = gerar_planilha(dados_extraidos, os.path.join(pasta_saida, "bench_planilha.xlsx"))
+        etapa.extras["segundos_gravacao"] = round(segundos, 4)
+        etapa.extras["mb_planilha"] = round(sum(os.path.getsize(a) for a in arquivos) / (1024 * 1024), 2)
+
+    # Mesmas abas nos outros escritores disponíveis (Excel rápido / CSV).
+    for formato in export_logic.formatos_disponiveis():
+        if formato == export_logic.FORMATO_PADRAO: continue
+        with Etapa(f"relatorio_{formato}", etapas, len(dados_extraidos), rastrear_memoria) as etapa:
+            caminho = os.path.join(pasta_saida, "bench_planilha" + export_logic.extensao_formato(formato))
+            segundos, arquivos = gerar_planilha(dados_extraidos, caminho, formato)
+            etapa.extras["segundos_gravacao"] = round(segundos, 4)
+            etapa.extras["mb_planilha"] = round(sum(os.path.getsize(a) for a in arquivos) / (1024 * 1024), 2)
+
+    if excel_legado:
+        with Etapa("excel_legado", etapas, len(dados_extraidos), rastrear_memoria) as etapa:
+            caminho_xlsx = os.path.join(pasta_saida, "bench_planilha_legado.xlsx")
+            etapa.extras["segundos_gravacao"] = round(gerar_planilha_legado(dados_extraidos, caminho_xlsx), 4)
+
+    etapas["linha_planilha"] = medir_linha_planilha(dados_extraidos[:2000])
+
+    lentos = sorted(zip(duracoes, caminhos), reverse=True)[:5]
+    etapas["extracao"]["mais_lentos"] = [{"arquivo": os.path.basename(c), "ms": round(d * 1000, 3)} for d, c in lentos]
+    return etapas
+
+# =============================================================================
+# --- Micro-benchmark da mineração de texto (infCpl/infAdProd) ---
+# =============================================================================
+
+# Textos sintéticos com os formatos que aparecem nas notas reais (processo só nos itens, frete, trading, texto longo sem nada).
+_TEXTOS_SINTETICOS = [
+    ("REF. PROCESSO: ACME IMP-014/2024 - FRETE NACIONAL R$ 1.250,00 - SERVICO TRADING R$ 3.400,10", [], True, True),
+    ("DI 24/0001234-5. VALOR AFRMM R$ 812,33. TAXA SISCOMEX R$ 154,23. " * 3, ["PROCESSO: BETA.EXP.007.2023 ITEM 1"], True, False),
+    ("Informacoes complementares sem nenhuma das palavras-chave, apenas texto corrido de observacao. " * 12, ["REGISTRO: GAMA 99", "outro item"], True, True),
+    ("", ["PROCESSO: DELTA IMP 002 2025"], True, True),
+]
+
+def _minerar_textos_legado(texto_completo_adicional, textos_itens, buscar_afrmm, buscar_frete):
+    """Cópia da mineração como era antes do registro de padrões (uma re.search por regra, sobre o texto inteiro)."""
+    v_afrmm = None
+    if buscar_afrmm and texto_completo_adicional:
+        afrmm_match = re.search(r'AFRMM.*?R\$?\s*([\d.,]+)', texto_completo_adicional, re.IGNORECASE | re.DOTALL)
+        if afrmm_match:
+            v_afrmm = float(afrmm_match.group(1).replace('.', '').replace(',', '.'))
+    valor_frete_nacional = 0.0
+    if buscar_frete and texto_completo_adicional:
+        frete_match = re.search(r'FRETE\s*NACIONAL.*?[R\$]?\s*([\d.,]+)', texto_completo_adicional, re.IGNORECASE | re.DOTALL)
+        if frete_match:
+            try: valor_frete_nacional = float(frete_match.group(1).replace('.', '').replace(',', '.'))
+            except (ValueError, TypeError): valor_frete_nacional = 0.0
+    nome_processo = 'N/A'
+    texto_limpo_adicional = texto_completo_adicional.replace("/", "").replace(".", "").replace("-", "")
+    match_ideal = re.search(r'([A-Z0-9]+(?:IMP|EXP)\d{3}\d{4})', texto_limpo_adicional, re.IGNORECASE)
+    if match_ideal:
+        nome_processo = match_ideal.group(1)
+    else:
+        match_processo = re.search(r'PROCESSO\s*:?\s*(.+)', texto_completo_adicional, re.IGNORECASE)
+        if match_processo:
+            texto_bruto = match_processo.group(1).strip()
+            year_match = re.search(r'(\d{4})', texto_bruto)
+            if year_match: nome_processo = texto_bruto[:year_match.end()].strip()
+            else: nome_processo = re.split(r'[.,;\s]{2,}|$', texto_bruto)[0].strip()
+        else:
+            for texto_item in textos_itens:
+                if texto_item:
+                    match_item = re.search(r'(?:PROCESSO|REGISTRO):\s*(.+)', texto_item, re.IGNORECASE)
+                    if match_item:
+                        texto_bruto_item = match_item.group(1).strip()
+                        year_match_item = re.search(r'(\d{4})', texto_bruto_item)
+                        if year_match_item: nome_processo = texto_bruto_item[:year_match_item.end()].strip()
+                        else: nome_processo = re.split(r'[.,;\s]{2,}|$', texto_bruto_item)[0].strip()
+                        break
+    valor_servico_trading = 'N/A'
+    if texto_completo_adicional:
+        match_trading = re.search(r'trading[^0-9]*([\d.,]+)', texto_completo_adicional.lower())
+        if match_trading: valor_servico_trading = match_trading.group(1).replace('.', '').replace(',', '.')
+    return v_afrmm, valor_frete_nacional, nome_processo, valor_servico_trading
+
+def _minerar_textos_atual(texto, textos_itens, buscar_afrmm, buscar_frete):
+    return core_logic._minerar_textos(texto, textos_itens, buscar_afrmm, buscar_frete, "bench.xml")
+
+def carregar_casos_texto(caminhos_extra=()):
+    """Textos das notas de test_assets (e de parte do corpus, se houver), como a extração os entrega, mais os sintéticos."""
+    casos = []
+    caminhos = [os.path.join(PASTA_ASSETS, n) for n in sorted(os.listdir(PASTA_ASSETS)) if n.lower().endswith('.xml')] + list(caminhos_extra)
+    for caminho in caminhos:
+        root_xml = etree.parse(caminho).getroot()
+        campos = core_logic._coletar_campos_arvore(root_xml, core_logic._get_namespace(root_xml))
+        if campos: casos.append((campos['infCpl'] or "", campos['infAdProd'], True, campos['tpNF'] != '1'))
+    return casos + _TEXTOS_SINTETICOS
+
+def medir_mineracao_texto(casos, repeticoes):
+    """Microssegundos por arquivo da mineração antiga e da atual (melhor de 5 rodadas). Falha se os resultados divergirem."""
+    for caso in casos:
+        antigo, atual = _minerar_textos_legado(*caso), _minerar_textos_atual(*caso)
+        if antigo != atual: raise AssertionError(f"Divergência em {caso[0][:60]!r}: {antigo} x {atual}")
+    def medir(funcao):
+        def rodada():
+            for caso in casos: funcao(*caso)
+        return min(timeit.repeat(rodada, number=repeticoes, repeat=5)) / (repeticoes * len(casos)) * 1e6
+    antes, depois = medir(_minerar_textos_legado), medir(_minerar_textos_atual)
+    return {"textos": len(casos), "legado_us_por_arquivo": round(antes, 2), "atual_us_por_arquivo": round(depois, 2), "ganho": round(antes / depois, 2)}
+
+# =============================================================================
+# --- Micro-benchmark da linha de planilha (21 colunas da Planilha Completa) ---
+# =============================================================================
+
+def _write_data_to_excel_legado(ws, row_index, data, headers):
+    """Cópia do escritor antes do EsquemaPlanilha: estilos e value_map recriados a cada célula."""
+    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    currency_format = 'R$ #,##0.00'
+    text_format = '@'
+    for col, header in enumerate(headers, 1):
+        value_map = {
+            'Arquivo': data.get('nome_arquivo'), 'Número da NF': data.get('numero_nf'), 'CFOP': data.get('cfop_nf'),
+            'Cliente': data.get('nome_cliente'), 'Data de Emissão': data.get('data_emissao'), 'Nome do Processo': data.get('nome_processo'),
+            'Valor Total dos Produtos': data.get('valor_total_produtos', 0.0), 'Valor Total': data.get('valor_total_nf', 0.0),
+            'Valor ICMS': data.get('impostos', {}).get('vICMS', 0.0), 'Valor IPI': data.get('impostos', {}).get('vIPI', 0.0),
+            'Valor PIS': data.get('impostos', {}).get('vPIS', 0.0), 'Valor COFINS': data.get('impostos', {}).get('vCOFINS', 0.0),
+            'Valor Serviço Trading': data.get('valor_servico_trading', 0.0), 'Valor II': data.get('vII', 0.0),
+            'Valor AFRMM': data.get('vAFRMM', 0.0), 'Outras Despesas': data.get('vOutras', 0.0), 'Status da NF': data.get('status_nf', 'N/A'),
+            'Sistema Emissor': data.get('sistema_emissor', 'N/A'), 'UF Destino': data.get('uf_destinatario'),
+            'CNPJ/CPF Dest.': data.get('cnpj_cpf_destinatario'), 'Razão Social Dest.': data.get('razao_social_destinatario'),
+            'Frete Nacional': data.get('valor_frete_nacional', 0.0)
+        }
+        value = value_map.get(header, '')
+        cell = ws.cell(row=row_index, column=col, value=value)
+        cell.border = border
+        if isinstance(value, (int, float)) and (header.startswith('Valor') or header in ['Outras Despesas', 'Valor AFRMM', 'Valor Serviço Trading', 'Frete Nacional']):
+            cell.number_format = currency_format
+        else:
+            cell.number_format = text_format
+
+def medir_linha_planilha(notas, repeticoes=5):
+    """Microssegundos por linha de CABECALHOS_COMPLETOS: escritor antigo, escritor com esquema e aba em streaming."""
+    if not notas: return {}
+    cabecalhos = core_logic.CABECALHOS_COMPLETOS
+    ws_antigo, ws_atual = Workbook().active, Workbook().active
+    for linha, nota in enumerate(notas[:50], 2):
+        _write_data_to_excel_legado(ws_antigo, linha, nota, cabecalhos); core_logic.write_data_to_excel(ws_atual, linha, nota, cabecalhos)
+        antigo = [(c.value, c.number_format, c.border.left.style) for c in ws_antigo[linha]]
+        atual = [(c.value, c.number_format, c.border.left.style) for c in ws_atual[linha]]
+        if antigo != atual: raise AssertionError(f"Linha {linha} difere entre o escritor antigo e o atual.")
+    def medir(escrever_em):
+        melhor = None
+        for _ in range(repeticoes):
+            escrever, finalizar = escrever_em()
+            inicio = time.perf_counter()
+            for linha, nota in enumerate(notas, 2): escrever(linha, nota)
+            duracao = time.perf_counter() - inicio
+            if finalizar: finalizar()
+            melhor = duracao if melhor is None else min(melhor, duracao)
+        return melhor / len(notas) * 1e6
+    def legado():
+        ws = Workbook().active
+        return (lambda linha, nota: _write_data_to_excel_legado(ws, linha, nota, cabecalhos)), None
+    def esquema():
+        ws = Workbook().active; compilado = core_logic.esquema_planilha(cabecalhos)
+        return (lambda linha, nota: core_logic.write_data_to_excel(ws, linha, nota, compilado)), None
+    def streaming():
+        planilha = core_logic.PlanilhaStreaming(); aba = planilha.criar_aba("Saída", cabecalhos)
+        # Grava em memória só para encerrar o arquivo temporário da aba.
+        return (lambda linha, nota: aba.escrever_nota(nota)), (lambda: planilha.save(io.BytesIO()))
+    antes, depois, fluxo = medir(legado), medir(esquema), medir(streaming)
+    return {"linhas": len(notas), "colunas": len(cabecalhos), "legado_us_por_linha": round(antes, 1), "esquema_us_por_linha": round(depois, 1),
+            "streaming_us_por_linha": round(fluxo, 1), "ganho": round(antes / depois, 2)}
+
+# =============================================================================
+# --- Relatório / histórico em JSON ---
+# =============================================================================
+
+def _comparar_com_anterior(historico, execucao):
+    """Procura a última execução com os mesmos parâmetros e imprime a variação de tempo por etapa."""
+    anteriores = [h for h in historico if h.get("parametros") == execucao["parametros"]]
+    if not anteriores: return
+    anterior = anteriores[-1]
+    print(f"\nComparação com {anterior.get('rotulo') or anterior['data']}:")
+    for nome, etapa in execucao["etapas"].items():
+        antes = anterior.get("etapas", {}).get(nome, {}).get("segundos")
+        if antes:
+            variacao = (etapa["segundos"] - antes) / antes * 100
+            print(f"  {nome:<16} {antes:>9.3f}s -> {etapa['segundos']:>9.3f}s  ({variacao:+.1f}%)")
+
+def salvar_json(caminho, execucao):
+    historico = []
+    if os.path.exists(caminho):
+        try:
+            with open(caminho, encoding="utf-8") as f: historico = json.load(f)
+        except (OSError, ValueError):
+            print(f"Aviso: '{caminho}' ilegível; um novo histórico será criado.")
+    _comparar_com_anterior(historico, execucao)
+    historico.append(execucao)
+    with open(caminho, "w", encoding="utf-8") as f: json.dump(historico, f, ensure_ascii=False, indent=2)
+    print(f"\nResultado acrescentado a {caminho} ({len(historico)} execução(ões)).")
+
+def imprimir_resumo(execucao):
+    parametros = execucao["parametros"]
+    if parametros.get("somente_texto"): print("\n=== Micro-benchmark da mineração de texto ===")
+    else: print(f"\n=== Benchmark de extração ({parametros['arquivos']} arquivos, motor {parametros['motor']}) ===")
+    for nome, etapa in execucao["etapas"].items():
+        if nome == "linha_planilha":
+            print(f"  {nome:<22} legado {etapa['legado_us_por_linha']:.1f} us/linha | esquema {etapa['esquema_us_por_linha']:.1f} us/linha | {etapa['ganho']:.2f}x"
+                  f" | streaming {etapa['streaming_us_por_linha']:.1f} us/linha")
+            continue
+        if nome == "mineracao_texto":
+            print(f"  {nome:<22} legado {etapa['legado_us_por_arquivo']:.1f} us/arq | atual {etapa['atual_us_por_arquivo']:.1f} us/arq | {etapa['ganho']:.2f}x")
+            continue
+        linha = f"  {nome:<22} {etapa['segundos']:>9.3f}s"
+        if etapa.get("arquivos_por_segundo"): linha += f" | {etapa['arquivos_por_segundo']:>9.1f} arq/s"
+        if etapa.get("ms_recalculo") is not None: linha += f" | recálculo {etapa['ms_recalculo']:.2f} ms"
+        if etapa.get("p95_ms") is not None: linha += f" | p50 {etapa['p50_ms']:.2f} ms p95 {etapa['p95_ms']:.2f} ms"
+        if etapa.get("pico_rss_mb") is not None: linha += f" | pico RSS {etapa['pico_rss_mb']} MB"
+        if etapa.get("pico_python_mb") is not None: linha += f" | pico Python {etapa['pico_python_mb']} MB"
+        print(linha)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de extração de NFe com corpus sintético.")
+    parser.add_argument("--arquivos", type=int, default=500, help="Quantidade de XMLs do corpus (notas + eventos).")
+    parser.add_argument("--itens", type=int, default=5, help="Quantidade média de <det> por nota.")
+    parser.add_argument("--sem-namespace", action="store_true", help="Gera os XMLs sem o namespace do Portal Fiscal.")
+    parser.add_argument("--eventos", type=float, default=0.05, help="Proporção de eventos de cancelamento no corpus.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--motor", choices=core_logic.MOTORES_EXTRACAO, default=core_logic.MOTOR_PADRAO)
+    parser.add_argument("--workers", type=int, default=1, help="Também mede extrair_lote com N processos (0 = todos os núcleos).")
+    parser.add_argument("--profundidade", type=int, default=source_logic.PROFUNDIDADE_LEITURA, help="Arquivos lidos à frente do parser (0 = sem leitura antecipada).")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Atraso simulado em cada abertura de XML (pasta de rede). Vale para as etapas em um processo.")
+    parser.add_argument("--pasta", help="Usa/gera o corpus nesta pasta (mantida ao final).")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede também o pico de memória alocada pelo Python em cada etapa (mais lento).")
+    parser.add_argument("--excel-legado", action="store_true", help="Mede também a planilha montada no Workbook comum (antes do modo streaming).")
+    parser.add_argument("--repeticoes", type=int, default=2000, help="Repetições do micro-benchmark de texto.")
+    parser.add_argument("--somente-texto", action="store_true", help="Roda só o micro-benchmark da mineração de texto.")
+    parser.add_argument("--json", help="Arquivo JSON onde o resultado é acrescentado.")
+    parser.add_argument("--rotulo", default="", help="Identificação livre da execução (ex.: versão, branch).")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    parametros = {"arquivos": args.arquivos, "itens": args.itens, "namespace": not args.sem_namespace, "eventos": args.eventos,
+                  "semente": args.semente, "motor": args.motor, "workers": args.workers, "tracemalloc": args.tracemalloc,
+                  "profundidade": args.profundidade, "latencia_ms": args.latencia_ms}
+    if args.somente_texto:
+        parametros = {"somente_texto": True, "repeticoes": args.repeticoes}
+    execucao = {"data": datetime.now().isoformat(timespec="seconds"), "rotulo": args.rotulo, "versao_extrator": core_logic.VERSAO_EXTRATOR,
+                "python": platform.python_version(), "plataforma": platform.platform(), "parametros": parametros, "etapas": {}}
+
+    if args.somente_texto:
+        execucao["etapas"]["mineracao_texto"] = medir_mineracao_texto(carregar_casos_texto(), args.repeticoes)
+    else:
+        pasta = args.pasta or tempfile.mkdtemp(prefix="bench_nfe_")
+        try:
+            inicio = time.perf_counter()
+            caminhos = gerar_corpus(pasta, args.arquivos, args.itens, not args.sem_namespace, args.eventos, args.semente)
+            print(f"Corpus: {len(caminhos)} arquivos em {pasta} ({time.perf_counter() - inicio:.1f}s para gerar)")
+            simular_latencia(args.latencia_ms / 1000)
+            execucao["etapas"] = executar_pipeline(caminhos, pasta, args.motor, args.workers, args.tracemalloc, args.excel_legado, args.profundidade)
+            execucao["etapas"]["mineracao_texto"] = medir_mineracao_texto(carregar_casos_texto(caminhos[:50]), max(1, args.repeticoes // 10))
+        finally:
+            if not args.pasta: shutil.rmtree(pasta, ignore_errors=True)
+
+    imprimir_resumo(execucao)
+    if args.json: salvar_json(args.json, execucao)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
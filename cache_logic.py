@@ -0,0 +1,139 @@
+# =============================================================================
+# --- ARQUIVO: cache_logic.py ---
+# (Cache persistente das extrações de XML, em SQLite)
+# =============================================================================
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+
+import source_logic
+
+CACHE_FILENAME = "extracao_cache.db"
+_LIMITE_PARAMETROS_SQL = 900  # O SQLite limita a quantidade de '?' por consulta.
+
+# --- Caminho do banco; definido pelo main.py com a pasta de log/config ---
+_cache_path = None
+
+def set_cache_dir(diretorio):
+    """
+    Recebe do main.py a pasta onde o cache deve ser gravado e prepara o banco.
+    Sem essa chamada o cache fica desativado e todas as funções viram no-op.
+    """
+    global _cache_path
+    _cache_path = os.path.join(diretorio, CACHE_FILENAME) if diretorio else None
+    if not _cache_path: return
+    try:
+        with _conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extracoes (
+                    caminho TEXT PRIMARY KEY, tamanho INTEGER, mtime_ns INTEGER,
+                    hash TEXT, versao TEXT, dados TEXT
+                )""")
+    except sqlite3.Error as e:
+        logging.error(f"Não foi possível preparar o cache de extração em {_cache_path}: {e}")
+        _cache_path = None
+
+def cache_ativo():
+    return _cache_path is not None
+
+@contextmanager
+def _conectar():
+    conn = sqlite3.connect(_cache_path, timeout=10)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn: yield conn
+    finally:
+        conn.close()
+
+def hash_conteudo(conteudo):
+    """Hash do conteúdo já lido pelo extrator (bytes ou mmap); o mesmo de _hash_arquivo sobre o arquivo."""
+    return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+def _hash_arquivo(caminho):
+    h = hashlib.blake2b(digest_size=16)
+    with source_logic.abrir(caminho) as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _blocos(itens, tamanho=_LIMITE_PARAMETROS_SQL):
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+def buscar_lote(caminhos, versao):
+    """
+    Retorna {caminho: dados} para os arquivos cujo resultado em cache ainda é válido.
+    Tamanho + mtime iguais bastam; se só o mtime mudou, o hash do conteúdo decide
+    (arquivos recopiados ou sincronizados pelo OneDrive não são reprocessados).
+    """
+    if not _cache_path or not caminhos: return {}
+    encontrados = {}
+    try:
+        with _conectar() as conn:
+            revalidados = []
+            for bloco in _blocos(list(caminhos)):
+                marcadores = ",".join("?" * len(bloco))
+                linhas = conn.execute(f"SELECT caminho, tamanho, mtime_ns, hash, dados FROM extracoes WHERE versao = ? AND caminho IN ({marcadores})", [versao, *bloco]).fetchall()
+                for caminho, tamanho, mtime_ns, hash_salvo, dados in linhas:
+                    try:
+                        tamanho_atual, mtime_atual = source_logic.estado(caminho)
+                    except OSError:
+                        continue
+                    if tamanho_atual != tamanho: continue
+                    if mtime_atual != mtime_ns:
+                        if _hash_arquivo(caminho) != hash_salvo: continue
+                        revalidados.append((mtime_atual, caminho))
+                    encontrados[caminho] = json.loads(dados)
+            if revalidados:
+                conn.executemany("UPDATE extracoes SET mtime_ns = ? WHERE caminho = ?", revalidados)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        logging.error(f"Erro ao consultar o cache de extração: {e}")
+        return {}
+    return encontrados
+
+def salvar_lote(itens, versao):
+    """
+    Grava [(caminho, dados, (tamanho, mtime_ns, hash))] no cache. 'dados' precisa ser serializável em JSON; a
+    assinatura vem da mesma leitura que gerou 'dados' (estado tomado antes dela, hash_conteudo dos bytes). O
+    estado não é consultado de novo aqui: um arquivo regravado depois da leitura ficaria com os dados antigos.
+    Itens sem assinatura (leitura antecipada falhou) não são gravados.
+    """
+    if not _cache_path or not itens: return
+    linhas = []
+    for caminho, dados, assinatura in itens:
+        if assinatura is None: continue
+        try:
+            tamanho, mtime_ns, hash_lido = assinatura
+            linhas.append((caminho, tamanho, mtime_ns, hash_lido, versao, json.dumps(dados, ensure_ascii=False)))
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Arquivo não gravado no cache de extração ({os.path.basename(caminho)}): {e}")
+    try:
+        with _conectar() as conn:
+            conn.executemany("INSERT OR REPLACE INTO extracoes (caminho, tamanho, mtime_ns, hash, versao, dados) VALUES (?, ?, ?, ?, ?, ?)", linhas)
+    except sqlite3.Error as e:
+        logging.error(f"Erro ao gravar no cache de extração: {e}")
+
+def remover_versoes_antigas(versao):
+    """Descarta as entradas geradas por outras versões das regras de extração."""
+    if not _cache_path: return 0
+    try:
+        with _conectar() as conn:
+            return conn.execute("DELETE FROM extracoes WHERE versao <> ?", (versao,)).rowcount
+    except sqlite3.Error as e:
+        logging.error(f"Erro ao limpar o cache de extração: {e}")
+        return 0
+
+def limpar_cache():
+    """Apaga todas as entradas do cache. Retorna (sucesso, mensagem)."""
+    if not _cache_path: return False, "O cache de extração não está ativo."
+    try:
+        with _conectar() as conn:
+            removidos = conn.execute("DELETE FROM extracoes").rowcount
+        return True, f"Cache de extração limpo ({removidos} arquivo(s) removido(s))."
+    except sqlite3.Error as e:
+        return False, f"Erro ao limpar o cache de extração: {e}"
@@ -0,0 +1,191 @@
+# =============================================================================
+# --- ARQUIVO: columnar_logic.py ---
+# (Tabela em colunas (pandas) com as notas extraídas: totais do dashboard e
+#  contagens por processo calculados com group-by, sem percorrer as notas;
+#  e o snapshot do lote em Parquet/Arrow para recarregar sem ler os XMLs)
+# =============================================================================
+
+import os
+import json
+from collections import defaultdict
+from datetime import datetime
+from itertools import repeat
+
+import pandas as pd
+
+import core_logic
+
+# --- Snapshot em Parquet/Arrow (opcional: depende do pyarrow) ---
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+IMPOSTOS_DASHBOARD = ('vICMS', 'vIPI', 'vPIS', 'vCOFINS')
+COLUNAS_VALORES = ('valor_total_nf', 'valor_total_produtos') + IMPOSTOS_DASHBOARD
+
+def _linhas_colunares(notas):
+    """Converte as notas em {coluna: lista}, uma passada por coluna (acesso direto aos campos da NotaFiscal)."""
+    notas = list(notas)
+    impostos = [nf.get('impostos') or {} for nf in notas]
+    colunas = {
+        # Igual a core_logic.calcular_dados_dashboard: tudo que não é 'Entrada' conta como 'Saída'.
+        'entrada': [nf.get('tipo_nota', 'Saída') == 'Entrada' for nf in notas],
+        'cancelada': ['Cancelada' in nf.get('status_nf', '') for nf in notas],
+        'processo': [nf.get('processo_normalizado', 'N/A') for nf in notas],
+        'valor_total_nf': [nf.get('valor_total_nf', 0.0) for nf in notas],
+        'valor_total_produtos': [nf.get('valor_total_produtos', 0.0) for nf in notas],
+        'valor_servico_trading': [nf.get('valor_servico_trading', 0.0) for nf in notas],
+    }
+    for imp in IMPOSTOS_DASHBOARD: colunas[imp] = [imp_nf.get(imp, 0.0) for imp_nf in impostos]
+    return colunas
+
+class TabelaNotas:
+    """
+    Guarda as notas em memória também em formato de colunas, indexadas por uma chave (o caminho
+    do arquivo). Inclusões, remoções e edições ficam pendentes e são consolidadas de uma vez só na
+    próxima consulta, então o monitoramento da pasta e as edições da pré-visualização não
+    reconstroem a tabela inteira.
+    """
+    def __init__(self, pares=()):
+        self._notas = {}; self._chave_por_id = {}
+        self._pendentes = {}; self._removidas = set()
+        self._df = pd.DataFrame(_linhas_colunares([]), index=pd.Index([], dtype=object))
+        for chave, nota in pares: self.adicionar(chave, nota)
+
+    def __len__(self): return len(self._notas)
+
+    def adicionar(self, chave, nota):
+        if chave in self._notas: self.remover(chave)
+        self._notas[chave] = nota; self._chave_por_id[id(nota)] = chave
+        self._pendentes[chave] = nota
+
+    def remover(self, chave):
+        nota = self._notas.pop(chave, None)
+        if nota is None: return
+        self._chave_por_id.pop(id(nota), None); self._pendentes.pop(chave, None)
+        self._removidas.add(chave)
+
+    def atualizar(self, notas):
+        """Marca notas editadas no próprio objeto (ex.: na pré-visualização) para terem a linha refeita."""
+        for nota in notas:
+            chave = self._chave_por_id.get(id(nota))
+            if chave is not None: self._pendentes[chave] = nota
+
+    @property
+    def df(self):
+        """DataFrame consolidado (uma linha por nota)."""
+        if self._pendentes or self._removidas:
+            df = self._df
+            if self._removidas: df = df.drop(index=df.index.intersection(list(self._removidas)))
+            if self._pendentes:
+                linhas = pd.DataFrame(_linhas_colunares(self._pendentes.values()), index=pd.Index(list(self._pendentes), dtype=object))
+                existentes = linhas.index.isin(df.index)
+                # Notas editadas são sobrescritas no lugar; só as novas entram no fim da tabela.
+                if existentes.any(): df.loc[linhas.index[existentes]] = linhas[existentes]
+                if not existentes.all(): df = pd.concat([df, linhas[~existentes]]) if len(df) else linhas[~existentes]
+            self._df = df; self._pendentes = {}; self._removidas = set()
+        return self._df
+
+    def _ativas(self):
+        df = self.df
+        return df[~df['cancelada'].astype(bool)]
+
+    def contagem_saida_por_processo(self):
+        """{processo: nº de notas de Saída não canceladas}, na ordem em que os processos aparecem."""
+        ativas = self._ativas()
+        saida = ativas[~ativas['entrada'].astype(bool)]
+        return {p: int(c) for p, c in saida.groupby('processo', sort=False).size().items()}
+
+    def resumo_dashboard(self):
+        """Retorna o mesmo formato de core_logic.calcular_dados_dashboard()."""
+        df = self.df
+        if not len(df): return {'resumo_geral': {}, 'processos_pendentes': {}}
+        ativas = self._ativas()
+        entrada = ativas['entrada'].astype(bool)
+        somas = ativas.groupby(entrada)[list(COLUNAS_VALORES)].sum()
+        notas = entrada.value_counts()
+        def soma(eh_entrada, coluna): return float(somas.at[eh_entrada, coluna]) if eh_entrada in somas.index else 0.0
+        validos = ativas['processo'].notna() & (ativas['processo'] != '') & (ativas['processo'] != 'N/A')
+        saida_por_processo = ativas[validos & ~entrada].groupby('processo', sort=False).size()
+        resumo = {
+            'total_notas': len(df), 'notas_entrada': int(notas.get(True, 0)), 'notas_saida': int(notas.get(False, 0)),
+            'notas_canceladas': len(df) - len(ativas),
+            'valor_total_entrada': soma(True, 'valor_total_nf'), 'valor_total_saida': soma(False, 'valor_total_nf'),
+            'valor_total_produtos': float(ativas['valor_total_produtos'].sum()),
+            'impostos': {tipo: defaultdict(float, {imp: soma(eh_entrada, imp) for imp in IMPOSTOS_DASHBOARD}) for tipo, eh_entrada in (('Entrada', True), ('Saída', False))},
+            'processos_unicos': set(ativas.loc[validos, 'processo'].unique())
+        }
+        processos_pendentes = {p: int(c) for p, c in saida_por_processo.items() if c > 1}
+        return {'resumo_geral': resumo, 'processos_pendentes': processos_pendentes}
+
+# =============================================================================
+# --- Snapshot do lote extraído (Parquet ou Arrow IPC) ---
+# Uma linha por nota: 'caminho' do XML, os campos de CAMPOS_NOTA e um 'imposto_<tag>' por tag do
+# ICMSTot (0.0 quando a nota não tem a tag). Os metadados guardam a versão do extrator que gerou os dados.
+# =============================================================================
+
+VERSAO_SNAPSHOT = "1"
+PREFIXO_IMPOSTO = 'imposto_'
+_CHAVE_METADADOS = b'fiscalflow'
+# Extensões aceitas; qualquer outra é gravada como Parquet.
+FORMATOS_SNAPSHOT = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+def _formato_snapshot(caminho):
+    return FORMATOS_SNAPSHOT.get(os.path.splitext(caminho)[1].lower(), 'parquet')
+
+def _exigir_pyarrow():
+    if not PYARROW_AVAILABLE: raise RuntimeError("A biblioteca 'pyarrow' não está instalada. Instale com: pip install pyarrow")
+
+def snapshot_para_tabela(pares):
+    """Monta a tabela Arrow de [(caminho do XML, nota)]."""
+    _exigir_pyarrow()
+    pares = list(pares)
+    notas = [nota for _, nota in pares]
+    colunas = {'caminho': [caminho for caminho, _ in pares]}
+    for campo in core_logic.CAMPOS_NOTA:
+        if campo != 'impostos': colunas[campo] = [nota.get(campo) for nota in notas]
+    tags = sorted({tag for nota in notas for tag in (nota.get('impostos') or {})})
+    for tag in tags: colunas[PREFIXO_IMPOSTO + tag] = pa.array([float((nota.get('impostos') or {}).get(tag, 0.0)) for nota in notas], type=pa.float64())
+    metadados = {'versao_snapshot': VERSAO_SNAPSHOT, 'versao_extrator': core_logic.VERSAO_EXTRATOR,
+                 'gerado_em': datetime.now().isoformat(timespec='seconds'), 'notas': len(notas)}
+    return pa.table(colunas).replace_schema_metadata({_CHAVE_METADADOS: json.dumps(metadados).encode('utf-8')})
+
+def exportar_snapshot(pares, caminho):
+    """Grava o lote em Parquet (ou Arrow IPC, se a extensão for .arrow/.feather). Retorna o nº de notas gravadas."""
+    tabela = snapshot_para_tabela(pares)
+    if _formato_snapshot(caminho) == 'arrow': feather.write_feather(tabela, caminho)
+    else: pq.write_table(tabela, caminho)
+    return tabela.num_rows
+
+def ler_metadados_snapshot(caminho):
+    """Metadados gravados por exportar_snapshot(), sem carregar os dados."""
+    _exigir_pyarrow()
+    if _formato_snapshot(caminho) == 'arrow':
+        with pa.memory_map(caminho) as origem: esquema = pa.ipc.open_file(origem).schema
+    else: esquema = pq.read_schema(caminho)
+    bruto = (esquema.metadata or {}).get(_CHAVE_METADADOS)
+    if bruto is None: raise ValueError("O arquivo não é um snapshot de notas gerado pelo sistema.")
+    return json.loads(bruto)
+
+def importar_snapshot(caminho):
+    """Lê um snapshot e devolve [(caminho do XML, NotaFiscal)], na ordem em que foi gravado."""
+    _exigir_pyarrow()
+    tabela = feather.read_table(caminho) if _formato_snapshot(caminho) == 'arrow' else pq.read_table(caminho)
+    if _CHAVE_METADADOS not in (tabela.schema.metadata or {}): raise ValueError("O arquivo não é um snapshot de notas gerado pelo sistema.")
+    colunas = {nome: tabela.column(nome).to_pylist() for nome in tabela.column_names}
+    caminhos = colunas.pop('caminho')
+    impostos = [(nome[len(PREFIXO_IMPOSTO):], colunas.pop(nome)) for nome in list(colunas) if nome.startswith(PREFIXO_IMPOSTO)]
+    # Colunas que não existem mais em CAMPOS_NOTA são ignoradas; as que faltam ficam com o padrão da NotaFiscal.
+    nomes = [campo for campo in core_logic.CAMPOS_NOTA if campo in colunas]
+    tags = [tag for tag, _ in impostos]
+    pares = []
+    linhas_impostos = zip(*(valores for _, valores in impostos)) if impostos else repeat(())
+    for caminho_xml, linha, valores_impostos in zip(caminhos, zip(*(colunas[campo] for campo in nomes)), linhas_impostos):
+        nota = core_logic.NotaFiscal(**dict(zip(nomes, linha)))
+        nota.impostos = {tag: valor for tag, valor in zip(tags, valores_impostos) if valor}
+        pares.append((caminho_xml, nota))
+    return pares
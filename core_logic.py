@@ -3,21 +3,170 @@
 # (Correção 6: Aplicada a lógica de busca por ano '\d{4}' no fallback)
 # (Correções 1 e 2 do Excel mantidas)
 # =============================================================================
+import io
 import os
 import re
+import time
 import logging
+import tempfile
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from lxml import etree
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.cell import WriteOnlyCell
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 import requests
+import cache_logic
+import source_logic
+
+# Versão das regras de extração. Incremente sempre que a lógica de _extrair_dados_* mudar,
+# para que o cache persistente descarte os resultados antigos.
+VERSAO_EXTRATOR = "8"
+
+# Abaixo deste número de arquivos o custo de subir o pool de processos não compensa.
+LIMITE_LOTE_SEQUENCIAL = 64
+
+# Motores de leitura do XML: 'arvore' monta a árvore inteira (etree.parse);
+# 'stream' lê em uma passada com iterparse, liberando os elementos pelo caminho.
+MOTORES_EXTRACAO = ('arvore', 'stream')
+MOTOR_PADRAO = 'arvore'
+
+# --- Registro das expressões regulares da extração ---
+# Compiladas uma vez na carga do módulo (e em cada processo do pool), nunca por arquivo.
+_PADROES = {
+    'namespace': re.compile(r'\{(.*?)\}'),
+    'letra': re.compile(r'[a-zA-Z]'),
+    'dominio_email': re.compile(r'@([\w.-]+)'),
+    'chave_acesso': re.compile(r'(\d{44})'),
+    # Palavras-chave do infCpl, todas localizadas numa só varredura (ver _minerar_textos).
+    # O lookahead com as iniciais deixa o re pular direto para os candidatos.
+    'palavras_chave': re.compile(r'(?=[AFPTafpt])(?:(?P<afrmm>AFRMM)|(?P<frete>FRETE\s*NACIONAL)|(?P<processo>PROCESSO)|(?P<trading>(?-i:[Tt][Rr][Aa][Dd][Ii][Nn][Gg])))', re.IGNORECASE),
+    'afrmm': re.compile(r'AFRMM.*?R\$?\s*([\d.,]+)', re.IGNORECASE | re.DOTALL),
+    'frete': re.compile(r'FRETE\s*NACIONAL.*?[R\$]?\s*([\d.,]+)', re.IGNORECASE | re.DOTALL),
+    # 'trading' era buscado em texto.lower(): só as letras ASCII valem (sem o 'İ'/'ı' que o IGNORECASE aceitaria).
+    'trading': re.compile(r'[Tt][Rr][Aa][Dd][Ii][Nn][Gg][^0-9]*([\d.,]+)'),
+    'processo': re.compile(r'PROCESSO\s*:?\s*(.+)', re.IGNORECASE),
+    'processo_item': re.compile(r'(?:PROCESSO|REGISTRO):\s*(.+)', re.IGNORECASE),
+    # Padrão ideal do processo: ([A-Z0-9]+(?:IMP|EXP)\d{3}\d{4}), resolvido a partir da âncora (ver _buscar_processo_ideal).
+    'ancora_processo': re.compile(r'(?:IMP|EXP)\d{3}\d{4}', re.IGNORECASE),
+    'caractere_processo': re.compile(r'[A-Z0-9]', re.IGNORECASE),
+    'trecho_processo': re.compile(r'[A-Z0-9]+', re.IGNORECASE),
+    'ano': re.compile(r'(\d{4})'),
+    'fim_processo': re.compile(r'[.,;\s]{2,}|$'),
+}
+
+# --- Registro de nota extraída ---
+# Valores padrão de cada campo; 'impostos' é {tag do ICMSTot: valor} e começa vazio.
+_PADROES_NOTA = {
+    'nome_arquivo': 'N/A', 'numero_nf': 'N/A', 'cfop_nf': 'N/A', 'data_emissao': 'N/A', 'nome_cliente': 'N/A',
+    'valor_total_nf': 0.0, 'valor_total_produtos': 0.0, 'valor_servico_trading': 0.0, 'tipo_nota': 'N/A',
+    'nome_processo': 'N/A', 'vII': 0.0, 'vAFRMM': 0.0, 'vOutras': 0.0, 'status_nf': 'N/A', 'sistema_emissor': 'N/A',
+    'uf_destinatario': 'N/A', 'cnpj_cpf_destinatario': 'N/A', 'razao_social_destinatario': 'N/A',
+    'processo_normalizado': 'N/A', 'valor_frete_nacional': 0.0, 'impostos': None, 'chave_acesso': 'N/A',
+}
+CAMPOS_NOTA = tuple(_PADROES_NOTA)
+_CAMPOS_NOTA_SET = frozenset(CAMPOS_NOTA)
+
+class NotaFiscal:
+    """
+    Uma nota extraída. Os campos ficam em __slots__ (sem dicionário por instância) e os impostos do
+    ICMSTot são guardados como float, só os diferentes de zero. Também se comporta como dicionário
+    (nota['numero_nf'], nota.get(...), 'campo' in nota, keys/items) para quem já consumia os dados assim.
+    Os valores originais só são copiados na primeira edição (copy-on-write); reverter() os restaura.
+    Chaves fora de CAMPOS_NOTA (anotações da tela, como 'qtde_encontrada') vão para um dicionário à parte.
+    """
+    __slots__ = CAMPOS_NOTA + ('_originais', '_extras')
+
+    def __init__(self, **campos):
+        for campo in CAMPOS_NOTA:
+            setattr(self, campo, campos.pop(campo, _PADROES_NOTA[campo]))
+        if self.impostos is None: self.impostos = {}
+        self._originais = None
+        self._extras = campos or None
+
+    @classmethod
+    def de_dict(cls, dados):
+        return cls(**dados)
+
+    def como_dict(self):
+        """Só os campos da nota, em tipos simples (serializável em JSON)."""
+        dados = {campo: getattr(self, campo) for campo in CAMPOS_NOTA}
+        dados['impostos'] = dict(self.impostos)
+        return dados
+
+    # --- Edição com cópia dos originais sob demanda ---
+    @property
+    def editada(self):
+        return self._originais is not None
+
+    def editar(self, **valores):
+        for campo, valor in valores.items(): self[campo] = valor
+
+    def reverter(self):
+        """Desfaz todas as edições. Retorna False se a nota nunca foi editada."""
+        if self._originais is None: return False
+        for campo, valor in zip(CAMPOS_NOTA, self._originais): setattr(self, campo, valor)
+        self._originais = None
+        return True
+
+    def _guardar_originais(self):
+        if self._originais is None:
+            self._originais = tuple(dict(self.impostos) if campo == 'impostos' else getattr(self, campo) for campo in CAMPOS_NOTA)
+
+    # --- Interface de dicionário ---
+    def __getitem__(self, chave):
+        if chave in _CAMPOS_NOTA_SET: return getattr(self, chave)
+        if self._extras is not None and chave in self._extras: return self._extras[chave]
+        raise KeyError(chave)
+
+    def __setitem__(self, chave, valor):
+        if chave in _CAMPOS_NOTA_SET:
+            self._guardar_originais()
+            setattr(self, chave, valor)
+        else:
+            if self._extras is None: self._extras = {}
+            self._extras[chave] = valor
+
+    def get(self, chave, padrao=None):
+        try: return self[chave]
+        except KeyError: return padrao
+
+    def __contains__(self, chave):
+        return chave in _CAMPOS_NOTA_SET or (self._extras is not None and chave in self._extras)
+
+    def keys(self):
+        return list(CAMPOS_NOTA) + (list(self._extras) if self._extras else [])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(CAMPOS_NOTA) + (len(self._extras) if self._extras else 0)
+
+    def items(self):
+        return [(chave, self[chave]) for chave in self.keys()]
+
+    def values(self):
+        return [self[chave] for chave in self.keys()]
+
+    def copy(self):
+        return NotaFiscal(**self.como_dict())
+
+    def __eq__(self, outra):
+        if not isinstance(outra, NotaFiscal): return NotImplemented
+        return all(getattr(self, campo) == getattr(outra, campo) for campo in CAMPOS_NOTA)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"NotaFiscal({self.nome_arquivo!r}, numero_nf={self.numero_nf!r}, tipo_nota={self.tipo_nota!r}, status_nf={self.status_nf!r})"
 
 def _get_namespace(root_xml):
     """Extrai o namespace do elemento raiz do XML."""
     if not hasattr(root_xml, 'tag') or not isinstance(root_xml.tag, str):
         return ''
-    namespace_match = re.search(r'\{(.*?)\}', root_xml.tag)
+    namespace_match = _PADROES['namespace'].search(root_xml.tag)
     return namespace_match.group(1) if namespace_match else ''
 
 def _normalize_processo(text):
@@ -31,7 +180,7 @@ def _normalize_processo(text):
     clean_text = text.upper().replace("PROCESSO", "").replace(":", "").replace(".", "").replace("/", "").replace("-", "").replace(" ", "")
     return clean_text if clean_text else 'N/A'
 
-def gerar_diagnostico_processos(dados_extraidos, caminho_saida):
+def gerar_diagnostico_processos(dados_extraidos, caminho_saida, progress_callback=None):
     """Gera um arquivo de texto para diagnosticar problemas de vínculo de processo."""
     try:
         with open(caminho_saida, 'w', encoding='utf-8') as f:
@@ -40,7 +189,9 @@ def gerar_diagnostico_processos(dados_extraidos, caminho_saida):
             
             dados_ordenados = sorted(dados_extraidos, key=lambda x: (x.get('processo_normalizado', ''), x.get('tipo_nota', '')))
 
-            for dados in dados_ordenados:
+            total = len(dados_ordenados)
+            for indice, dados in enumerate(dados_ordenados, 1):
+                if progress_callback and indice % INTERVALO_PROGRESSO_PLANILHA == 0: progress_callback(indice, total)
                 linha = (
                     f"Arquivo: {dados.get('nome_arquivo', 'N/A'):<50} | "
                     f"Tipo: {dados.get('tipo_nota', 'N/A'):<7} | "
@@ -48,230 +199,375 @@ def gerar_diagnostico_processos(dados_extraidos, caminho_saida):
                     f"Processo Normalizado: \"{dados.get('processo_normalizado', 'N/A')}\"\n"
                 )
                 f.write(linha)
+        if progress_callback: progress_callback(total, total)
         return True, "Diagnóstico gerado com sucesso."
     except Exception as e:
         return False, f"Erro ao gerar diagnóstico: {e}"
 
-def _extrair_dados_autorizada(root_xml, namespace, arquivo_xml):
-    def find(element, tag):
-        if namespace: return element.find(f'{{{namespace}}}{tag}')
-        return element.find(tag)
-    def find_all(element, tag):
-        if namespace: return element.findall(f'{{{namespace}}}{tag}')
-        return element.findall(tag)
-
-    nfe_element = find(root_xml, 'NFe')
-    if nfe_element is None: nfe_element = root_xml
-    inf_nfe_tag = find(nfe_element, 'infNFe')
-    if inf_nfe_tag is None: return None
-    ide_tag = find(inf_nfe_tag, 'ide')
-    if ide_tag is None: return None
-    
+def _float_ou_zero(texto):
+    return float(texto) if texto else 0.0
+
+# --- Tabela de campos da NFe autorizada ---
+# (campo, caminho, conversor, padrão). O caminho é relativo ao <infNFe> (ou à raiz do arquivo, se começar
+# com '/') e segue sempre a primeira ocorrência de cada tag. O conversor recebe o texto da tag quando ela
+# existe (None = texto bruto); sem a tag vale o padrão. Para um campo novo, basta uma linha aqui.
+CAMPOS_NFE = (
+    ('verProc', 'ide/verProc', None, None),
+    ('nNF', 'ide/nNF', None, 'N/A'),
+    ('dhEmi', 'ide/dhEmi', None, 'N/A'),
+    ('tpNF', 'ide/tpNF', None, '1'),
+    ('email_resp_tec', 'infRespTec/email', None, None),
+    ('dest_xNome', 'dest/xNome', None, None),
+    ('dest_CNPJ', 'dest/CNPJ', None, None),
+    ('dest_CPF', 'dest/CPF', None, None),
+    ('dest_UF', 'dest/enderDest/UF', None, None),
+    ('CFOP', 'det/prod/CFOP', None, 'N/A'),
+    ('vNF', 'total/ICMSTot/vNF', float, 0.0),
+    ('vProd', 'total/ICMSTot/vProd', float, 0.0),
+    ('vII', 'total/ICMSTot/vII', _float_ou_zero, 0.0),
+    ('vOutro', 'total/ICMSTot/vOutro', _float_ou_zero, 0.0),
+    ('infCpl', 'infAdic/infCpl', None, None),
+    ('cStat', '/protNFe/infProt/cStat', None, None),
+    ('chNFe', '/protNFe/infProt/chNFe', None, None),
+)
+
+# Campos lidos em cada <det>: vira a lista dos textos não vazios, na ordem dos itens.
+CAMPOS_ITEM_NFE = (
+    ('vAFRMM', 'prod/DI/vAFRMM'),
+    ('infAdProd', 'infAdProd'),
+)
+
+# Grupo cujas tags 'v*' viram o dicionário de impostos.
+GRUPO_IMPOSTOS_NFE = 'total/ICMSTot'
+
+_tabelas_compiladas = {}
+
+def _xpath_primeiros(caminho, prefixo):
+    return '/'.join(f'{prefixo}{tag}[1]' for tag in caminho.strip('/').split('/'))
+
+def _compilar_tabela(namespace):
+    """Compila (uma vez por namespace) a tabela de campos em objetos etree.XPath reaproveitados entre arquivos."""
+    tabela = _tabelas_compiladas.get(namespace)
+    if tabela is not None: return tabela
+    prefixo, nsmap = ('n:', {'n': namespace}) if namespace else ('', None)
+    def xpath(expressao): return etree.XPath(expressao, namespaces=nsmap)
+    tabela = {
+        'nfe': xpath(_xpath_primeiros('NFe', prefixo)),
+        'inf_nfe': xpath(_xpath_primeiros('infNFe', prefixo)),
+        'ide': xpath(_xpath_primeiros('ide', prefixo)),
+        'campos': [(campo, caminho.startswith('/'), xpath(_xpath_primeiros(caminho, prefixo)), conversor, padrao)
+                   for campo, caminho, conversor, padrao in CAMPOS_NFE],
+        'itens': [(campo, xpath(f'{prefixo}det/' + _xpath_primeiros(caminho, prefixo))) for campo, caminho in CAMPOS_ITEM_NFE],
+        'impostos': xpath(_xpath_primeiros(GRUPO_IMPOSTOS_NFE, prefixo) + '/*'),
+    }
+    _tabelas_compiladas[namespace] = tabela
+    return tabela
+
+def _converter_campo(texto, conversor):
+    return conversor(texto) if conversor else texto
+
+def _coletar_campos_arvore(root_xml, namespace):
+    """
+    Lê da árvore já montada os valores que _montar_dados_autorizada precisa, seguindo CAMPOS_NFE.
+    Retorna None quando o XML não tem infNFe/ide.
+    """
+    tabela = _compilar_tabela(namespace)
+    nfe_element = tabela['nfe'](root_xml)
+    inf_nfe = tabela['inf_nfe'](nfe_element[0] if nfe_element else root_xml)
+    if not inf_nfe or not tabela['ide'](inf_nfe[0]): return None
+    inf_nfe_tag = inf_nfe[0]
+
+    campos = {}
+    for campo, da_raiz, xpath, conversor, padrao in tabela['campos']:
+        encontrados = xpath(root_xml if da_raiz else inf_nfe_tag)
+        campos[campo] = _converter_campo(encontrados[0].text, conversor) if encontrados else padrao
+    for campo, xpath in tabela['itens']:
+        campos[campo] = [tag.text for tag in xpath(inf_nfe_tag) if tag.text]
+    campos['impostos'] = [(tag.tag.split('}')[-1], tag.text) for tag in tabela['impostos'](inf_nfe_tag)]
+    campos['Id'] = inf_nfe_tag.get('Id')
+    return campos
+
+# Mesma tabela, indexada pelo caminho em tuplas, para o leitor em streaming.
+_CAMPOS_STREAM = {tuple(caminho.strip('/').split('/')): (campo, conversor) for campo, caminho, conversor, _ in CAMPOS_NFE if not caminho.startswith('/')}
+_CAMPOS_STREAM_RAIZ = {tuple(caminho.strip('/').split('/')): (campo, conversor) for campo, caminho, conversor, _ in CAMPOS_NFE if caminho.startswith('/')}
+_ITENS_STREAM = {tuple(caminho.split('/')): campo for campo, caminho in CAMPOS_ITEM_NFE}
+_GRUPO_IMPOSTOS_STREAM = tuple(GRUPO_IMPOSTOS_NFE.split('/'))
+
+class _NaoENFe(Exception):
+    """Sinaliza que a raiz do XML não é nfeProc/NFe e a leitura deve seguir pelo caminho da árvore."""
+
+def _coletar_campos_stream(arquivo_xml):
+    """
+    Mesmo resultado de _coletar_campos_arvore, mas lendo o XML com iterparse numa única passada
+    e descartando cada elemento assim que ele é lido (notas de importação com centenas de itens
+    não chegam a existir inteiras na memória). Levanta _NaoENFe se a raiz não for de NFe.
+    'arquivo_xml' pode ser um caminho ou um arquivo já aberto (ex.: um membro de .zip).
+    """
+    # Dois "baldes": campos sob <NFe><infNFe> e campos sob <infNFe> direto na raiz.
+    # Como no caminho da árvore, o primeiro só é usado se a raiz tiver um filho <NFe>.
+    def balde_vazio():
+        return {'campos': {}, 'itens': {campo: [] for campo in _ITENS_STREAM.values()}, 'impostos': [], 'infNFe': False, 'ide': False, 'Id': None}
+    baldes = {'nfe': balde_vazio(), 'raiz': balde_vazio()}
+    da_raiz = {}
+    tem_nfe = False
+    namespace, prefixo_ns = None, None
+    nomes, ordens, contagens = [], [], []
+    n_grupo = len(_GRUPO_IMPOSTOS_STREAM)
+
+    for evento, elem in etree.iterparse(arquivo_xml, events=('start', 'end')):
+        if evento == 'start':
+            tag = elem.tag
+            if namespace is None:
+                namespace = _get_namespace(elem)
+                prefixo_ns = f'{{{namespace}}}' if namespace else ''
+                if tag[len(prefixo_ns):] not in ('nfeProc', 'NFe'): raise _NaoENFe()
+            if prefixo_ns and not tag.startswith(prefixo_ns): nome = None  # outro namespace: nunca casa
+            elif '}' in tag and not prefixo_ns: nome = None
+            else: nome = tag[len(prefixo_ns):]
+            ordem = 1
+            if contagens:
+                ordem = contagens[-1][nome] = contagens[-1].get(nome, 0) + 1
+            nomes.append(nome); ordens.append(ordem); contagens.append({})
+            if len(nomes) == 2 and nome == 'NFe' and ordem == 1: tem_nfe = True
+            continue
+
+        caminho, caminho_ordens = tuple(nomes[1:]), tuple(ordens[1:])
+        if caminho[:2] == ('NFe', 'infNFe') and caminho_ordens[:2] == (1, 1): balde, interno, interno_ordens = baldes['nfe'], caminho[2:], caminho_ordens[2:]
+        elif caminho[:1] == ('infNFe',) and caminho_ordens[:1] == (1,): balde, interno, interno_ordens = baldes['raiz'], caminho[1:], caminho_ordens[1:]
+        else: balde = None
+
+        if balde is not None:
+            primeiros = all(o == 1 for o in interno_ordens)
+            if not interno:
+                balde['infNFe'] = True; balde['Id'] = elem.get('Id')
+            elif primeiros and interno in _CAMPOS_STREAM:
+                balde['campos'][interno] = elem.text
+            elif interno == ('ide',) and primeiros:
+                balde['ide'] = True
+            elif interno[0] == 'det' and interno[1:] in _ITENS_STREAM and all(o == 1 for o in interno_ordens[1:]):
+                if elem.text: balde['itens'][_ITENS_STREAM[interno[1:]]].append(elem.text)
+            if len(interno) == n_grupo + 1 and interno[:n_grupo] == _GRUPO_IMPOSTOS_STREAM and all(o == 1 for o in interno_ordens[:n_grupo]):
+                balde['impostos'].append((elem.tag.split('}')[-1], elem.text))
+        elif caminho in _CAMPOS_STREAM_RAIZ and all(o == 1 for o in caminho_ordens):
+            da_raiz[caminho] = elem.text
+
+        nomes.pop(); ordens.pop(); contagens.pop()
+        # Libera o elemento já lido e os irmãos anteriores, mantendo a memória constante.
+        elem.clear(keep_tail=True)
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None: del parent[0]
+
+    balde = baldes['nfe'] if tem_nfe else baldes['raiz']
+    if not balde['infNFe'] or not balde['ide']: return None
+    campos = {}
+    for campo, caminho, conversor, padrao in CAMPOS_NFE:
+        chave = tuple(caminho.strip('/').split('/'))
+        brutos = da_raiz if caminho.startswith('/') else balde['campos']
+        campos[campo] = _converter_campo(brutos[chave], conversor) if chave in brutos else padrao
+    campos.update(balde['itens'])
+    campos['impostos'] = balde['impostos']
+    campos['Id'] = balde['Id']
+    return campos
+
+def _extrair_dados_autorizada(root_xml, namespace, arquivo_xml, tempos=None):
+    inicio = time.perf_counter()
+    campos = _coletar_campos_arvore(root_xml, namespace)
+    _marcar(tempos, 'campos', inicio)
+    if campos is None: return None
+    return _montar_dados_autorizada(campos, arquivo_xml, tempos)
+
+def _numero_br(texto):
+    """'1.234,56' -> '1234.56'"""
+    return texto.replace('.', '').replace(',', '.')
+
+def _recortar_processo(texto_bruto):
+    """Correção 6: corta o texto do processo logo após o ano (4 dígitos); sem ano, até o primeiro separador duplo."""
+    year_match = _PADROES['ano'].search(texto_bruto)
+    if year_match:
+        return texto_bruto[:year_match.end()].strip()
+    return texto_bruto[:_PADROES['fim_processo'].search(texto_bruto).start()].strip()
+
+def _buscar_processo_ideal(texto):
+    """
+    Equivale a re.search(r'([A-Z0-9]+(?:IMP|EXP)\d{3}\d{4})', texto, re.IGNORECASE).group(1), sem o
+    retrocesso do [A-Z0-9]+ em cada posição do texto: procura a âncora IMP/EXP + 7 dígitos, volta até o
+    início do trecho alfanumérico e, como o '+' é guloso, estende até a última âncora desse trecho.
+    """
+    ancora, caractere = _PADROES['ancora_processo'], _PADROES['caractere_processo']
+    match = ancora.search(texto, 1)
+    while match:
+        pos = match.start()
+        if caractere.match(texto, pos - 1):
+            inicio = pos - 1
+            while inicio > 0 and caractere.match(texto, inicio - 1): inicio -= 1
+            fim_trecho = _PADROES['trecho_processo'].match(texto, inicio).end()
+            ultima = match
+            match = ancora.search(texto, pos + 1)
+            while match and match.start() < fim_trecho:
+                ultima = match
+                match = ancora.search(texto, match.start() + 1)
+            return texto[inicio:ultima.end()]
+        match = ancora.search(texto, pos + 1)
+    return None
+
+def _minerar_textos(texto, textos_itens, buscar_afrmm, buscar_frete, arquivo_xml):
+    """
+    Lê do infCpl (e, se preciso, do infAdProd dos itens) o AFRMM, o frete nacional, o nome do processo
+    e o serviço de trading. Uma única varredura acha a primeira ocorrência de cada palavra-chave e o
+    padrão completo é testado só a partir dela: é ali que o re.search sobre o texto inteiro casaria,
+    e se não casa ali não casaria mais adiante.
+    Retorna (v_afrmm ou None, valor_frete_nacional, nome_processo, valor_servico_trading).
+    """
+    posicoes = {}
+    if texto:
+        procurados = {'processo', 'trading'}
+        if buscar_afrmm: procurados.add('afrmm')
+        if buscar_frete: procurados.add('frete')
+        for match in _PADROES['palavras_chave'].finditer(texto):
+            chave = match.lastgroup
+            if chave in procurados and chave not in posicoes:
+                posicoes[chave] = match.start()
+                if len(posicoes) == len(procurados): break
+
+    def casar(chave):
+        return _PADROES[chave].match(texto, posicoes[chave]) if chave in posicoes else None
+
+    v_afrmm = None
+    afrmm_match = casar('afrmm')
+    if afrmm_match: v_afrmm = float(_numero_br(afrmm_match.group(1)))
+
+    valor_frete_nacional = 0.0
+    frete_match = casar('frete')
+    if frete_match:
+        try:
+            valor_frete_nacional = float(_numero_br(frete_match.group(1)))
+        except (ValueError, TypeError) as e:
+            logging.warning(f"Não foi possível converter o valor do frete para número no arquivo {os.path.basename(arquivo_xml)}. Valor encontrado: {frete_match.group(1)}. Erro: {e}")
+
+    # Processo: 1) padrão ideal no texto sem '/', '.', '-'; 2) "PROCESSO:" no infCpl; 3) "PROCESSO:"/"REGISTRO:" nos itens.
+    nome_processo = 'N/A'
+    processo_ideal = _buscar_processo_ideal(texto.replace("/", "").replace(".", "").replace("-", ""))
+    if processo_ideal:
+        nome_processo = processo_ideal
+    else:
+        match_processo = casar('processo')
+        if match_processo:
+            nome_processo = _recortar_processo(match_processo.group(1).strip())
+        else:
+            for texto_item in textos_itens:
+                match_item = _PADROES['processo_item'].search(texto_item) if texto_item else None
+                if match_item:
+                    nome_processo = _recortar_processo(match_item.group(1).strip())
+                    break
+
+    valor_servico_trading = 'N/A'
+    trading_match = casar('trading')
+    if trading_match: valor_servico_trading = _numero_br(trading_match.group(1))
+    return v_afrmm, valor_frete_nacional, nome_processo, valor_servico_trading
+
+def _montar_dados_autorizada(campos, arquivo_xml, tempos=None):
+    """Aplica as regras de negócio sobre os campos de CAMPOS_NFE (vindos da árvore ou do iterparse)."""
+    inicio = time.perf_counter()
     sistema_emissor = 'Não identificado'
-    ver_proc_tag = find(ide_tag, 'verProc')
-    if ver_proc_tag is not None and ver_proc_tag.text:
-        ver_proc_text = ver_proc_tag.text.strip()
-        if re.search(r'[a-zA-Z]', ver_proc_text) and not ver_proc_text.replace('.', '').isdigit():
+    if campos['verProc']:
+        ver_proc_text = campos['verProc'].strip()
+        if _PADROES['letra'].search(ver_proc_text) and not ver_proc_text.replace('.', '').isdigit():
             sistema_emissor = ver_proc_text
-        else:
-            inf_resp_tec_tag = find(inf_nfe_tag, 'infRespTec')
-            if inf_resp_tec_tag is not None:
-                email_tag = find(inf_resp_tec_tag, 'email')
-                if email_tag is not None and email_tag.text:
-                    match = re.search(r'@([\w.-]+)', email_tag.text)
-                    if match:
-                        domain = match.group(1)
-                        company_name = domain.split('.')[0]
-                        if "narwal" in company_name.lower():
-                            sistema_emissor = "Narwal Sistemas"
-                        else:
-                            sistema_emissor = company_name.capitalize() + " Sistemas"
+        elif campos['email_resp_tec']:
+            match = _PADROES['dominio_email'].search(campos['email_resp_tec'])
+            if match:
+                domain = match.group(1)
+                company_name = domain.split('.')[0]
+                if "narwal" in company_name.lower():
+                    sistema_emissor = "Narwal Sistemas"
+                else:
+                    sistema_emissor = company_name.capitalize() + " Sistemas"
     
-    numero_nf = find(ide_tag, 'nNF').text if find(ide_tag, 'nNF') is not None else 'N/A'
-    
-    try:
-        cfop_tag_det = find_all(inf_nfe_tag, 'det')
-        if cfop_tag_det:
-            prod_tag = find(cfop_tag_det[0], 'prod')
-            if prod_tag is not None: cfop_nf = find(prod_tag, 'CFOP').text
-        else: cfop_nf = 'N/A'
-    except (AttributeError, IndexError): cfop_nf = 'N/A'
-    
-    data_emissao_completa = find(ide_tag, 'dhEmi').text if find(ide_tag, 'dhEmi') is not None else 'N/A'
+    numero_nf = campos['nNF']
+    cfop_nf = campos['CFOP']
+    data_emissao_completa = campos['dhEmi']
     data_emissao = data_emissao_completa.split('T')[0] if data_emissao_completa != 'N/A' else 'N/A'
-    tipo_nota_val = find(ide_tag, 'tpNF').text if find(ide_tag, 'tpNF') is not None else '1'
-    tipo_nota = "Saída" if tipo_nota_val == '1' else "Entrada"
+    tipo_nota = "Saída" if campos['tpNF'] == '1' else "Entrada"
     
-    dest_tag = find(inf_nfe_tag, 'dest')
     nome_cliente, razao_social_destinatario, cnpj_cpf_destinatario, uf_destinatario = 'N/A', 'N/A', 'N/A', 'N/A'
-    if dest_tag is not None:
-        if find(dest_tag, 'xNome') is not None and find(dest_tag, 'xNome').text:
-            nome_cliente = find(dest_tag, 'xNome').text
-            razao_social_destinatario = find(dest_tag, 'xNome').text
-        if find(dest_tag, 'CNPJ') is not None and find(dest_tag, 'CNPJ').text:
-            cnpj_cpf_destinatario = find(dest_tag, 'CNPJ').text
-        elif find(dest_tag, 'CPF') is not None and find(dest_tag, 'CPF').text:
-            cnpj_cpf_destinatario = find(dest_tag, 'CPF').text
-        ender_dest_tag = find(dest_tag, 'enderDest')
-        if ender_dest_tag is not None:
-            uf_tag = find(ender_dest_tag, 'UF')
-            if uf_tag is not None and uf_tag.text is not None:
-                uf_destinatario = uf_tag.text
-
-    total_tag = find(inf_nfe_tag, 'total')
-    valor_total_nf, valor_total_produtos = 'N/A', 'N/A'
-    impostos_totais = defaultdict(lambda: '0.00')
-    v_ii, v_outras, v_afrmm = 0.0, 0.0, 0.0
-    
-    if total_tag is not None:
-        icms_total_tag = find(total_tag, 'ICMSTot')
-        if icms_total_tag is not None:
-            valor_total_nf = find(icms_total_tag, 'vNF').text if find(icms_total_tag, 'vNF') is not None else 'N/A'
-            valor_total_produtos = find(icms_total_tag, 'vProd').text if find(icms_total_tag, 'vProd') is not None else 'N/A'
-            for imposto_tag in icms_total_tag:
-                tag_nome = imposto_tag.tag.split('}')[-1]
-                if tag_nome.startswith('v') and imposto_tag.text:
-                    impostos_totais[tag_nome] = imposto_tag.text
-            ii_tag = find(icms_total_tag, 'vII')
-            if ii_tag is not None and ii_tag.text: v_ii = float(ii_tag.text)
-            v_outras_tag = find(icms_total_tag, 'vOutro')
-            if v_outras_tag is not None and v_outras_tag.text: v_outras = float(v_outras_tag.text)
-    
-    det_tags = find_all(inf_nfe_tag, 'det')
-    for det_tag in det_tags:
-        prod_tag = find(det_tag, 'prod')
-        if prod_tag is not None:
-            di_tag = find(prod_tag, 'DI')
-            if di_tag is not None:
-                vafrmm_tag = find(di_tag, 'vAFRMM')
-                if vafrmm_tag is not None and vafrmm_tag.text:
-                    try:
-                        v_afrmm = float(vafrmm_tag.text)
-                        if v_afrmm > 0: break 
-                    except (ValueError, TypeError): continue
-    
-    inf_adicionais_tag = find(inf_nfe_tag, 'infAdic')
-    texto_completo_adicional = ""
-    if inf_adicionais_tag is not None and find(inf_adicionais_tag, 'infCpl') is not None and find(inf_adicionais_tag, 'infCpl').text:
-        texto_completo_adicional = find(inf_adicionais_tag, 'infCpl').text
-    
-    if v_afrmm == 0.0 and texto_completo_adicional:
-        afrmm_match = re.search(r'AFRMM.*?R\$?\s*([\d.,]+)', texto_completo_adicional, re.IGNORECASE | re.DOTALL)
-        if afrmm_match:
-            valor_str = afrmm_match.group(1).replace('.', '').replace(',', '.')
-            v_afrmm = float(valor_str)
-            
-    valor_frete_nacional = 0.0
-    if tipo_nota == "Entrada" and texto_completo_adicional:
-        frete_match = re.search(r'FRETE\s*NACIONAL.*?[R\$]?\s*([\d.,]+)', texto_completo_adicional, re.IGNORECASE | re.DOTALL)
-        if frete_match:
-            try:
-                valor_str = frete_match.group(1).replace('.', '').replace(',', '.')
-                valor_frete_nacional = float(valor_str)
-            except (ValueError, TypeError) as e:
-                logging.warning(f"Não foi possível converter o valor do frete para número no arquivo {os.path.basename(arquivo_xml)}. Valor encontrado: {frete_match.group(1)}. Erro: {e}")
-                valor_frete_nacional = 0.0
+    if campos['dest_xNome']:
+        nome_cliente = campos['dest_xNome']
+        razao_social_destinatario = campos['dest_xNome']
+    if campos['dest_CNPJ']:
+        cnpj_cpf_destinatario = campos['dest_CNPJ']
+    elif campos['dest_CPF']:
+        cnpj_cpf_destinatario = campos['dest_CPF']
+    if campos['dest_UF'] is not None:
+        uf_destinatario = campos['dest_UF']
 
-    nome_processo = 'N/A'
-    padrao_ideal = r'([A-Z0-9]+(?:IMP|EXP)\d{3}\d{4})'
+    impostos_totais = {}
+    for tag_nome, texto_tag in campos['impostos']:
+        if tag_nome.startswith('v') and texto_tag:
+            try: valor = float(texto_tag)
+            except ValueError: continue
+            if valor: impostos_totais[tag_nome] = valor
+            else: impostos_totais.pop(tag_nome, None)
+    v_ii, v_outras, v_afrmm = campos['vII'], campos['vOutro'], 0.0
     
-    # Tentativa 1: Buscar o padrão ideal em qualquer lugar do texto
-    texto_limpo_adicional = texto_completo_adicional.replace("/", "").replace(".", "").replace("-", "")
-    match_ideal = re.search(padrao_ideal, texto_limpo_adicional, re.IGNORECASE)
-
-    if match_ideal:
-        nome_processo = match_ideal.group(1)
-    else:
-        # Tentativa 2 (Fallback 1): Buscar "PROCESSO:" no texto principal
-        match_processo = re.search(r'PROCESSO\s*:?\s*(.+)', texto_completo_adicional, re.IGNORECASE) # Regex um pouco mais aberto para capturar
-        if match_processo:
-            texto_bruto = match_processo.group(1).strip()
-
-            # --- [INÍCIO DA CORREÇÃO 6 (Busca por Ano)] ---
-            # Tenta encontrar o ano (4 dígitos) no texto bruto
-            year_match = re.search(r'(\d{4})', texto_bruto)
-            
-            if year_match:
-                # Se encontrou o ano, pega o texto até o final do ano
-                end_pos = year_match.end()
-                nome_processo = texto_bruto[:end_pos].strip()
-            else:
-                # Se não encontrou o ano, usa a lógica antiga do split (para outros formatos)
-                nome_processo = re.split(r'[.,;\s]{2,}|$', texto_bruto)[0].strip()
-            # --- [FIM DA CORREÇÃO 6] ---
-                
-        else:
-            # Tentativa 3 (Fallback 2): Buscar "PROCESSO:" nos itens
-            for item_tag in find_all(inf_nfe_tag, 'det'):
-                inf_ad_prod_tag = find(item_tag, 'infAdProd')
-                if inf_ad_prod_tag is not None and inf_ad_prod_tag.text:
-                    match_item = re.search(r'(?:PROCESSO|REGISTRO):\s*(.+)', inf_ad_prod_tag.text, re.IGNORECASE) # Regex aberto
-                    if match_item:
-                        texto_bruto_item = match_item.group(1).strip()
-
-                        # --- [INÍCIO DA CORREÇÃO 6 (Busca por Ano)] ---
-                        # Tenta encontrar o ano (4 dígitos) no texto bruto do item
-                        year_match_item = re.search(r'(\d{4})', texto_bruto_item)
-
-                        if year_match_item:
-                            # Se encontrou o ano, pega o texto até o final do ano
-                            end_pos_item = year_match_item.end()
-                            nome_processo = texto_bruto_item[:end_pos_item].strip()
-                        else:
-                            # Se não encontrou o ano, usa a lógica antiga do split
-                            nome_processo = re.split(r'[.,;\s]{2,}|$', texto_bruto_item)[0].strip()
-                        # --- [FIM DA CORREÇÃO 6] ---
-                        break
+    for texto_afrmm in campos['vAFRMM']:
+        try:
+            v_afrmm = float(texto_afrmm)
+            if v_afrmm > 0: break 
+        except (ValueError, TypeError): continue
     
+    texto_completo_adicional = campos['infCpl'] or ""
+    inicio = _marcar(tempos, 'montagem', inicio)
+    v_afrmm_texto, valor_frete_nacional, nome_processo, valor_servico_trading = _minerar_textos(
+        texto_completo_adicional, campos['infAdProd'], v_afrmm == 0.0, tipo_nota == "Entrada", arquivo_xml)
+    inicio = _marcar(tempos, 'regex', inicio)
+    if v_afrmm_texto is not None: v_afrmm = v_afrmm_texto
     processo_normalizado = _normalize_processo(nome_processo)
-    
-    valor_servico_trading = 'N/A'
-    if texto_completo_adicional:
-        match_trading = re.search(r'trading[^0-9]*([\d.,]+)', texto_completo_adicional.lower())
-        if match_trading: valor_servico_trading = match_trading.group(1).replace('.', '').replace(',', '.')
         
     status_nf = "N/A"
-    prot_nfe_tag = find(root_xml, 'protNFe')
-    if prot_nfe_tag is not None and find(prot_nfe_tag, 'infProt') is not None:
-        cstat_tag = find(find(prot_nfe_tag, 'infProt'), 'cStat')
-        if cstat_tag is not None:
-            if cstat_tag.text == '100': status_nf = "Autorizada"
-            elif cstat_tag.text == '101': status_nf = "Cancelada"
+    if campos['cStat'] == '100': status_nf = "Autorizada"
+    elif campos['cStat'] == '101': status_nf = "Cancelada"
             
-    dados = {
-        'nome_arquivo': os.path.basename(arquivo_xml), 'numero_nf': numero_nf, 'cfop_nf': cfop_nf, 'data_emissao': data_emissao,
-        'nome_cliente': nome_cliente, 'valor_total_nf': float(valor_total_nf) if valor_total_nf != 'N/A' else 0.0,
-        'valor_total_produtos': float(valor_total_produtos) if valor_total_produtos != 'N/A' else 0.0, 'impostos': impostos_totais,
-        'valor_servico_trading': float(valor_servico_trading) if valor_servico_trading != 'N/A' else 0.0, 'tipo_nota': tipo_nota,
-        'nome_processo': nome_processo, 'vII': v_ii, 'vAFRMM': v_afrmm, 'vOutras': v_outras, 'status_nf': status_nf,
-        'sistema_emissor': sistema_emissor, 'uf_destinatario': uf_destinatario, 'cnpj_cpf_destinatario': cnpj_cpf_destinatario,
-        'razao_social_destinatario': razao_social_destinatario, 'processo_normalizado': processo_normalizado,
-        'valor_frete_nacional': valor_frete_nacional
-    }
-    
-    dados['_dados_originais'] = dados.copy()
-    
+    dados = NotaFiscal(
+        nome_arquivo=os.path.basename(arquivo_xml), numero_nf=numero_nf, cfop_nf=cfop_nf, data_emissao=data_emissao,
+        nome_cliente=nome_cliente, valor_total_nf=campos['vNF'],
+        valor_total_produtos=campos['vProd'], impostos=impostos_totais,
+        valor_servico_trading=float(valor_servico_trading) if valor_servico_trading != 'N/A' else 0.0, tipo_nota=tipo_nota,
+        nome_processo=nome_processo, vII=v_ii, vAFRMM=v_afrmm, vOutras=v_outras, status_nf=status_nf,
+        sistema_emissor=sistema_emissor, uf_destinatario=uf_destinatario, cnpj_cpf_destinatario=cnpj_cpf_destinatario,
+        razao_social_destinatario=razao_social_destinatario, processo_normalizado=processo_normalizado,
+        valor_frete_nacional=valor_frete_nacional,
+        chave_acesso=_chave_da_nota(campos, arquivo_xml)
+    )
+    _marcar(tempos, 'montagem', inicio)
     return dados
 
+def _chave_da_nota(campos, arquivo_xml):
+    """Chave de acesso da nota: a do protocolo, a do Id do infNFe ('NFe' + 44 dígitos) ou a do nome do arquivo."""
+    if campos['chNFe']: return campos['chNFe']
+    id_nfe = campos.get('Id') or ''
+    if id_nfe.startswith('NFe') and chave_valida(id_nfe[3:]): return id_nfe[3:]
+    return chave_do_nome(os.path.basename(arquivo_xml)) or 'N/A'
+
 def _criar_dados_cancelamento_manual(arquivo_xml):
     nome_base = os.path.basename(arquivo_xml)
-    chave_match = re.search(r'(\d{44})', nome_base)
+    chave_match = _PADROES['chave_acesso'].search(nome_base)
     numero_nf = 'N/A'
     if chave_match:
         chave = chave_match.group(1)
         numero_nf = chave[25:34]
+    chave_acesso = chave_do_nome(nome_base) or 'N/A'
 
-    dados = {
-        'nome_arquivo': nome_base, 'numero_nf': numero_nf, 'cfop_nf': 'N/A',
-        'data_emissao': 'N/A','nome_cliente': 'N/A (Cancelada)', 'valor_total_nf': 0.0,
-        'valor_total_produtos': 0.0, 'impostos': defaultdict(lambda: '0.00'), 'valor_servico_trading': 0.0,
-        'tipo_nota': 'N/A','nome_processo': 'N/A', 'vII': 0.0, 'vAFRMM': 0.0, 'vOutras': 0.0, 
-        'status_nf': "Cancelada (Manual)", 'sistema_emissor': 'N/A',
-        'uf_destinatario': 'N/A', 'cnpj_cpf_destinatario': 'N/A',
-        'razao_social_destinatario': 'N/A (Cancelada)', 'processo_normalizado': 'N/A',
-        'valor_frete_nacional': 0.0
-    }
-    dados['_dados_originais'] = dados.copy()
+    dados = NotaFiscal(
+        nome_arquivo=nome_base, numero_nf=numero_nf, cfop_nf='N/A',
+        data_emissao='N/A',nome_cliente='N/A (Cancelada)', valor_total_nf=0.0,
+        valor_total_produtos=0.0, valor_servico_trading=0.0,
+        tipo_nota='N/A',nome_processo='N/A', vII=0.0, vAFRMM=0.0, vOutras=0.0, 
+        status_nf="Cancelada (Manual)", sistema_emissor='N/A',
+        uf_destinatario='N/A', cnpj_cpf_destinatario='N/A',
+        razao_social_destinatario='N/A (Cancelada)', processo_normalizado='N/A',
+        valor_frete_nacional=0.0, chave_acesso=chave_acesso
+    )
     return dados
 
 def _extrair_dados_cancelamento(root_xml, namespace, arquivo_xml):
@@ -285,28 +581,56 @@ def _extrair_dados_cancelamento(root_xml, namespace, arquivo_xml):
     data_cancelamento = dhEvento.split('T')[0] if dhEvento != 'N/A' else 'N/A'
     numero_nf_da_chave = chNFe[25:34] if len(chNFe) == 44 else 'N/A'
 
-    dados = {
-        'nome_arquivo': os.path.basename(arquivo_xml), 'numero_nf': numero_nf_da_chave, 'cfop_nf': 'N/A',
-        'data_emissao': data_cancelamento,'nome_cliente': 'N/A (Cancelada)', 'valor_total_nf': 0.0,
-        'valor_total_produtos': 0.0, 'impostos': defaultdict(lambda: '0.00'), 'valor_servico_trading': 0.0,
-        'tipo_nota': 'N/A','nome_processo': 'N/A', 'vII': 0.0, 'vAFRMM': 0.0, 'vOutras': 0.0, 
-        'status_nf': "Cancelada", 'sistema_emissor': 'N/A',
-        'uf_destinatario': 'N/A', 'cnpj_cpf_destinatario': 'N/A',
-        'razao_social_destinatario': 'N/A (Cancelada)', 'processo_normalizado': 'N/A',
-        'valor_frete_nacional': 0.0
-    }
-    dados['_dados_originais'] = dados.copy()
+    dados = NotaFiscal(
+        nome_arquivo=os.path.basename(arquivo_xml), numero_nf=numero_nf_da_chave, cfop_nf='N/A',
+        data_emissao=data_cancelamento,nome_cliente='N/A (Cancelada)', valor_total_nf=0.0,
+        valor_total_produtos=0.0, valor_servico_trading=0.0,
+        tipo_nota='N/A',nome_processo='N/A', vII=0.0, vAFRMM=0.0, vOutras=0.0, 
+        status_nf="Cancelada", sistema_emissor='N/A',
+        uf_destinatario='N/A', cnpj_cpf_destinatario='N/A',
+        razao_social_destinatario='N/A (Cancelada)', processo_normalizado='N/A',
+        valor_frete_nacional=0.0, chave_acesso=chNFe if len(chNFe) == 44 else 'N/A'
+    )
     return dados
 
-def extrair_dados_nf(arquivo_xml):
+# Etapas medidas em extrair_dados_nf(..., tempos={}); no motor 'stream' a leitura do arquivo e a busca
+# dos campos acontecem junto com o parse (iterparse) e entram em 'parse'.
+ETAPAS_EXTRACAO = ('leitura', 'parse', 'campos', 'regex', 'montagem')
+
+def _marcar(tempos, etapa, inicio):
+    """Soma em tempos[etapa] o tempo desde 'inicio' (se houver medição) e devolve o instante atual."""
+    agora = time.perf_counter()
+    if tempos is not None: tempos[etapa] = tempos.get(etapa, 0.0) + (agora - inicio)
+    return agora
+
+def extrair_dados_nf(arquivo_xml, motor=None, tempos=None, conteudo=None):
+    """
+    Extrai uma nota (ou evento de cancelamento). Com 'tempos' (dict), acumula os segundos de cada etapa de
+    ETAPAS_EXTRACAO. 'conteudo' traz o arquivo já lido (source_logic.ler_antecipado); quem o leu o libera.
+    """
     nome_base = os.path.basename(arquivo_xml)
     if nome_base.upper().startswith('CANCELADA_'):
-        logging.info(f"Arquivo identificado como cancelado pelo nome: {nome_base}")
+        logging.debug(f"Arquivo identificado como cancelado pelo nome: {nome_base}")
         return _criar_dados_cancelamento_manual(arquivo_xml)
 
+    lido_aqui = None
     try:
-        tree = etree.parse(arquivo_xml)
-        root_xml = tree.getroot()
+        inicio = time.perf_counter()
+        if (motor or MOTOR_PADRAO) == 'stream':
+            try:
+                if conteudo is None:
+                    with source_logic.abrir(arquivo_xml) as fonte: campos = _coletar_campos_stream(fonte)
+                else:
+                    campos = _coletar_campos_stream(io.BytesIO(conteudo) if isinstance(conteudo, bytes) else conteudo)
+                _marcar(tempos, 'parse', inicio)
+                return _montar_dados_autorizada(campos, arquivo_xml, tempos) if campos is not None else None
+            except _NaoENFe:
+                inicio = _marcar(tempos, 'parse', inicio)  # Eventos e outros XMLs seguem pelo caminho da árvore, logo abaixo.
+        if conteudo is None:
+            conteudo = lido_aqui = source_logic.ler_conteudo(arquivo_xml)
+            inicio = _marcar(tempos, 'leitura', inicio)
+        root_xml = etree.fromstring(conteudo)
+        _marcar(tempos, 'parse', inicio)
         namespace = _get_namespace(root_xml)
         root_tag = root_xml.tag.split('}')[-1] if '}' in root_xml.tag else root_xml.tag
         if root_tag == 'procEventoNFe':
@@ -316,8 +640,8 @@ def extrair_dados_nf(arquivo_xml):
                 if tpEvento_tag is not None and tpEvento_tag.text == '110111':
                     return _extrair_dados_cancelamento(root_xml, namespace, arquivo_xml)
         elif root_tag in ['nfeProc', 'NFe']:
-            return _extrair_dados_autorizada(root_xml, namespace, arquivo_xml)
-        logging.info(f"Arquivo ignorado (não é NFe autorizada nem evento de cancelamento): {os.path.basename(arquivo_xml)}")
+            return _extrair_dados_autorizada(root_xml, namespace, arquivo_xml, tempos)
+        logging.debug(f"Arquivo ignorado (não é NFe autorizada nem evento de cancelamento): {os.path.basename(arquivo_xml)}")
         return None
     except etree.XMLSyntaxError:
         logging.error(f"Erro de sintaxe XML no arquivo {os.path.basename(arquivo_xml)}. O arquivo pode estar corrompido.")
@@ -325,81 +649,687 @@ def extrair_dados_nf(arquivo_xml):
     except Exception as e:
         logging.error(f"Erro inesperado ao processar o arquivo {os.path.basename(arquivo_xml)}: {e}", exc_info=True)
         return None
+    finally:
+        source_logic.liberar(lido_aqui)
 
-def setup_headers(ws, headers):
-    fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    text_format = '@' # Define o formato de texto padrão
+def _extrair_em_sequencia(caminhos, motor=None, medir=False, profundidade=None, com_assinatura=False):
+    """
+    Extrai os arquivos em ordem enquanto source_logic.ler_antecipado já lê os próximos. Com 'medir', cada
+    item vira (dados, segundos, tempos por etapa); a espera por uma leitura que a antecipação não escondeu
+    conta como 'leitura'. Com 'com_assinatura', cada item vira (item, (tamanho, mtime_ns, hash)) para o
+    cache: o estado tomado antes da leitura e o hash dos mesmos bytes que geraram os dados, sem ler o
+    arquivo outra vez (None se a leitura antecipada falhou).
+    """
+    leituras = source_logic.ler_antecipado(caminhos, profundidade, com_estado=com_assinatura)
+    while True:
+        inicio = time.perf_counter()
+        lido = next(leituras, None)
+        if lido is None: return
+        caminho, conteudo = lido[:2]
+        try:
+            if not medir:
+                item = extrair_dados_nf(caminho, motor, conteudo=conteudo)
+            else:
+                tempos = {'leitura': time.perf_counter() - inicio}
+                dados = extrair_dados_nf(caminho, motor, tempos, conteudo)
+                item = (dados, time.perf_counter() - inicio, tempos)
+            if not com_assinatura: yield item; continue
+            yield item, (*lido[2], cache_logic.hash_conteudo(conteudo)) if conteudo is not None else None
+        finally:
+            source_logic.liberar(conteudo)
+
+def _extrair_bloco(caminhos, motor=None, medir=False, profundidade=None, com_assinatura=False):
+    """Executado dentro do pool: extrai um bloco de arquivos em sequência (ver _extrair_em_sequencia)."""
+    return list(_extrair_em_sequencia(caminhos, motor, medir, profundidade, com_assinatura))
+
+def _separar_assinaturas(bloco, assinaturas, inicio):
+    """Tira as assinaturas dos itens de um bloco extraído com 'com_assinatura' e as guarda em assinaturas[inicio:]."""
+    if assinaturas is None: return bloco
+    assinaturas[inicio:inicio + len(bloco)] = [assinatura for _, assinatura in bloco]
+    return [item for item, _ in bloco]
+
+def _desempacotar_bloco(caminhos, bloco, relatorio):
+    """Passa as medições do bloco para o relatório e devolve só os dados."""
+    if relatorio is None: return bloco
+    for caminho, (dados, segundos, tempos) in zip(caminhos, bloco): relatorio.registrar(caminho, segundos, tempos, dados)
+    return [dados for dados, _, _ in bloco]
+
+def _dados_para_cache(dados):
+    """Converte a nota extraída em algo serializável em JSON."""
+    return dados.como_dict()
+
+def _dados_do_cache(payload):
+    return NotaFiscal.de_dict(payload)
 
+def extrair_lote(caminhos, workers=None, progress_callback=None, tamanho_bloco=None, usar_cache=True, motor=None, relatorio=None, profundidade_leitura=None):
+    """
+    Extrai vários XMLs distribuindo o parsing em um pool de processos, em blocos.
+    Retorna uma lista na mesma ordem de 'caminhos' (None onde a extração falhou).
+    progress_callback(processados, total) é chamado na thread que invocou a função.
+    Com usar_cache, só os arquivos novos ou alterados desde a última leitura são reprocessados.
+    'motor' escolhe o leitor de XML (ver MOTORES_EXTRACAO); os dois geram o mesmo resultado.
+    'relatorio' (metrics_logic.RelatorioExtracao) recebe o tempo de cada arquivo extraído, por etapa, e os acertos do cache.
+    'profundidade_leitura' é quantos arquivos cada processo lê à frente do parser (source_logic.PROFUNDIDADE_LEITURA).
+    """
+    caminhos = list(caminhos)
+    total = len(caminhos)
+    resultados = [None] * total
+    if total == 0: return resultados
+
+    em_cache = cache_logic.buscar_lote(caminhos, VERSAO_EXTRATOR) if usar_cache else {}
+    pendentes = [i for i, caminho in enumerate(caminhos) if caminho not in em_cache]
+    for i, caminho in enumerate(caminhos):
+        if caminho in em_cache: resultados[i] = _dados_do_cache(em_cache[caminho])
+    if em_cache:
+        logging.info(f"{len(em_cache)} de {total} arquivos reaproveitados do cache de extração.")
+        if relatorio is not None: relatorio.registrar_cache(len(em_cache))
+    ja_prontos = total - len(pendentes)
+    if progress_callback and ja_prontos: progress_callback(ja_prontos, total)
+
+    if pendentes:
+        def progresso_parcial(processados, _):
+            if progress_callback: progress_callback(ja_prontos + processados, total)
+        # Estado e hash de cada arquivo para o cache saem da leitura feita na extração (sem segunda leitura).
+        assinaturas = [None] * len(pendentes) if usar_cache and cache_logic.cache_ativo() else None
+        novos = _extrair_sem_cache([caminhos[i] for i in pendentes], workers, progresso_parcial, tamanho_bloco, motor, relatorio, profundidade_leitura, assinaturas)
+        for i, dados in zip(pendentes, novos): resultados[i] = dados
+        if assinaturas is not None:
+            cache_logic.salvar_lote([(caminhos[i], _dados_para_cache(dados), assinatura) for i, dados, assinatura in zip(pendentes, novos, assinaturas) if dados], VERSAO_EXTRATOR)
+    return resultados
+
+def _extrair_sem_cache(caminhos, workers, progress_callback, tamanho_bloco, motor=None, relatorio=None, profundidade=None, assinaturas=None):
+    """Com 'assinaturas' (lista do tamanho de 'caminhos'), preenche a (tamanho, mtime_ns, hash) de cada arquivo lido."""
+    total = len(caminhos)
+    resultados = [None] * total
+    workers = workers or os.cpu_count() or 1
+    medir = relatorio is not None; com_assinatura = assinaturas is not None
+
+    if workers <= 1 or total < LIMITE_LOTE_SEQUENCIAL:
+        for i, item in enumerate(_extrair_em_sequencia(caminhos, motor, medir, profundidade, com_assinatura)):
+            resultados[i] = _desempacotar_bloco([caminhos[i]], _separar_assinaturas([item], assinaturas, i), relatorio)[0]
+            if progress_callback: progress_callback(i + 1, total)
+        return resultados
+
+    # Blocos pequenos o bastante para balancear a carga e dar progresso frequente,
+    # grandes o bastante para diluir o custo de pickle/IPC de cada tarefa.
+    if not tamanho_bloco:
+        tamanho_bloco = max(1, min(200, total // (workers * 4)))
+
+    processados = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(_extrair_bloco, caminhos[inicio:inicio + tamanho_bloco], motor, medir, profundidade, com_assinatura): inicio
+                   for inicio in range(0, total, tamanho_bloco)}
+        for futuro in as_completed(futuros):
+            inicio = futuros[futuro]
+            try:
+                bloco = futuro.result()
+            except Exception as e:
+                # Se um processo do pool cair, o bloco é refeito aqui mesmo para não perder arquivos.
+                logging.error(f"Falha no pool de extração (bloco iniciado em {inicio}): {e}. Reprocessando localmente.")
+                bloco = _extrair_bloco(caminhos[inicio:inicio + tamanho_bloco], motor, medir, profundidade, com_assinatura)
+            bloco = _desempacotar_bloco(caminhos[inicio:inicio + len(bloco)], _separar_assinaturas(bloco, assinaturas, inicio), relatorio)
+            resultados[inicio:inicio + len(bloco)] = bloco
+            processados += len(bloco)
+            if progress_callback: progress_callback(processados, total)
+    return resultados
+
+# =============================================================================
+# --- Pré-classificação e deduplicação (sem montar a árvore) ---
+# Antes do parsing, os primeiros KB de cada XML dizem a raiz, o tpEvento e a chave de acesso. Com isso
+# os arquivos que extrair_dados_nf ignoraria (outros eventos, CT-e, XMLs quaisquer) nem chegam ao parser,
+# e as cópias do mesmo documento espalhadas pelas subpastas são descartadas. Um evento de cancelamento
+# tem a mesma chave da nota que cancela, por isso a identidade do arquivo é (tipo, chave), e não só a chave.
+# =============================================================================
+
+TAMANHO_CABECALHO = 4096  # bytes lidos do início do XML
+_PADROES_CABECALHO = {
+    'digitos_nome': re.compile(r'\d{44,}'),
+    'raiz': re.compile(rb'<(?![?!])(?:[\w.-]+:)?([\w.-]+)'),
+    'comentario': re.compile(rb'<!--.*?-->', re.DOTALL),
+    'tp_evento': re.compile(rb'<(?:[\w.-]+:)?tpEvento>\s*(\d{6})\s*<'),
+    'ch_nfe': re.compile(rb'<(?:[\w.-]+:)?chNFe>\s*(\d{44})\s*<'),
+    'id_nfe': re.compile(rb'Id\s*=\s*["\']NFe(\d{44})["\']'),
+    'id_evento': re.compile(rb'Id\s*=\s*["\']ID(\d{6})(\d{44})\d{2}["\']'),
+}
+RAIZES_NFE, RAIZ_EVENTO, EVENTO_CANCELAMENTO = ('nfeProc', 'NFe'), 'procEventoNFe', '110111'
+TIPO_NFE, TIPO_CANCELADA_NOME = 'NFe', 'CANCELADA_'  # eventos: 'Evento <tpEvento>'
+
+def chave_valida(chave):
+    """Confere o dígito verificador (módulo 11) da chave de 44 dígitos."""
+    if len(chave) != 44 or not chave.isdigit(): return False
+    soma = sum(int(d) * p for d, p in zip(reversed(chave[:43]), [2, 3, 4, 5, 6, 7, 8, 9] * 6))
+    dv = 11 - soma % 11
+    return int(chave[43]) == (0 if dv >= 10 else dv)
+
+def chave_do_nome(nome_arquivo):
+    """
+    Chave de acesso presente no nome do arquivo, ou None. Aceita a chave sozinha (NFe<chave>.xml) e o
+    padrão dos eventos baixados da SEFAZ (<tpEvento><chave><seq>-procEventoNFe.xml).
+    """
+    for trecho in _PADROES_CABECALHO['digitos_nome'].findall(nome_arquivo):
+        for chave in (trecho[6:50], trecho[:44]) if len(trecho) == 52 else (trecho[:44],):
+            if chave_valida(chave): return chave
+    return None
+
+class ClassificacaoXML:
+    """O que o início do arquivo revela. Com 'motivo' preenchido o arquivo é ignorado sem ser lido por inteiro."""
+    __slots__ = ('raiz', 'tp_evento', 'chave', 'motivo')
+    def __init__(self, raiz=None, tp_evento=None, chave=None, motivo=None):
+        self.raiz = raiz; self.tp_evento = tp_evento; self.chave = chave; self.motivo = motivo
+
+    @property
+    def identidade(self):
+        """(tipo, chave) usada na deduplicação, ou None se o cabeçalho não bastou para identificar o documento."""
+        if not self.chave: return None
+        if self.raiz == TIPO_CANCELADA_NOME: return (TIPO_CANCELADA_NOME, self.chave)
+        if self.raiz in RAIZES_NFE: return (TIPO_NFE, self.chave)
+        if self.raiz == RAIZ_EVENTO and self.tp_evento: return (f"Evento {self.tp_evento}", self.chave)
+        return None
+
+def _decodificar(match, grupo=1):
+    return match.group(grupo).decode('ascii') if match else None
+
+def classificar_arquivo(arquivo_xml):
+    """
+    Classifica o XML pelas mesmas regras de extrair_dados_nf, lendo só TAMANHO_CABECALHO bytes. Na dúvida
+    (arquivo ilegível, UTF-16, raiz ou tpEvento fora do trecho lido) o arquivo não é ignorado: segue para
+    a extração, que registra o erro ou o descarte como antes.
+    """
+    nome_base = os.path.basename(arquivo_xml)
+    if nome_base.upper().startswith('CANCELADA_'):
+        return ClassificacaoXML(TIPO_CANCELADA_NOME, chave=chave_do_nome(nome_base))
+    try:
+        cabecalho = source_logic.ler_cabecalho(arquivo_xml, TAMANHO_CABECALHO)
+    except OSError:
+        return ClassificacaoXML()
+    if cabecalho.startswith((b'\xff\xfe', b'\xfe\xff')): return ClassificacaoXML()
+    if b'<!--' in cabecalho:
+        cabecalho = _PADROES_CABECALHO['comentario'].sub(b'', cabecalho)
+        if b'<!--' in cabecalho: return ClassificacaoXML()  # comentário maior que o trecho lido
+    raiz = _decodificar(_PADROES_CABECALHO['raiz'].search(cabecalho))
+    if raiz is None: return ClassificacaoXML()
+    if raiz in RAIZES_NFE:
+        return ClassificacaoXML(raiz, chave=_decodificar(_PADROES_CABECALHO['id_nfe'].search(cabecalho)))
+    if raiz == RAIZ_EVENTO:
+        id_evento = _PADROES_CABECALHO['id_evento'].search(cabecalho)
+        tp_evento = _decodificar(_PADROES_CABECALHO['tp_evento'].search(cabecalho)) or _decodificar(id_evento)
+        chave = _decodificar(id_evento, 2) or _decodificar(_PADROES_CABECALHO['ch_nfe'].search(cabecalho))
+        motivo = None if tp_evento in (None, EVENTO_CANCELAMENTO) else f"evento {tp_evento} (não é cancelamento)"
+        return ClassificacaoXML(raiz, tp_evento, chave, motivo)
+    return ClassificacaoXML(raiz, motivo=f"raiz <{raiz}> (não é NFe nem evento)")
+
+def identificar_arquivo(arquivo_xml):
+    """(tipo, chave) do arquivo sem montar a árvore, ou None (ver ClassificacaoXML.identidade)."""
+    return classificar_arquivo(arquivo_xml).identidade
+
+class ResultadoTriagem:
+    """Arquivos que seguem para a extração, os ignorados ({caminho: motivo}) e a classificação de cada um."""
+    def __init__(self, arquivos, ignorados, classificacoes):
+        self.arquivos = arquivos; self.ignorados = ignorados; self.classificacoes = classificacoes
+
+    def resumo(self):
+        return f"{len(self.ignorados)} arquivo(s) ignorado(s) por não serem NFe nem cancelamento" if self.ignorados else ""
+
+def triar_arquivos(caminhos, profundidade_leitura=None):
+    """
+    Classifica cada arquivo pelo cabeçalho e separa os que não precisam ir para o parser. Os cabeçalhos
+    são lidos por até 'profundidade_leitura' threads (em pasta de rede a espera de cada abertura se sobrepõe).
+    """
+    caminhos = list(caminhos)
+    arquivos, ignorados, classificacoes = [], {}, {}
+    for caminho, classificacao in zip(caminhos, source_logic.mapear_antecipado(classificar_arquivo, caminhos, profundidade_leitura)):
+        classificacoes[caminho] = classificacao
+        if classificacao.motivo:
+            ignorados[caminho] = classificacao.motivo
+            logging.debug(f"Arquivo ignorado sem leitura completa ({classificacao.motivo}): {os.path.basename(caminho)}")
+        else: arquivos.append(caminho)
+    return ResultadoTriagem(arquivos, ignorados, classificacoes)
+
+class ResultadoDeduplicacao:
+    """Arquivos que seguem para a extração e as cópias descartadas ({cópia: arquivo mantido})."""
+    def __init__(self, arquivos, duplicados, pareados):
+        self.arquivos = arquivos; self.duplicados = duplicados; self.pareados = pareados
+
+    def resumo(self):
+        partes = []
+        if self.duplicados: partes.append(f"{len(self.duplicados)} cópia(s) ignorada(s) (mesma chave de acesso)")
+        if self.pareados: partes.append(f"{self.pareados} cancelamento(s) junto da nota original")
+        return "; ".join(partes)
+
+def deduplicar_por_chave(caminhos, classificacoes=None):
+    """
+    Descarta as cópias do mesmo documento, mantendo a primeira na ordem recebida. Só os arquivos cuja
+    chave se repete (pelo nome) e os que não trazem a chave no nome têm o cabeçalho lido, a não ser que
+    as classificações já venham da triagem ({caminho: ClassificacaoXML}). Arquivos sem identificação
+    seguem sempre para a extração. 'pareados' conta as chaves que têm a nota e um cancelamento
+    (evento 110111 ou CANCELADA_) no mesmo lote.
+    """
+    caminhos = list(caminhos); classificacoes = classificacoes or {}
+    def identificar(caminho):
+        classificacao = classificacoes.get(caminho)
+        return classificacao.identidade if classificacao is not None else identificar_arquivo(caminho)
+    grupos = defaultdict(list)  # chave -> caminhos, na ordem recebida
+    identidades = {}
+    for caminho in caminhos:
+        chave = chave_do_nome(os.path.basename(caminho))
+        if chave is None:
+            identidade = identificar(caminho)
+            if identidade is None: continue
+            identidades[caminho] = identidade; chave = identidade[1]
+        grupos[chave].append(caminho)
+
+    duplicados, pareados = {}, 0
+    for chave, grupo in grupos.items():
+        if len(grupo) < 2: continue
+        primeiros = {}  # (tipo, chave) -> primeiro arquivo
+        for caminho in grupo:
+            identidade = identidades.get(caminho) or identificar(caminho)
+            if identidade is None: continue
+            if identidade in primeiros: duplicados[caminho] = primeiros[identidade]
+            else: primeiros[identidade] = caminho
+        tipos = {tipo for tipo, _ in primeiros}
+        if TIPO_NFE in tipos and (TIPO_CANCELADA_NOME in tipos or f"Evento {EVENTO_CANCELAMENTO}" in tipos): pareados += 1
+
+    for copia, original in duplicados.items():
+        logging.debug(f"Arquivo ignorado (cópia de {original}): {copia}")
+    return ResultadoDeduplicacao([c for c in caminhos if c not in duplicados], duplicados, pareados)
+
+# =============================================================================
+# --- Esquema das planilhas ---
+# Cabeçalhos usados pelas exportações, o campo da nota de cada um e os estilos compartilhados.
+# =============================================================================
+
+FORMATO_MOEDA = 'R$ #,##0.00'
+FORMATO_TEXTO = '@'
+
+CABECALHOS_BASICOS = ['Arquivo', 'Número da NF', 'Cliente', 'Data de Emissão', 'Sistema Emissor', 'Valor Total', 'Status da NF']
+CABECALHOS_COMPLETOS = ['Arquivo', 'Número da NF', 'Status da NF', 'Data de Emissão', 'Cliente', 'CNPJ/CPF Dest.', 'Razão Social Dest.', 'UF Destino', 'Nome do Processo', 'CFOP', 'Valor Total dos Produtos', 'Valor II', 'Valor ICMS', 'Valor IPI', 'Valor PIS', 'Valor COFINS', 'Outras Despesas', 'Valor AFRMM', 'Frete Nacional', 'Valor Total', 'Sistema Emissor']
+CABECALHOS_SERVICO = ['Número da NF', 'Cliente', 'Data de Emissão', 'Sistema Emissor', 'Nome do Processo', 'Valor Serviço Trading']
+CABECALHOS_PENDENTES = CABECALHOS_SERVICO + ['Qtde Encontrada', 'Qtde Esperada', 'Qtde a Emitir']
+
+# Cabeçalho -> (campo da nota, tag do ICMSTot ou None, padrão). Mesmo mapeamento de write_data_to_excel.
+CAMPOS_PLANILHA = {
+    'Arquivo': ('nome_arquivo', None, None), 'Número da NF': ('numero_nf', None, None), 'CFOP': ('cfop_nf', None, None),
+    'Cliente': ('nome_cliente', None, None), 'Data de Emissão': ('data_emissao', None, None), 'Nome do Processo': ('nome_processo', None, None),
+    'Valor Total dos Produtos': ('valor_total_produtos', None, 0.0), 'Valor Total': ('valor_total_nf', None, 0.0),
+    'Valor ICMS': ('impostos', 'vICMS', 0.0), 'Valor IPI': ('impostos', 'vIPI', 0.0),
+    'Valor PIS': ('impostos', 'vPIS', 0.0), 'Valor COFINS': ('impostos', 'vCOFINS', 0.0),
+    'Valor Serviço Trading': ('valor_servico_trading', None, 0.0), 'Valor II': ('vII', None, 0.0),
+    'Valor AFRMM': ('vAFRMM', None, 0.0), 'Outras Despesas': ('vOutras', None, 0.0), 'Status da NF': ('status_nf', None, 'N/A'),
+    'Sistema Emissor': ('sistema_emissor', None, 'N/A'), 'UF Destino': ('uf_destinatario', None, None),
+    'CNPJ/CPF Dest.': ('cnpj_cpf_destinatario', None, None), 'Razão Social Dest.': ('razao_social_destinatario', None, None),
+    'Frete Nacional': ('valor_frete_nacional', None, 0.0),
+}
+
+def _coluna_moeda(cabecalho):
+    return cabecalho.startswith('Valor') or cabecalho in ('Outras Despesas', 'Frete Nacional')
+
+def _leitor_campo(cabecalho):
+    """Função nota -> valor da coluna, resolvida uma vez a partir de CAMPOS_PLANILHA."""
+    coluna = CAMPOS_PLANILHA.get(cabecalho)
+    if coluna is None: return lambda nota: ''
+    campo, tag, padrao = coluna
+    if tag: return lambda nota: (nota.get('impostos') or {}).get(tag, padrao)
+    return lambda nota: nota.get(campo, padrao)
+
+class EsquemaPlanilha:
+    """
+    Uma lista de cabeçalhos compilada: leitor de cada coluna, se a coluna é de valor (moeda) e a letra
+    da coluna. Os escritores de planilha consomem o esquema em vez de reavaliar o cabeçalho a cada célula.
+    """
+    __slots__ = ('cabecalhos', 'leitores', 'moeda', 'letras')
+
+    def __init__(self, cabecalhos):
+        self.cabecalhos = tuple(cabecalhos)
+        self.leitores = tuple(_leitor_campo(cabecalho) for cabecalho in self.cabecalhos)
+        self.moeda = tuple(_coluna_moeda(cabecalho) for cabecalho in self.cabecalhos)
+        self.letras = tuple(get_column_letter(indice) for indice in range(1, len(self.cabecalhos) + 1))
+
+    def __len__(self): return len(self.cabecalhos)
+
+    def valores(self, nota):
+        return [leitor(nota) for leitor in self.leitores]
+
+_esquemas_planilha = {}
+
+def esquema_planilha(cabecalhos):
+    """EsquemaPlanilha dos cabeçalhos (compilado na primeira vez e reaproveitado depois)."""
+    if isinstance(cabecalhos, EsquemaPlanilha): return cabecalhos
+    chave = tuple(cabecalhos)
+    esquema = _esquemas_planilha.get(chave)
+    if esquema is None: esquema = _esquemas_planilha[chave] = EsquemaPlanilha(chave)
+    return esquema
+
+_LADO_FINO = Side(style='thin')
+_BORDA_FINA = Border(left=_LADO_FINO, right=_LADO_FINO, top=_LADO_FINO, bottom=_LADO_FINO)
+_PREENCHIMENTO_CABECALHO = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+_ALINHAMENTO_CABECALHO = Alignment(horizontal="center", vertical="center")
+_PREENCHIMENTO_TOTAL = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+_FONTE_TOTAL = Font(bold=True)
+
+def setup_headers(ws, headers):
     for col, title in enumerate(headers, 1):
         cell = ws.cell(row=1, column=col, value=title)
-        cell.fill, cell.alignment, cell.border = fill, alignment, border
-        # --- INÍCIO DA CORREÇÃO 2 ---
-        cell.number_format = text_format
-        # --- FIM DA CORREÇÃO 2 ---
+        cell.fill, cell.alignment, cell.border = _PREENCHIMENTO_CABECALHO, _ALINHAMENTO_CABECALHO, _BORDA_FINA
+        cell.number_format = FORMATO_TEXTO
 
 def write_data_to_excel(ws, row_index, data, headers):
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    currency_format = 'R$ #,##0.00'
-    text_format = '@' # Define o formato de texto padrão
-
-    for col, header in enumerate(headers, 1):
-        value_map = {
-            'Arquivo': data.get('nome_arquivo'), 'Número da NF': data.get('numero_nf'), 'CFOP': data.get('cfop_nf'),
-            'Cliente': data.get('nome_cliente'), 'Data de Emissão': data.get('data_emissao'), 'Nome do Processo': data.get('nome_processo'),
-            'Valor Total dos Produtos': data.get('valor_total_produtos', 0.0), 'Valor Total': data.get('valor_total_nf', 0.0),
-            'Valor ICMS': float(data.get('impostos', {}).get('vICMS', '0.00')), 'Valor IPI': float(data.get('impostos', {}).get('vIPI', '0.00')),
-            'Valor PIS': float(data.get('impostos', {}).get('vPIS', '0.00')), 'Valor COFINS': float(data.get('impostos', {}).get('vCOFINS', '0.00')),
-            'Valor Serviço Trading': data.get('valor_servico_trading', 0.0), 'Valor II': data.get('vII', 0.0),
-            'Valor AFRMM': data.get('vAFRMM', 0.0), 'Outras Despesas': data.get('vOutras', 0.0), 'Status da NF': data.get('status_nf', 'N/A'),
-            'Sistema Emissor': data.get('sistema_emissor', 'N/A'),
-            'UF Destino': data.get('uf_destinatario'),
-            'CNPJ/CPF Dest.': data.get('cnpj_cpf_destinatario'),
-            'Razão Social Dest.': data.get('razao_social_destinatario'),
-            'Frete Nacional': data.get('valor_frete_nacional', 0.0)
-        }
-        value = value_map.get(header, '')
+    """Uma linha da nota; 'headers' pode ser a lista de cabeçalhos ou um EsquemaPlanilha já compilado."""
+    esquema = esquema_planilha(headers)
+    for col, (value, moeda) in enumerate(zip(esquema.valores(data), esquema.moeda), 1):
         cell = ws.cell(row=row_index, column=col, value=value)
-        cell.border = border
-        
-        # --- INÍCIO DA CORREÇÃO 1 (Mantida) ---
-        if isinstance(value, (int, float)) and (header.startswith('Valor') or header in ['Outras Despesas', 'Valor AFRMM', 'Valor Serviço Trading', 'Frete Nacional']):
-            cell.number_format = currency_format
-        else:
-            # Define o formato de TEXTO para todas as outras células
-            cell.number_format = text_format
-        # --- FIM DA CORREÇÃO 1 ---
+        cell.border = _BORDA_FINA
+        # Moeda só para números em coluna de valor; todo o resto fica como texto.
+        cell.number_format = FORMATO_MOEDA if moeda and isinstance(value, (int, float)) else FORMATO_TEXTO
 
 def add_totals_row(ws, headers):
     last_row = ws.max_row
     if last_row < 2: return
-    totals_row = last_row + 1
-    
-    total_font = Font(bold=True)
-    total_fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    currency_format = 'R$ #,##0.00'
-    text_format = '@' # Define o formato de texto padrão
-
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws.cell(row=totals_row, column=col_idx)
-        cell.font = total_font
-        cell.fill = total_fill
-        cell.border = thin_border
-        
-        if col_idx == 1:
-            cell.value = "TOTAIS"
-            cell.number_format = text_format
-        elif header.startswith('Valor') or header in ['Outras Despesas', 'Valor AFRMM', 'Valor Serviço Trading', 'Frete Nacional']:
-            col_letter = get_column_letter(col_idx)
-            formula = f"=SUM({col_letter}2:{col_letter}{last_row})"
-            cell.value = formula
-            cell.number_format = currency_format
+    esquema = esquema_planilha(headers)
+    for col_idx, (moeda, letra) in enumerate(zip(esquema.moeda, esquema.letras), 1):
+        cell = ws.cell(row=last_row + 1, column=col_idx)
+        cell.font, cell.fill, cell.border = _FONTE_TOTAL, _PREENCHIMENTO_TOTAL, _BORDA_FINA
+        if col_idx == 1: cell.value, cell.number_format = "TOTAIS", FORMATO_TEXTO
+        elif moeda: cell.value, cell.number_format = f"=SUM({letra}2:{letra}{last_row})", FORMATO_MOEDA
+        else: cell.value, cell.number_format = "", FORMATO_TEXTO
+
+# =============================================================================
+# --- Planilhas em streaming (openpyxl write_only) ---
+# Cada linha é gravada direto no arquivo temporário da aba, então a memória não cresce com o
+# número de notas. Os estilos são NamedStyles registrados uma vez por workbook e as linhas saem
+# do EsquemaPlanilha da aba.
+# =============================================================================
+
+def _estilos_planilha():
+    # NamedStyle fica preso ao workbook em que é registrado, então cada PlanilhaStreaming cria os seus.
+    return (
+        NamedStyle('ff_cabecalho', fill=_PREENCHIMENTO_CABECALHO, alignment=_ALINHAMENTO_CABECALHO, border=_BORDA_FINA, number_format=FORMATO_TEXTO),
+        NamedStyle('ff_texto', border=_BORDA_FINA, number_format=FORMATO_TEXTO),
+        NamedStyle('ff_moeda', border=_BORDA_FINA, number_format=FORMATO_MOEDA),
+        # Abas de serviço: sem borda nas linhas de dados, como a planilha sempre foi gerada.
+        NamedStyle('ff_texto_simples', number_format=FORMATO_TEXTO),
+        NamedStyle('ff_moeda_simples', number_format=FORMATO_MOEDA),
+        NamedStyle('ff_total_texto', font=_FONTE_TOTAL, fill=_PREENCHIMENTO_TOTAL, border=_BORDA_FINA, number_format=FORMATO_TEXTO),
+        NamedStyle('ff_total_moeda', font=_FONTE_TOTAL, fill=_PREENCHIMENTO_TOTAL, border=_BORDA_FINA, number_format=FORMATO_MOEDA),
+    )
+
+class PlanilhaStreaming:
+    """Workbook write_only com os estilos da aplicação. Tem save(caminho), como o Workbook comum."""
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        for estilo in _estilos_planilha(): self.wb.add_named_style(estilo)
+        self.abas = []
+
+    def criar_aba(self, titulo, cabecalhos, bordas=True):
+        aba = AbaStreaming(self.wb.create_sheet(titulo), cabecalhos, bordas); self.abas.append(aba)
+        return aba
+
+    def save(self, caminho):
+        for aba in self.abas: aba.fechar()
+        self.wb.save(caminho)
+
+    def descartar(self):
+        """Abandona a planilha sem gravar (ex.: exportação cancelada): o save() num temporário fecha as abas e
+        apaga os arquivos delas, e o temporário é removido em seguida."""
+        descritor, temporario = tempfile.mkstemp(suffix='.xlsx'); os.close(descritor)
+        try: self.wb.save(temporario)
+        finally: os.remove(temporario)
+
+class AbaStreaming:
+    """Uma aba da PlanilhaStreaming: cabeçalho na criação, uma linha por chamada e a linha de totais no fechar()."""
+    def __init__(self, ws, cabecalhos, bordas=True):
+        self.ws = ws; self.esquema = esquema_planilha(cabecalhos); self.linhas = 0; self._fechada = False
+        sufixo = '' if bordas else '_simples'
+        self._estilo_texto, self._estilo_moeda = 'ff_texto' + sufixo, 'ff_moeda' + sufixo
+        ws.append([self._celula(cabecalho, 'ff_cabecalho') for cabecalho in self.esquema.cabecalhos])
+
+    def _celula(self, valor, estilo):
+        # 'estilo' é o nome de um NamedStyle já registrado no workbook (_estilos_planilha).
+        celula = WriteOnlyCell(self.ws, value=valor); celula.style = estilo
+        return celula
+
+    def escrever_nota(self, nota):
+        """Uma linha com os campos da nota na ordem dos cabeçalhos (cabeçalho desconhecido fica vazio)."""
+        self.escrever_linha(self.esquema.valores(nota))
+
+    def escrever_linha(self, valores):
+        """Valores já na ordem dos cabeçalhos; números em coluna de valor recebem o formato de moeda."""
+        texto, moeda = self._estilo_texto, self._estilo_moeda
+        self.ws.append([self._celula(valor, moeda if eh_moeda and isinstance(valor, (int, float)) else texto)
+                        for valor, eh_moeda in zip(valores, self.esquema.moeda)])
+        self.linhas += 1
+
+    def fechar(self):
+        """Acrescenta a linha de TOTAIS (SUM das colunas de valor). Só roda uma vez e só se houver dados."""
+        if self._fechada: return
+        self._fechada = True
+        if not self.linhas: return
+        ultima = self.linhas + 1
+        totais = []
+        for indice, (eh_moeda, letra) in enumerate(zip(self.esquema.moeda, self.esquema.letras), 1):
+            if indice == 1: totais.append(self._celula("TOTAIS", 'ff_total_texto'))
+            elif eh_moeda:
+                totais.append(self._celula(f"=SUM({letra}2:{letra}{ultima})", 'ff_total_moeda'))
+            else: totais.append(self._celula("", 'ff_total_texto'))
+        self.ws.append(totais)
+
+# =============================================================================
+# --- Partição das notas (Entrada/Saída/Serviços de trading) ---
+# =============================================================================
+
+class ParticaoNotas:
+    """
+    Notas separadas por tipo, com o nº de Saídas por processo e as notas de serviço de trading (Entradas
+    com valor de trading), indexadas por uma chave (o caminho do arquivo). É montada numa passada e mantida
+    com adicionar/remover/atualizar, sem percorrer o lote de novo; a pré-visualização e a Planilha Completa
+    leem daqui. A divisão dos serviços em autorizados/pendentes depende das contagens confirmadas no painel
+    e só percorre as notas de serviço.
+    """
+    def __init__(self, pares=()):
+        self._registros = {}; self._chave_por_id = {}
+        # dicts (chave -> nota) mantêm a ordem de chegada e removem em O(1).
+        self._saida = {}; self._nao_saida = {}; self._entrada = {}; self._servicos = {}
+        self.saidas_por_processo = defaultdict(int); self.saidas_canceladas_por_processo = defaultdict(int)
+        for chave, nota in pares: self.adicionar(chave, nota)
+
+    def __len__(self): return len(self._registros)
+
+    def copia_notas(self):
+        """
+        Cópia com as próprias notas copiadas, para ser lida em outra thread (ex.: gravação da planilha) com o
+        estado de agora, imune às edições feitas depois na tela.
+        """
+        return ParticaoNotas((chave, nota.copy()) for chave, (nota, _) in self._registros.items())
+
+    @staticmethod
+    def _registro(nota):
+        return (nota.get('tipo_nota'), nota.get('processo_normalizado', 'N/A'), 'Cancelada' in nota.get('status_nf', ''),
+                nota.get('valor_servico_trading', 0.0) > 0.0 and nota.get('tipo_nota') == 'Entrada')
+
+    def _contar(self, registro, sinal):
+        tipo, processo, cancelada, _ = registro
+        if tipo != 'Saída': return
+        self.saidas_por_processo[processo] += sinal
+        if cancelada: self.saidas_canceladas_por_processo[processo] += sinal
+
+    def adicionar(self, chave, nota):
+        if chave in self._registros: self.remover(chave)
+        registro = self._registro(nota)
+        self._registros[chave] = (nota, registro); self._chave_por_id[id(nota)] = chave
+        (self._saida if registro[0] == 'Saída' else self._nao_saida)[chave] = nota
+        if registro[0] == 'Entrada': self._entrada[chave] = nota
+        if registro[3]: self._servicos[chave] = nota
+        self._contar(registro, 1)
+
+    def remover(self, chave):
+        nota, registro = self._registros.pop(chave, (None, None))
+        if nota is None: return
+        self._chave_por_id.pop(id(nota), None)
+        for grupo in (self._saida, self._nao_saida, self._entrada, self._servicos): grupo.pop(chave, None)
+        self._contar(registro, -1)
+
+    def atualizar(self, notas):
+        """Refaz a classificação de notas editadas no próprio objeto (ex.: status alterado na pré-visualização)."""
+        for nota in notas:
+            chave = self._chave_por_id.get(id(nota))
+            if chave is None: continue
+            antigo = self._registros[chave][1]; novo = self._registro(nota)
+            if novo == antigo: continue
+            if novo[0] != antigo[0]: self.adicionar(chave, nota); continue  # mudou de tipo: vai para o fim da outra lista
+            self._contar(antigo, -1); self._contar(novo, 1); self._registros[chave] = (nota, novo)
+            if novo[3] and not antigo[3]:
+                # Passou a ser serviço (raro): refaz a lista para manter a ordem de chegada.
+                self._servicos = {c: n for c, (n, registro) in self._registros.items() if registro[3]}
+            elif antigo[3] and not novo[3]: self._servicos.pop(chave, None)
+
+    @property
+    def saida(self): return list(self._saida.values())
+
+    @property
+    def entrada(self):
+        """Só as notas de Entrada (sem os eventos de cancelamento, que não têm tipo)."""
+        return list(self._entrada.values())
+
+    @property
+    def entrada_planilha(self):
+        """Tudo o que não é Saída, como na aba Entrada da planilha (inclui os eventos de cancelamento)."""
+        return list(self._nao_saida.values())
+
+    def contagem_saida(self, processo, incluir_canceladas=False):
+        total = self.saidas_por_processo.get(processo, 0)
+        return total if incluir_canceladas else total - self.saidas_canceladas_por_processo.get(processo, 0)
+
+    def servicos(self, contagens_confirmadas, incluir_canceladas=False):
+        """
+        (autorizados, pendentes), com pendentes = [(nota, encontradas, esperada, a emitir)]. O serviço é autorizado
+        quando o nº de Saídas do processo bate com o esperado informado no painel, ou, sem esperado informado,
+        quando há ao menos uma Saída. A pré-visualização ignora as notas canceladas; a Planilha Completa sempre
+        as considerou (incluir_canceladas=True).
+        """
+        autorizados, pendentes = [], []
+        for nota in self._servicos.values():
+            if not incluir_canceladas and 'Cancelada' in nota.get('status_nf', ''): continue
+            processo = nota.get('processo_normalizado', 'N/A')
+            encontradas = self.contagem_saida(processo, incluir_canceladas)
+            esperada = (contagens_confirmadas.get(processo) or {}).get('esperado')
+            if (esperada is not None and encontradas == esperada) or (encontradas > 0 and processo not in contagens_confirmadas):
+                autorizados.append(nota)
+            else:
+                pendentes.append((nota, encontradas, esperada, esperada - encontradas if esperada is not None else 'N/A'))
+        return autorizados, pendentes
+
+STATUS_CANCELADA_EVENTO = "Cancelada (Evento)"
+
+def cancelar_nota(nota, status="Cancelada (Manual)"):
+    """Marca a nota como cancelada e zera os valores (reversível com nota.reverter())."""
+    nota.editar(status_nf=status, valor_total_nf=0.0, valor_total_produtos=0.0, valor_frete_nacional=0.0,
+                vII=0.0, vAFRMM=0.0, vOutras=0.0, impostos={})
+
+def _eh_cancelamento(nota):
+    """Registro gerado por um evento 110111 ou por um arquivo CANCELADA_ (não tem tipo de nota)."""
+    return nota.get('tipo_nota') == 'N/A' and 'Cancelada' in nota.get('status_nf', '')
+
+class IndiceChaves:
+    """
+    Notas e cancelamentos do lote por chave de acesso, indexados pela mesma chave das outras estruturas (o
+    caminho do arquivo). Um cancelamento neutraliza as notas Autorizadas de mesma chave de acesso, chegue
+    antes ou depois delas, e quando sai do lote as notas que ele neutralizou voltam ao original. adicionar e
+    remover custam O(1) por arquivo e devolvem as notas alteradas, para o chamador repassar às outras
+    estruturas (atualizar).
+    """
+    def __init__(self, pares=()):
+        self._notas = {}; self._cancelamentos = {}  # chave de acesso -> {caminho: nota}
+        self._chave_por_caminho = {}  # caminho -> (chave de acesso, é cancelamento)
+        self._neutralizadas = {}  # id(nota) -> nota
+        for caminho, nota in pares: self.adicionar(caminho, nota)
+
+    def __len__(self): return len(self._chave_por_caminho)
+
+    @property
+    def neutralizadas(self):
+        """Notas canceladas automaticamente que continuam assim (a pré-visualização pode revertê-las)."""
+        return [nota for nota in self._neutralizadas.values() if nota.get('status_nf') == STATUS_CANCELADA_EVENTO]
+
+    def caminhos(self, chave, cancelamento=False):
+        """Caminhos já carregados com a chave de acesso: os das notas ou, com 'cancelamento', os dos cancelamentos."""
+        return tuple((self._cancelamentos if cancelamento else self._notas).get(chave, ()))
+
+    def cancelamento_de(self, nota):
+        """Algum registro de cancelamento com a chave de acesso da nota, ou None."""
+        cancelamentos = self._cancelamentos.get(nota.get('chave_acesso'))
+        return next(iter(cancelamentos.values())) if cancelamentos else None
+
+    def adicionar(self, caminho, nota):
+        alteradas = self.remover(caminho) if caminho in self._chave_por_caminho else []
+        chave = nota.get('chave_acesso', 'N/A')
+        if not chave or chave == 'N/A': return alteradas
+        cancelamento = _eh_cancelamento(nota)
+        self._chave_por_caminho[caminho] = (chave, cancelamento)
+        if cancelamento:
+            self._cancelamentos.setdefault(chave, {})[caminho] = nota
+            alteradas += [n for n in self._notas.get(chave, {}).values() if self._neutralizar(n)]
         else:
-            # Esta seção já estava correta
-            cell.value = ""
-            cell.number_format = text_format
+            self._notas.setdefault(chave, {})[caminho] = nota
+            if chave in self._cancelamentos and self._neutralizar(nota): alteradas.append(nota)
+        return alteradas
+
+    def remover(self, caminho):
+        chave, cancelamento = self._chave_por_caminho.pop(caminho, (None, None))
+        if chave is None: return []
+        grupo = self._cancelamentos if cancelamento else self._notas
+        nota = grupo[chave].pop(caminho)
+        if not grupo[chave]: del grupo[chave]
+        if not cancelamento:
+            self._neutralizadas.pop(id(nota), None); return []
+        if chave in self._cancelamentos: return []  # ainda há outro cancelamento da mesma nota
+        return [n for n in self._notas.get(chave, {}).values() if self._restaurar(n)]
+
+    def _neutralizar(self, nota):
+        if nota.get('status_nf') != 'Autorizada': return False
+        cancelar_nota(nota, STATUS_CANCELADA_EVENTO); self._neutralizadas[id(nota)] = nota
+        return True
+
+    def _restaurar(self, nota):
+        if self._neutralizadas.pop(id(nota), None) is None or nota.get('status_nf') != STATUS_CANCELADA_EVENTO: return False
+        return nota.reverter()
+
+# progress_callback(notas escritas, total) é chamado a cada tantas notas e no fim.
+INTERVALO_PROGRESSO_PLANILHA = 500
+
+def montar_planilha_basica(dados_extraidos, planilha=None, progress_callback=None):
+    """Abas Saída/Entrada com os campos básicos de cada nota. 'planilha' é o escritor (padrão: PlanilhaStreaming)."""
+    planilha = planilha if planilha is not None else PlanilhaStreaming()
+    saida, entrada = planilha.criar_aba("Saída", CABECALHOS_BASICOS), planilha.criar_aba("Entrada", CABECALHOS_BASICOS)
+    total = len(dados_extraidos)
+    for indice, dados in enumerate(dados_extraidos, 1):
+        (saida if dados['tipo_nota'] == "Saída" else entrada).escrever_nota(dados)
+        if progress_callback and indice % INTERVALO_PROGRESSO_PLANILHA == 0: progress_callback(indice, total)
+    if progress_callback: progress_callback(total, total)
+    return planilha
+
+def montar_planilha_completa(dados_extraidos, contagens_confirmadas, planilha=None, progress_callback=None):
+    """
+    Abas Saída/Entrada completas e as abas de serviços de trading (autorizados/pendentes, ver ParticaoNotas.servicos).
+    'dados_extraidos' pode ser a lista de notas ou uma ParticaoNotas já montada. 'planilha' é o escritor
+    (padrão: PlanilhaStreaming; outros formatos em export_logic).
+    """
+    particao = dados_extraidos if isinstance(dados_extraidos, ParticaoNotas) else ParticaoNotas(enumerate(dados_extraidos))
+    planilha = planilha if planilha is not None else PlanilhaStreaming()
+    saida, entrada = planilha.criar_aba("Saída", CABECALHOS_COMPLETOS), planilha.criar_aba("Entrada", CABECALHOS_COMPLETOS)
+    servicos = planilha.criar_aba("Serviços Autorizados", CABECALHOS_SERVICO, bordas=False)
+    pendentes = planilha.criar_aba("Serviços Pendentes", CABECALHOS_PENDENTES, bordas=False)
+    total, indice = len(particao), 0
+    for aba, notas in ((saida, particao.saida), (entrada, particao.entrada_planilha)):
+        for dados in notas:
+            indice += 1
+            if progress_callback and indice % INTERVALO_PROGRESSO_PLANILHA == 0: progress_callback(indice, total)
+            aba.escrever_nota(dados)
+    autorizados, nao_autorizados = particao.servicos(contagens_confirmadas, incluir_canceladas=True)
+    def linha_servico(dados): return [dados['numero_nf'], dados['nome_cliente'], dados['data_emissao'], dados.get('sistema_emissor'), dados['nome_processo'], dados['valor_servico_trading']]
+    for dados in autorizados: servicos.escrever_linha(linha_servico(dados))
+    for dados, encontradas, esperada, a_emitir in nao_autorizados: pendentes.escrever_linha(linha_servico(dados) + [encontradas, esperada, a_emitir])
+    if progress_callback: progress_callback(total, total)
+    return planilha
 
 def check_for_updates(current_version, repo_owner, repo_name):
     api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/releases/latest"
@@ -475,4 +1405,4 @@ def calcular_dados_dashboard(dados_extraidos):
                 processos_saida_contagem[processo_norm] += 1
 
     processos_pendentes = {p: c for p, c in processos_saida_contagem.items() if c > 1}
-    return {'resumo_geral': resumo, 'processos_pendentes': processos_pendentes}
\ No newline at end of file
+    return {'resumo_geral': resumo, 'processos_pendentes': processos_pendentes}
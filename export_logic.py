@@ -0,0 +1,170 @@
+# =============================================================================
+# --- ARQUIVO: export_logic.py ---
+# (Escritores de relatório intercambiáveis para as planilhas de NFe: Excel formatado
+#  (openpyxl), Excel rápido (xlsxwriter) e CSV no padrão brasileiro)
+# =============================================================================
+#
+# Todo escritor tem a mesma interface da core_logic.PlanilhaStreaming:
+#   criar_aba(titulo, cabecalhos, bordas=True) -> aba com escrever_nota(nota) e escrever_linha(valores)
+#   save(caminho)                              -> grava o resultado final
+#   descartar()                                -> abandona sem gravar (exportação cancelada)
+# e pode ser passado para core_logic.montar_planilha_basica/montar_planilha_completa.
+
+import os
+import csv
+import shutil
+import logging
+import tempfile
+
+import core_logic
+import format_logic
+
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+# formato -> (rótulo para a tela, extensão)
+FORMATOS_RELATORIO = {
+    'xlsx': ("Excel formatado (mais lento)", '.xlsx'),
+    'xlsx_rapido': ("Excel rápido (formatação básica)", '.xlsx'),
+    'csv': ("CSV para colar em outro sistema (mais rápido)", '.csv'),
+}
+FORMATO_PADRAO = 'xlsx'
+TAMANHO_BUFFER = 1024 * 1024
+
+def formato_disponivel(formato):
+    if formato == 'xlsx_rapido': return XLSXWRITER_AVAILABLE
+    return formato in FORMATOS_RELATORIO
+
+def formatos_disponiveis():
+    return [formato for formato in FORMATOS_RELATORIO if formato_disponivel(formato)]
+
+def extensao_formato(formato):
+    return FORMATOS_RELATORIO.get(formato, FORMATOS_RELATORIO[FORMATO_PADRAO])[1]
+
+def criar_escritor(formato=None):
+    """Escritor do formato pedido; sem a biblioteca necessária, cai no Excel formatado."""
+    formato = formato or FORMATO_PADRAO
+    if not formato_disponivel(formato):
+        logging.warning(f"Formato de relatório '{formato}' indisponível; usando '{FORMATO_PADRAO}'.")
+        formato = FORMATO_PADRAO
+    if formato == 'csv': return PlanilhaCSV()
+    if formato == 'xlsx_rapido': return PlanilhaXlsxWriter()
+    return core_logic.PlanilhaStreaming()
+
+# =============================================================================
+# --- CSV (um arquivo por aba, ';' como separador e ',' como decimal) ---
+# =============================================================================
+
+class PlanilhaCSV:
+    """
+    Cada aba vira '<nome escolhido> - <aba>.csv'. As linhas vão para um arquivo temporário com
+    buffer grande conforme são produzidas e só são copiadas para o destino no save().
+    """
+    def __init__(self):
+        self.abas = []; self.arquivos = []
+
+    def criar_aba(self, titulo, cabecalhos, bordas=True):
+        aba = AbaCSV(titulo, cabecalhos); self.abas.append(aba)
+        return aba
+
+    def save(self, caminho):
+        base, extensao = os.path.splitext(caminho)
+        self.arquivos = []
+        for aba in self.abas:
+            destino = f"{base} - {aba.titulo}{extensao or '.csv'}"
+            aba.gravar_em(destino); self.arquivos.append(destino)
+
+    def descartar(self):
+        for aba in self.abas: aba._arquivo.close()
+
+class AbaCSV:
+    def __init__(self, titulo, cabecalhos):
+        self.titulo = titulo; self.esquema = core_logic.esquema_planilha(cabecalhos); self.linhas = 0
+        self._arquivo = tempfile.TemporaryFile('w+', encoding='utf-8', newline='', buffering=TAMANHO_BUFFER)
+        self._csv = csv.writer(self._arquivo, delimiter=';')
+        self._csv.writerow(self.esquema.cabecalhos)
+
+    def escrever_nota(self, nota):
+        self.escrever_linha(self.esquema.valores(nota))
+
+    def escrever_linha(self, valores):
+        # Valores em coluna de moeda saem com 2 casas e vírgula ("1234,50"), sem separador de milhar.
+        self._csv.writerow([format_logic.decimal_br(valor) if moeda and isinstance(valor, float) else valor
+                            for valor, moeda in zip(valores, self.esquema.moeda)])
+        self.linhas += 1
+
+    def gravar_em(self, destino):
+        # utf-8 com BOM: o Excel em português abre o arquivo com acentos e ';' corretos.
+        self._arquivo.seek(0)
+        with open(destino, 'w', encoding='utf-8-sig', newline='') as saida: shutil.copyfileobj(self._arquivo, saida, TAMANHO_BUFFER)
+        self._arquivo.close()
+
+# =============================================================================
+# --- Excel rápido (xlsxwriter em constant_memory) ---
+# =============================================================================
+
+class PlanilhaXlsxWriter:
+    """
+    Excel gerado pelo xlsxwriter: os formatos são criados uma vez e cada célula é gravada direto com o
+    seu, sem objeto de célula. Bordas e formatos só nas células com dados (set_column levaria a borda para
+    as linhas vazias da coluna inteira). Totais com fórmulas SUM, como no Excel formatado.
+    O arquivo é montado num temporário e movido para o destino no save().
+    """
+    def __init__(self):
+        descritor, self._temporario = tempfile.mkstemp(suffix='.xlsx'); os.close(descritor)
+        # Texto nunca vira fórmula/link/número (ex.: CNPJ com zeros à esquerda, processo começando com '=').
+        self.wb = xlsxwriter.Workbook(self._temporario, {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False, 'strings_to_numbers': False})
+        borda = {'border': 1}
+        self.formatos = {
+            'cabecalho': self.wb.add_format({**borda, 'bg_color': '#FFFF00', 'align': 'center', 'valign': 'vcenter', 'num_format': core_logic.FORMATO_TEXTO}),
+            'texto': self.wb.add_format({**borda, 'num_format': core_logic.FORMATO_TEXTO}),
+            'moeda': self.wb.add_format({**borda, 'num_format': core_logic.FORMATO_MOEDA}),
+            'texto_simples': self.wb.add_format({'num_format': core_logic.FORMATO_TEXTO}),
+            'moeda_simples': self.wb.add_format({'num_format': core_logic.FORMATO_MOEDA}),
+            'total_texto': self.wb.add_format({**borda, 'bold': True, 'bg_color': '#DDDDDD', 'num_format': core_logic.FORMATO_TEXTO}),
+            'total_moeda': self.wb.add_format({**borda, 'bold': True, 'bg_color': '#DDDDDD', 'num_format': core_logic.FORMATO_MOEDA}),
+        }
+        self.abas = []
+
+    def criar_aba(self, titulo, cabecalhos, bordas=True):
+        aba = AbaXlsxWriter(self, self.wb.add_worksheet(titulo), cabecalhos, bordas); self.abas.append(aba)
+        return aba
+
+    def save(self, caminho):
+        for aba in self.abas: aba.fechar()
+        self.wb.close()
+        shutil.move(self._temporario, caminho)
+
+    def descartar(self):
+        # O close() é o que libera os temporários das abas (constant_memory); o .xlsx montado é apagado.
+        self.wb.close(); os.remove(self._temporario)
+
+class AbaXlsxWriter:
+    def __init__(self, planilha, ws, cabecalhos, bordas=True):
+        self.ws = ws; self.formatos = planilha.formatos; self.esquema = core_logic.esquema_planilha(cabecalhos)
+        self.linhas = 0; self._fechada = False
+        sufixo = '' if bordas else '_simples'
+        self._formato_texto, self._formato_moeda = self.formatos['texto' + sufixo], self.formatos['moeda' + sufixo]
+        ws.write_row(0, 0, self.esquema.cabecalhos, self.formatos['cabecalho'])
+
+    def escrever_nota(self, nota):
+        self.escrever_linha(self.esquema.valores(nota))
+
+    def escrever_linha(self, valores):
+        # Como no Excel formatado: moeda só para números em coluna de valor, texto no resto (vazios com borda).
+        self.linhas += 1; ws, linha, texto, moeda = self.ws, self.linhas, self._formato_texto, self._formato_moeda
+        for coluna, (valor, eh_moeda) in enumerate(zip(valores, self.esquema.moeda)):
+            ws.write(linha, coluna, valor, moeda if eh_moeda and isinstance(valor, (int, float)) else texto)
+
+    def fechar(self):
+        if self._fechada: return
+        self._fechada = True
+        if not self.linhas: return
+        linha_totais, ultima = self.linhas + 1, self.linhas + 1
+        for coluna, (moeda, letra) in enumerate(zip(self.esquema.moeda, self.esquema.letras)):
+            if coluna == 0: self.ws.write_string(linha_totais, 0, "TOTAIS", self.formatos['total_texto'])
+            elif moeda: self.ws.write_formula(linha_totais, coluna, f"=SUM({letra}2:{letra}{ultima})", self.formatos['total_moeda'])
+            else: self.ws.write_blank(linha_totais, coluna, None, self.formatos['total_texto'])
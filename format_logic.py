@@ -0,0 +1,41 @@
+# =============================================================================
+# --- ARQUIVO: format_logic.py ---
+# (Formatação de valores no padrão brasileiro (R$ 1.234,56) usada pelas telas e
+#  pelas exportações em texto; uma versão por valor e outra para colunas inteiras)
+# =============================================================================
+
+from functools import lru_cache
+
+# "1,234.56" -> "1.234,56" numa única passada (no lugar de três replace com um caractere auxiliar).
+_TROCA_SEPARADORES = str.maketrans(",.", ".,")
+
+def _moeda(valor):
+    return "R$ " + format(valor, ",.2f").translate(_TROCA_SEPARADORES)
+
+@lru_cache(maxsize=4096)
+def moeda_br(valor):
+    """1234.5 -> 'R$ 1.234,50'. Valores repetidos (zeros, principalmente) vêm do cache."""
+    return _moeda(valor)
+
+def decimal_br(valor):
+    """1234.5 -> '1234,50' (sem separador de milhar), para CSV e textos que serão lidos por outros sistemas."""
+    return ("%.2f" % valor).replace(".", ",")
+
+def formatar_moedas(valores):
+    """
+    Formata uma coluna inteira de valores. Cada valor distinto é formatado uma vez só (nas colunas de
+    impostos quase tudo é 0,00); números viram 'R$ ...', None vira '' e textos (ex.: 'N/A') são mantidos.
+    """
+    cache = {}
+    saida = []
+    for valor in valores:
+        # A chave leva o tipo: True, 1 e 1.0 são iguais como chave de dicionário, mas True não é moeda.
+        chave = (type(valor), valor)
+        texto = cache.get(chave)
+        if texto is None:
+            if valor is None: texto = ''
+            elif isinstance(valor, (int, float)) and not isinstance(valor, bool): texto = _moeda(valor)
+            else: texto = valor
+            cache[chave] = texto
+        saida.append(texto)
+    return saida
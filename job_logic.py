@@ -0,0 +1,171 @@
+# =============================================================================
+# --- ARQUIVO: job_logic.py ---
+# (Fila de tarefas em segundo plano para exportações e relatórios: uma thread
+#  executa as tarefas na ordem em que chegam, com progresso, cancelamento e histórico)
+# =============================================================================
+#
+# Uso na interface:
+#   fila = FilaTarefas(agendar=lambda funcao, *args: janela.after(0, funcao, *args))
+#   fila.enviar("Planilha Completa", executar, ao_concluir=..., ao_falhar=...)
+# 'executar(tarefa)' roda na thread da fila e informa o andamento com tarefa.progresso(atual, total);
+# é nessa chamada que o cancelamento é percebido. Todos os retornos (ao_concluir, ao_falhar,
+# ao_progresso e os ouvintes da fila) passam por 'agendar', ou seja, chegam na thread do Tk.
+# Para trabalhos fora da fila (a extração), CanalProgresso(janela.after, ao_atualizar).iniciar()
+# recebe o progresso de qualquer thread e atualiza a interface a no máximo 10 quadros por segundo.
+
+import queue
+import logging
+import itertools
+import threading
+import time
+from datetime import datetime
+
+class TarefaCancelada(BaseException):
+    """
+    Levantada por Tarefa.progresso() quando o usuário cancela. Herda de BaseException (como o
+    CancelledError do asyncio) para atravessar os 'except Exception' das rotinas de exportação.
+    """
+
+NA_FILA, EXECUTANDO, CONCLUIDA, CANCELADA, ERRO = "Na fila", "Executando", "Concluída", "Cancelada", "Erro"
+FINALIZADAS = (CONCLUIDA, CANCELADA, ERRO)
+INTERVALO_PROGRESSO = 0.1  # segundos entre avisos de progresso para a interface
+
+class Tarefa:
+    """Uma exportação enviada para a FilaTarefas, com o estado que aparece no histórico."""
+    def __init__(self, id_tarefa, titulo, funcao, ao_concluir=None, ao_falhar=None, ao_progresso=None):
+        self.id = id_tarefa; self.titulo = titulo; self.funcao = funcao
+        self.ao_concluir = ao_concluir; self.ao_falhar = ao_falhar; self.ao_progresso = ao_progresso
+        self.status = NA_FILA; self.atual = 0; self.total = 0; self.mensagem = ""
+        self.resultado = None; self.erro = None
+        self.criada_em = datetime.now(); self.iniciada_em = None; self.concluida_em = None
+        self._cancelamento = threading.Event(); self._fila = None; self._ultimo_aviso = 0.0
+
+    @property
+    def finalizada(self): return self.status in FINALIZADAS
+
+    @property
+    def cancelamento_pedido(self): return self._cancelamento.is_set()
+
+    @property
+    def duracao(self):
+        """Segundos de execução (até agora, se ainda estiver rodando)."""
+        if self.iniciada_em is None: return None
+        return ((self.concluida_em or datetime.now()) - self.iniciada_em).total_seconds()
+
+    @property
+    def percentual(self): return int(100 * self.atual / self.total) if self.total else (100 if self.status == CONCLUIDA else 0)
+
+    def cancelar(self): self._cancelamento.set()
+
+    def progresso(self, atual, total, mensagem=None):
+        """Chamado pela própria tarefa. Levanta TarefaCancelada se o usuário pediu o cancelamento."""
+        if self._cancelamento.is_set(): raise TarefaCancelada()
+        self.atual, self.total = atual, total
+        if mensagem: self.mensagem = mensagem
+        agora = time.monotonic()
+        if agora - self._ultimo_aviso >= INTERVALO_PROGRESSO or atual >= total:
+            self._ultimo_aviso = agora
+            if self._fila is not None: self._fila._avisar(self, self.ao_progresso, self)
+
+class FilaTarefas:
+    """Executa as tarefas uma de cada vez, numa thread própria criada na primeira tarefa enviada."""
+    LIMITE_HISTORICO = 50
+
+    def __init__(self, agendar=None):
+        self.agendar = agendar or (lambda funcao, *args: funcao(*args))
+        self.tarefas = []; self.ouvintes = []
+        self._fila = queue.Queue(); self._ids = itertools.count(1); self._lock = threading.Lock(); self._thread = None
+
+    def enviar(self, titulo, funcao, ao_concluir=None, ao_falhar=None, ao_progresso=None):
+        tarefa = Tarefa(next(self._ids), titulo, funcao, ao_concluir, ao_falhar, ao_progresso); tarefa._fila = self
+        with self._lock:
+            self.tarefas.append(tarefa); self._podar_historico()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name="FilaTarefas", daemon=True); self._thread.start()
+        self._fila.put(tarefa); self._avisar(tarefa)
+        logging.info(f"Tarefa #{tarefa.id} '{titulo}' adicionada à fila.")
+        return tarefa
+
+    def cancelar(self, tarefa):
+        """A tarefa na fila é descartada quando chegar a vez dela; a que está rodando para no próximo progresso()."""
+        if tarefa.finalizada: return
+        tarefa.cancelar(); self._avisar(tarefa)
+
+    def cancelar_todas(self):
+        for tarefa in list(self.tarefas): self.cancelar(tarefa)
+
+    def pendentes(self):
+        return [tarefa for tarefa in self.tarefas if not tarefa.finalizada]
+
+    def limpar_historico(self):
+        with self._lock: self.tarefas = self.pendentes()
+        self._avisar(None)
+
+    def encerrar(self):
+        """Cancela o que estiver pendente e encerra a thread da fila."""
+        self.cancelar_todas(); self._fila.put(None)
+
+    def _podar_historico(self):
+        excedente = len(self.tarefas) - self.LIMITE_HISTORICO
+        if excedente > 0:
+            finalizadas = [tarefa for tarefa in self.tarefas if tarefa.finalizada][:excedente]
+            self.tarefas = [tarefa for tarefa in self.tarefas if tarefa not in finalizadas]
+
+    def _avisar(self, tarefa, retorno=None, *args):
+        """Repassa o retorno da tarefa (se houver) e avisa os ouvintes, sempre via agendar()."""
+        if retorno is not None: self.agendar(retorno, *args)
+        for ouvinte in list(self.ouvintes): self.agendar(ouvinte, tarefa)
+
+    def _executar(self):
+        while True:
+            tarefa = self._fila.get()
+            if tarefa is None: return
+            if tarefa.cancelamento_pedido:
+                tarefa.status = CANCELADA; tarefa.concluida_em = datetime.now(); self._avisar(tarefa); continue
+            tarefa.status = EXECUTANDO; tarefa.iniciada_em = datetime.now(); self._avisar(tarefa)
+            retorno, args = None, ()
+            try:
+                tarefa.resultado = tarefa.funcao(tarefa)
+                tarefa.status = CONCLUIDA; tarefa.atual = tarefa.total
+                retorno, args = tarefa.ao_concluir, (tarefa.resultado,)
+            except TarefaCancelada:
+                tarefa.status = CANCELADA; tarefa.mensagem = "Cancelada pelo usuário."
+            except Exception as e:
+                logging.error(f"Erro na tarefa #{tarefa.id} '{tarefa.titulo}'.", exc_info=True)
+                tarefa.status = ERRO; tarefa.erro = e; tarefa.mensagem = str(e)
+                retorno, args = tarefa.ao_falhar, (e,)
+            tarefa.concluida_em = datetime.now()
+            logging.info(f"Tarefa #{tarefa.id} '{tarefa.titulo}': {tarefa.status} em {tarefa.duracao:.2f}s.")
+            self._avisar(tarefa, retorno, *args)
+
+class CanalProgresso:
+    """
+    Progresso de um trabalho em outra thread (extração) repassado à interface num ritmo fixo.
+    informar() só guarda o último estado, sob um lock, e pode ser chamado por arquivo sem custo;
+    a cada 'intervalo' um pulso agendado na thread do Tk entrega o estado a ao_atualizar(atual, total),
+    apenas se ele mudou. encerrar() (na thread do Tk) para os pulsos e entrega o estado final.
+    'agendar_depois(ms, funcao)' é o after() da janela.
+    """
+    def __init__(self, agendar_depois, ao_atualizar, intervalo=INTERVALO_PROGRESSO):
+        self.agendar_depois = agendar_depois; self.ao_atualizar = ao_atualizar
+        self.intervalo_ms = max(1, int(intervalo * 1000))
+        self._lock = threading.Lock(); self._estado = None; self._entregue = None; self._ativo = False
+
+    def iniciar(self):
+        self._ativo = True; self.agendar_depois(self.intervalo_ms, self._pulsar)
+        return self
+
+    def informar(self, atual, total):
+        with self._lock: self._estado = (atual, total)
+
+    def encerrar(self):
+        self._ativo = False; self._entregar()
+
+    def _entregar(self):
+        with self._lock: estado = self._estado
+        if estado is not None and estado != self._entregue:
+            self._entregue = estado; self.ao_atualizar(*estado)
+
+    def _pulsar(self):
+        if not self._ativo: return
+        self._entregar(); self.agendar_depois(self.intervalo_ms, self._pulsar)
@@ -10,6 +10,7 @@ import tkinter as tk
 from tkinter import messagebox
 import configparser
 import logging
+import multiprocessing
 from datetime import datetime
 import ttkbootstrap as ttk
 from PIL import Image, ImageTk
@@ -40,6 +41,8 @@ from ui.dialogs_flow import (UpdateDownloadWindow, DashboardWindow, PreviewWindo
 from ui.dialogs_tools import (SettingsWindow, ValidatorWindow, KeyParserWindow)
 from ui.dialogs_dev import (TestRunnerWindow)
 from ui.dialogs_clients import (ClientCodeManagerWindow, ClientCodeReportWindow)
+from ui.dialogs_jobs import (TarefasWindow)
+from ui.dialogs_metrics import (DesempenhoWindow)
 
 
 import core_logic
@@ -49,6 +52,11 @@ import support_logic
 import client_logic
 import report_logic
 import drive_logic # Mantida a importação corrigida
+import cache_logic
+import metrics_logic
+import source_logic
+import export_logic
+import job_logic
 
 # --- CONSTANTES GLOBAIS ---
 APP_NAME = "CustomsFlow"
@@ -88,7 +96,9 @@ try:
         log_dir = os.path.abspath(os.path.dirname(__file__))
     if not os.path.exists(log_dir): os.makedirs(log_dir)
     log_file_path = os.path.join(log_dir, 'debug.log')
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filename=log_file_path, filemode='w')
+    # Os processos do pool de extração reimportam este módulo; só o processo principal recria o log.
+    if multiprocessing.current_process().name == 'MainProcess' and '--multiprocessing-fork' not in sys.argv:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filename=log_file_path, filemode='w')
 except Exception as e:
     messagebox.showerror("Erro Crítico de Log", f"Não foi possível criar o arquivo de log.\nErro: {e}")
 
@@ -98,6 +108,9 @@ class App(ttk.Window):
 
         auth_logic.set_resource_path_getter(self.resource_path)
         drive_logic.set_resource_path_getter(self.resource_path)
+        cache_logic.set_cache_dir(log_dir)
+        cache_logic.remover_versoes_antigas(core_logic.VERSAO_EXTRATOR)
+        metrics_logic.set_metrics_dir(log_dir)
 
         try:
             auth_logic.initialize_firebase()
@@ -108,6 +121,8 @@ class App(ttk.Window):
 
         self.current_user = None; self.CURRENT_VERSION = CURRENT_VERSION; self.RELEASE_NOTES = RELEASE_NOTES
         self.image_cache = {}; self.cache = {"companies": None, "payroll_codes": None, "sectors": None, "employees": {}}
+        # Exportações rodam numa fila em segundo plano; os retornos voltam para a thread do Tk pelo after().
+        self.tarefas = job_logic.FilaTarefas(agendar=lambda funcao, *args: self.after(0, funcao, *args))
         logging.info(f"Iniciando {APP_NAME} V{self.CURRENT_VERSION}.")
         self.title(f"Customs Flow")
         self.withdraw()
@@ -207,10 +222,20 @@ class App(ttk.Window):
         self.theme = self.app_config.get('Preferences', 'theme', fallback='superhero')
         self.confirm_on_exit = self.app_config.getboolean('Preferences', 'confirm_on_exit', fallback=True)
         self.ask_to_open_excel = self.app_config.getboolean('Preferences', 'ask_to_open_excel', fallback=True)
+        self.detailed_log = self.app_config.getboolean('Preferences', 'detailed_log', fallback=False); self.apply_log_level()
+        self.extraction_engine = self.app_config.get('Preferences', 'extraction_engine', fallback=core_logic.MOTOR_PADRAO)
+        if self.extraction_engine not in core_logic.MOTORES_EXTRACAO: self.extraction_engine = core_logic.MOTOR_PADRAO
+        # Arquivos lidos à frente do parser; só no config.ini (0 desliga, valores maiores ajudam em NAS/OneDrive).
+        self.read_ahead_depth = max(0, self.app_config.getint('Preferences', 'read_ahead_depth', fallback=source_logic.PROFUNDIDADE_LEITURA))
+        self.report_format = self.app_config.get('Preferences', 'report_format', fallback=export_logic.FORMATO_PADRAO)
+        if not export_logic.formato_disponivel(self.report_format): self.report_format = export_logic.FORMATO_PADRAO
         self.default_xml_path = self.app_config.get('Paths', 'default_xml_path', fallback='')
         self.default_output_path = self.app_config.get('Paths', 'default_output_path', fallback='')
         self.output_filename_pattern = self.app_config.get('Paths', 'output_filename_pattern', fallback='Relatorio_NFe_{data}')
         self.app_style.theme_use(self.theme)
+    def apply_log_level(self):
+        # Linhas por arquivo (ignorados, cópias, cancelados pelo nome) são DEBUG: só entram no log detalhado.
+        logging.getLogger().setLevel(logging.DEBUG if self.detailed_log else logging.INFO)
     def save_config(self):
         for section in ['General', 'Preferences', 'Paths']:
             if not self.app_config.has_section(section): self.app_config.add_section(section)
@@ -218,6 +243,10 @@ class App(ttk.Window):
         self.app_config.set('Preferences', 'theme', self.app_style.theme.name)
         self.app_config.set('Preferences', 'confirm_on_exit', str(self.confirm_on_exit))
         self.app_config.set('Preferences', 'ask_to_open_excel', str(self.ask_to_open_excel))
+        self.app_config.set('Preferences', 'detailed_log', str(self.detailed_log))
+        self.app_config.set('Preferences', 'extraction_engine', self.extraction_engine)
+        self.app_config.set('Preferences', 'read_ahead_depth', str(self.read_ahead_depth))
+        self.app_config.set('Preferences', 'report_format', self.report_format)
         self.app_config.set('Paths', 'default_xml_path', self.default_xml_path)
         self.app_config.set('Paths', 'default_output_path', self.default_output_path)
         self.app_config.set('Paths', 'output_filename_pattern', self.output_filename_pattern)
@@ -243,6 +272,7 @@ class App(ttk.Window):
         file_menu = ttk.Menu(menubar, tearoff=False); menubar.add_cascade(label="Arquivo", menu=file_menu)
         if client_code_access in ['Consulta', 'Total'] or user_level == 'Desenvolvedor':
             file_menu.add_command(label="Gerenciador de Códigos...", command=self.open_client_code_manager); file_menu.add_separator()
+        file_menu.add_command(label="Tarefas em Segundo Plano...", command=self.open_jobs_window)
         file_menu.add_command(label="Alterar Minha Senha...", command=self.open_change_password_dialog); file_menu.add_separator()
         file_menu.add_command(label="Sair", command=self.quit_app)
         if client_code_access in ['Consulta', 'Total'] or user_level == 'Desenvolvedor':
@@ -261,6 +291,7 @@ class App(ttk.Window):
         help_menu = ttk.Menu(menubar, tearoff=False); menubar.add_cascade(label="Ajuda", menu=help_menu)
         help_menu.add_command(label="Verificar Atualizações...", command=lambda: self.check_for_updates_on_startup(manual_check=True))
         help_menu.add_command(label="Notas da Versão", command=lambda: self.show_frame("WhatsNewFrame"))
+        help_menu.add_command(label="Desempenho das Extrações...", command=self.open_metrics_window)
         help_menu.add_command(label="Abrir Pasta de Logs", command=self.open_log_folder); help_menu.add_separator()
         help_menu.add_command(label="Sobre...", command=self.show_about)
     def open_client_code_manager(self):
@@ -293,6 +324,12 @@ class App(ttk.Window):
     def open_settings_window(self):
         if not hasattr(self, 'settings_win') or not self.settings_win.winfo_exists(): self.settings_win = SettingsWindow(self)
         else: self.settings_win.lift()
+    def open_jobs_window(self):
+        if not hasattr(self, 'jobs_win') or not self.jobs_win.winfo_exists(): self.jobs_win = TarefasWindow(self)
+        else: self.jobs_win.lift()
+    def open_metrics_window(self):
+        if not hasattr(self, 'metrics_win') or not self.metrics_win.winfo_exists(): self.metrics_win = DesempenhoWindow(self)
+        else: self.metrics_win.lift()
     def open_validator_window(self):
         if not hasattr(self, 'validator_win') or not self.validator_win.winfo_exists(): self.validator_win = ValidatorWindow(self)
         else: self.validator_win.lift()
@@ -307,6 +344,10 @@ class App(ttk.Window):
     def show_about(self):
         messagebox.showinfo(title="Sobre o Customs Flow", message=(f"Customs Flow V{self.CURRENT_VERSION}\n\n" "Desenvolvido por Bruno Silva\n" "Assistente de IA: Órion\n\n" f"Repositório do Projeto:\n" f"github.com/{REPO_OWNER}/{REPO_NAME}"))
     def quit_app(self):
+        pendentes = self.tarefas.pendentes()
+        if pendentes:
+            if not messagebox.askyesno("Sair", f"Há {len(pendentes)} exportação(ões) em andamento ou na fila. Cancelar e sair?"): return
+            self.tarefas.encerrar(); self.destroy(); return
         if self.confirm_on_exit:
             if messagebox.askyesno("Sair", "Tem certeza que deseja sair?"): self.destroy()
         else: self.destroy()
@@ -339,6 +380,7 @@ class App(ttk.Window):
         messagebox.showinfo("Verificar Atualizações", "Você já está usando a versão mais recente.", parent=self)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     try:
         app = App(themename="superhero")
         app.mainloop()
@@ -0,0 +1,137 @@
+# =============================================================================
+# --- ARQUIVO: metrics_logic.py ---
+# (Métricas de cada extração de XMLs: tempo por etapa, percentis por arquivo,
+#  arquivos mais lentos e números por sistema emissor, gravados em JSON Lines)
+# =============================================================================
+#
+# Uso:
+#   relatorio = RelatorioExtracao(origem=pasta, motor=motor)
+#   with relatorio.cronometrar('extracao'):
+#       core_logic.extrair_lote(caminhos, relatorio=relatorio)
+#   registrar_execucao(relatorio)     -> uma linha no log de métricas e um resumo no debug.log
+
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+import core_logic
+
+METRICS_FILENAME = "extracao_metricas.jsonl"
+LIMITE_EXECUCOES = 500  # execuções mantidas no arquivo (as mais antigas são descartadas na abertura)
+LIMITE_LENTOS = 10
+NOMES_ETAPAS = {
+    'leitura': "Leitura do arquivo", 'parse': "Parse do XML", 'campos': "Busca dos campos",
+    'regex': "Mineração de texto", 'montagem': "Montagem da nota",
+}
+NOMES_FASES = {'triagem': "Triagem", 'deduplicacao': "Deduplicação", 'extracao': "Extração"}
+
+# --- Caminho do log; definido pelo main.py com a pasta de log/config ---
+_metrics_path = None
+
+def set_metrics_dir(diretorio):
+    """Recebe a pasta do log de métricas. Sem essa chamada as execuções só vão para o debug.log."""
+    global _metrics_path
+    _metrics_path = os.path.join(diretorio, METRICS_FILENAME) if diretorio else None
+    if _metrics_path: _podar_execucoes()
+
+def metricas_ativas():
+    return _metrics_path is not None
+
+def _podar_execucoes():
+    try:
+        if not os.path.exists(_metrics_path): return
+        with open(_metrics_path, encoding='utf-8') as f: linhas = f.readlines()
+        if len(linhas) <= LIMITE_EXECUCOES: return
+        with open(_metrics_path, 'w', encoding='utf-8') as f: f.writelines(linhas[-LIMITE_EXECUCOES:])
+    except OSError as e:
+        logging.error(f"Não foi possível reduzir o log de métricas {_metrics_path}: {e}")
+
+def _percentil_ms(ordenadas, q):
+    if not ordenadas: return None
+    return round(ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000, 3)
+
+class RelatorioExtracao:
+    """Junta as medições de uma execução: fases do lote (cronometrar) e cada arquivo extraído (registrar)."""
+    def __init__(self, origem="", motor=None):
+        self.origem = origem; self.motor = motor or core_logic.MOTOR_PADRAO
+        self.iniciado_em = datetime.now(); self.fases = {}; self.em_cache = 0
+        self.arquivos = []  # (caminho, segundos, {etapa: segundos}, sistema emissor ou None se falhou)
+
+    @contextmanager
+    def cronometrar(self, fase):
+        inicio = time.perf_counter()
+        try: yield self
+        finally: self.fases[fase] = self.fases.get(fase, 0.0) + time.perf_counter() - inicio
+
+    def registrar(self, caminho, segundos, tempos, dados):
+        self.arquivos.append((caminho, segundos, tempos, dados.get('sistema_emissor', 'N/A') if dados else None))
+
+    def registrar_cache(self, quantidade):
+        self.em_cache += quantidade
+
+    def resumo(self):
+        """Dicionário serializável com os números da execução (uma linha do log de métricas)."""
+        duracoes = sorted(segundos for _, segundos, _, _ in self.arquivos)
+        segundos_extracao = self.fases.get('extracao')
+        extraidos = len(self.arquivos)
+        etapas = {etapa: 0.0 for etapa in core_logic.ETAPAS_EXTRACAO}
+        por_emissor = {}
+        for _, segundos, tempos, sistema in self.arquivos:
+            for etapa, valor in tempos.items(): etapas[etapa] = etapas.get(etapa, 0.0) + valor
+            por_emissor.setdefault(sistema or "(falha na extração)", []).append(segundos)
+        lentos = sorted(self.arquivos, key=lambda registro: registro[1], reverse=True)[:LIMITE_LENTOS]
+        emissores = {}
+        for sistema, tempos_emissor in por_emissor.items():
+            tempos_emissor.sort()
+            emissores[sistema] = {'arquivos': len(tempos_emissor), 'p50_ms': _percentil_ms(tempos_emissor, 0.50),
+                                  'p95_ms': _percentil_ms(tempos_emissor, 0.95), 'segundos': round(sum(tempos_emissor), 4)}
+        return {
+            'data': self.iniciado_em.isoformat(timespec='seconds'), 'origem': self.origem, 'motor': self.motor,
+            'versao_extrator': core_logic.VERSAO_EXTRATOR,
+            'arquivos': extraidos + self.em_cache, 'extraidos': extraidos, 'em_cache': self.em_cache,
+            'falhas': sum(1 for registro in self.arquivos if registro[3] is None),
+            'segundos': round(segundos_extracao, 4) if segundos_extracao is not None else None,
+            'arquivos_por_segundo': round((extraidos + self.em_cache) / segundos_extracao, 1) if segundos_extracao else None,
+            'p50_ms': _percentil_ms(duracoes, 0.50), 'p95_ms': _percentil_ms(duracoes, 0.95), 'max_ms': _percentil_ms(duracoes, 1.0),
+            'fases': {fase: round(valor, 4) for fase, valor in self.fases.items()},
+            'etapas': {etapa: round(valor, 4) for etapa, valor in etapas.items()},
+            'mais_lentos': [{'arquivo': os.path.basename(caminho), 'ms': round(segundos * 1000, 3), 'sistema': sistema or "(falha na extração)",
+                             'etapa': max(tempos, key=tempos.get) if tempos else None} for caminho, segundos, tempos, sistema in lentos],
+            'por_emissor': dict(sorted(emissores.items(), key=lambda item: item[1]['segundos'], reverse=True)),
+        }
+
+def texto_resumo(resumo):
+    """Uma linha com o essencial da execução, para o debug.log e a barra de status."""
+    partes = [f"{resumo['arquivos']} arquivo(s)"]
+    if resumo.get('segundos') is not None: partes.append(f"em {resumo['segundos']:.2f}s ({resumo['arquivos_por_segundo'] or 0:.0f} arq/s)")
+    if resumo.get('em_cache'): partes.append(f"{resumo['em_cache']} do cache")
+    if resumo.get('p50_ms') is not None: partes.append(f"p50 {resumo['p50_ms']:.1f} ms, p95 {resumo['p95_ms']:.1f} ms por arquivo")
+    if resumo.get('mais_lentos'): partes.append(f"mais lento: {resumo['mais_lentos'][0]['arquivo']} ({resumo['mais_lentos'][0]['ms']:.0f} ms)")
+    return "; ".join(partes)
+
+def registrar_execucao(relatorio):
+    """Grava o resumo da execução no log de métricas (se configurado) e no debug.log. Retorna o resumo."""
+    resumo = relatorio.resumo()
+    logging.info(f"Métricas da extração: {texto_resumo(resumo)}.")
+    if metricas_ativas():
+        try:
+            with open(_metrics_path, 'a', encoding='utf-8') as f: f.write(json.dumps(resumo, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"Não foi possível gravar o log de métricas {_metrics_path}: {e}")
+    return resumo
+
+def ler_execucoes(limite=LIMITE_EXECUCOES):
+    """Execuções gravadas, da mais recente para a mais antiga. Linhas corrompidas são ignoradas."""
+    if not metricas_ativas() or not os.path.exists(_metrics_path): return []
+    execucoes = []
+    try:
+        with open(_metrics_path, encoding='utf-8') as f:
+            for linha in f:
+                try: execucoes.append(json.loads(linha))
+                except ValueError: continue
+    except OSError as e:
+        logging.error(f"Não foi possível ler o log de métricas {_metrics_path}: {e}")
+    return execucoes[::-1][:limite]
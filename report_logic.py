@@ -6,6 +6,8 @@
 import pandas as pd
 from tkinter import filedialog, messagebox
 import os
+import logging
+import tempfile
 from datetime import datetime
 
 # --- Tenta importar as bibliotecas de PDF e Word ---
@@ -25,111 +27,170 @@ except ImportError:
     DOCX_AVAILABLE = False
 
 
-def export_clients_to_excel(clients_list, parent_window=None):
-    """
-    Recebe uma lista de dicionários de clientes e a exporta para um arquivo Excel.
-    """
-    if not clients_list:
-        messagebox.showwarning("Nenhum Dado", "Não há clientes na lista para exportar.", parent=parent_window)
-        return
-
-    try:
-        data_for_export = {
-            "Nome do Cliente": [client.get('name', 'N/A') for client in clients_list],
-            "Código": [client.get('code', 'N/A') for client in clients_list]
-        }
-        df = pd.DataFrame(data_for_export)
-    except Exception as e:
-        messagebox.showerror("Erro ao Preparar Dados", f"Houve um problema ao organizar os dados:\n{e}", parent=parent_window)
-        return
-
+def _perguntar_caminho(parent_window, titulo, extensao, tipo):
     timestamp = datetime.now().strftime("%Y-%m-%d")
-    initial_filename = f"Relatorio_Codigos_de_Clientes_{timestamp}.xlsx"
-    
-    filepath = filedialog.asksaveasfilename(
-        title="Salvar Relatório de Clientes em Excel",
-        parent=parent_window, initialfile=initial_filename,
-        defaultextension=".xlsx", filetypes=[("Arquivos Excel", "*.xlsx")]
+    return filedialog.asksaveasfilename(
+        title=titulo, parent=parent_window, initialfile=f"Relatorio_Codigos_de_Clientes_{timestamp}{extensao}",
+        defaultextension=extensao, filetypes=[tipo]
     )
 
-    if not filepath: return
+def _janela_ativa(parent_window):
+    """A janela que pediu o relatório pode ter sido fechada enquanto ele era gerado em segundo plano."""
+    return parent_window if parent_window is not None and parent_window.winfo_exists() else None
 
+def _gravar_no_lugar(gravar, filepath, progress_callback):
+    """
+    Roda 'gravar(caminho, progress_callback)' num temporário da mesma pasta e só no fim o move para 'filepath'.
+    Cancelada ou com erro, apaga o temporário: um arquivo que já existia no destino (substituição confirmada
+    no diálogo) continua intacto.
+    """
+    descritor, temporario = tempfile.mkstemp(suffix=os.path.splitext(filepath)[1], prefix="~", dir=os.path.dirname(filepath) or None); os.close(descritor)
     try:
-        writer = pd.ExcelWriter(filepath, engine='openpyxl')
+        gravar(temporario, progress_callback)
+        os.replace(temporario, filepath)
+    except BaseException:
+        try:
+            if os.path.exists(temporario): os.remove(temporario)
+        except OSError as e:
+            logging.warning(f"Arquivo temporário não removido ({temporario}): {e}")
+        raise
+
+def _executar_exportacao(fila, titulo, gravar, filepath, mensagem_sucesso, titulo_erro, parent_window):
+    """
+    Roda 'gravar(caminho, progress_callback)' na fila de tarefas (job_logic.FilaTarefas), se houver uma,
+    ou direto na thread atual (ver _gravar_no_lugar). Ao terminar, oferece abrir o arquivo; em caso de erro,
+    mostra a mensagem.
+    """
+    def concluir(_resultado=None):
+        if messagebox.askyesno("Sucesso", f"{mensagem_sucesso}\n\nDeseja abrir o arquivo agora?", parent=_janela_ativa(parent_window)):
+            os.startfile(filepath)
+    def falhar(erro):
+        messagebox.showerror(titulo_erro, f"Ocorreu um erro ao salvar o arquivo:\n\n{erro}", parent=_janela_ativa(parent_window))
+
+    def executar(tarefa):
+        _gravar_no_lugar(gravar, filepath, tarefa.progresso)
+        return filepath
+
+    if fila is not None:
+        fila.enviar(titulo, executar, ao_concluir=concluir, ao_falhar=falhar); return
+    try: _gravar_no_lugar(gravar, filepath, None)
+    except Exception as e: falhar(e); return
+    concluir()
+
+# --- Gravação dos arquivos (sem diálogos; podem rodar fora da thread do Tk) ---
+
+def gravar_clientes_excel(clients_list, filepath, progress_callback=None):
+    data_for_export = {
+        "Nome do Cliente": [client.get('name', 'N/A') for client in clients_list],
+        "Código": [client.get('code', 'N/A') for client in clients_list]
+    }
+    df = pd.DataFrame(data_for_export)
+    if progress_callback: progress_callback(1, 3)
+    # O 'with' fecha o arquivo mesmo se o progresso levantar TarefaCancelada no meio da gravação.
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
         df.to_excel(writer, index=False, sheet_name='Clientes')
+        if progress_callback: progress_callback(2, 3)
         worksheet = writer.sheets['Clientes']
         for column_cells in worksheet.columns:
             max_length = max(len(str(cell.value)) for cell in column_cells)
             adjusted_width = (max_length + 2)
             worksheet.column_dimensions[column_cells[0].column_letter].width = adjusted_width
-        writer.close()
+    if progress_callback: progress_callback(3, 3)
+
+def gravar_clientes_pdf(clients_list, filepath, progress_callback=None):
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title = Paragraph("Relatório de Códigos de Cliente", styles['h1'])
+    elements.append(title)
+    elements.append(Spacer(1, 20))
+
+    table_data = [['Nome do Cliente', 'Código']]
+    total = len(clients_list) + 1
+    for indice, client in enumerate(clients_list, 1):
+        table_data.append([
+            Paragraph(client.get('name', ''), styles['Normal']),
+            Paragraph(client.get('code', ''), styles['Normal'])
+        ])
+        if progress_callback: progress_callback(indice, total)
+
+    table = Table(table_data, colWidths=[300, 150])
+    style = TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#4e5d6c")),
+        ('TEXTCOLOR',(0,0),(-1,0), colors.whitesmoke),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0,0), (-1,0), 12),
+        ('BACKGROUND', (0,1), (-1,-1), colors.HexColor("#f0f0f0")),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+        ('TOPPADDING', (0,1), (-1,-1), 6),
+        ('BOTTOMPADDING', (0,1), (-1,-1), 6),
+    ])
+    table.setStyle(style)
+
+    elements.append(table)
+    with open(filepath, 'wb') as saida:
+        SimpleDocTemplate(saida, pagesize=A4, topMargin=30, bottomMargin=30).build(elements)
+    if progress_callback: progress_callback(total, total)
+
+def gravar_clientes_word(clients_list, filepath, progress_callback=None):
+    document = docx.Document()
+    document.add_heading('Relatório de Códigos de Cliente', level=1)
+    document.add_paragraph(f"Relatório gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+
+    table = document.add_table(rows=1, cols=2)
+    table.style = 'Table Grid'
+
+    hdr_cells = table.rows[0].cells
+    hdr_cells[0].text = 'Nome do Cliente'
+    hdr_cells[1].text = 'Código'
+
+    total = len(clients_list) + 1
+    for indice, client in enumerate(clients_list, 1):
+        row_cells = table.add_row().cells
+        row_cells[0].text = client.get('name', '')
+        row_cells[1].text = client.get('code', '')
+        if progress_callback: progress_callback(indice, total)
+
+    with open(filepath, 'wb') as saida: document.save(saida)
+    if progress_callback: progress_callback(total, total)
+
+# --- Exportação a partir da interface (escolha do arquivo + gravação, em segundo plano se houver fila) ---
+
+def export_clients_to_excel(clients_list, parent_window=None, fila=None):
+    """
+    Recebe uma lista de dicionários de clientes e a exporta para um arquivo Excel.
+    """
+    if not clients_list:
+        messagebox.showwarning("Nenhum Dado", "Não há clientes na lista para exportar.", parent=parent_window)
+        return
 
-        if messagebox.askyesno("Sucesso", f"Relatório salvo com sucesso!\n\nDeseja abrir o arquivo agora?", parent=parent_window):
-            os.startfile(filepath)
-            
-    except Exception as e:
-        messagebox.showerror("Erro ao Salvar", f"Ocorreu um erro ao salvar o arquivo Excel:\n\n{e}", parent=parent_window)
+    filepath = _perguntar_caminho(parent_window, "Salvar Relatório de Clientes em Excel", ".xlsx", ("Arquivos Excel", "*.xlsx"))
+    if not filepath: return
+
+    clients_list = list(clients_list)
+    _executar_exportacao(fila, "Relatório de Clientes (Excel)", lambda caminho, progresso: gravar_clientes_excel(clients_list, caminho, progresso),
+                         filepath, "Relatório salvo com sucesso!", "Erro ao Salvar", parent_window)
 
-def export_clients_to_pdf(clients_list, parent_window=None):
+def export_clients_to_pdf(clients_list, parent_window=None, fila=None):
     """Gera um relatório em PDF com a lista de clientes."""
     if not REPORTLAB_AVAILABLE:
         messagebox.showerror("Biblioteca Faltando", "A biblioteca 'reportlab' é necessária para gerar PDFs.\nInstale com: pip install reportlab", parent=parent_window)
         return
-        
+
     if not clients_list:
         messagebox.showwarning("Nenhum Dado", "Não há clientes na lista para exportar.", parent=parent_window)
         return
-        
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    initial_filename = f"Relatorio_Codigos_de_Clientes_{timestamp}.pdf"
-    filepath = filedialog.asksaveasfilename(
-        title="Salvar Relatório de Clientes em PDF",
-        parent=parent_window, initialfile=initial_filename,
-        defaultextension=".pdf", filetypes=[("Arquivos PDF", "*.pdf")]
-    )
+
+    filepath = _perguntar_caminho(parent_window, "Salvar Relatório de Clientes em PDF", ".pdf", ("Arquivos PDF", "*.pdf"))
     if not filepath: return
 
-    try:
-        doc = SimpleDocTemplate(filepath, pagesize=A4, topMargin=30, bottomMargin=30)
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        title = Paragraph("Relatório de Códigos de Cliente", styles['h1'])
-        elements.append(title)
-        elements.append(Spacer(1, 20))
-
-        table_data = [['Nome do Cliente', 'Código']]
-        for client in clients_list:
-            table_data.append([
-                Paragraph(client.get('name', ''), styles['Normal']), 
-                Paragraph(client.get('code', ''), styles['Normal'])
-            ])
-        
-        table = Table(table_data, colWidths=[300, 150])
-        style = TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#4e5d6c")),
-            ('TEXTCOLOR',(0,0),(-1,0), colors.whitesmoke),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 12),
-            ('BACKGROUND', (0,1), (-1,-1), colors.HexColor("#f0f0f0")),
-            ('GRID', (0,0), (-1,-1), 1, colors.black),
-            ('TOPPADDING', (0,1), (-1,-1), 6),
-            ('BOTTOMPADDING', (0,1), (-1,-1), 6),
-        ])
-        table.setStyle(style)
-        
-        elements.append(table)
-        doc.build(elements)
-        
-        if messagebox.askyesno("Sucesso", f"Relatório PDF salvo com sucesso!\n\nDeseja abrir o arquivo agora?", parent=parent_window):
-            os.startfile(filepath)
-            
-    except Exception as e:
-        messagebox.showerror("Erro ao Salvar PDF", f"Ocorreu um erro ao salvar o arquivo PDF:\n\n{e}", parent=parent_window)
+    clients_list = list(clients_list)
+    _executar_exportacao(fila, "Relatório de Clientes (PDF)", lambda caminho, progresso: gravar_clientes_pdf(clients_list, caminho, progresso),
+                         filepath, "Relatório PDF salvo com sucesso!", "Erro ao Salvar PDF", parent_window)
 
-def export_clients_to_word(clients_list, parent_window=None):
+def export_clients_to_word(clients_list, parent_window=None, fila=None):
     """Gera um relatório em Word (.docx) com a lista de clientes."""
     if not DOCX_AVAILABLE:
         messagebox.showerror("Biblioteca Faltando", "A biblioteca 'python-docx' é necessária para gerar arquivos Word.\nInstale com: pip install python-docx", parent=parent_window)
@@ -139,36 +200,9 @@ def export_clients_to_word(clients_list, parent_window=None):
         messagebox.showwarning("Nenhum Dado", "Não há clientes na lista para exportar.", parent=parent_window)
         return
 
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    initial_filename = f"Relatorio_Codigos_de_Clientes_{timestamp}.docx"
-    filepath = filedialog.asksaveasfilename(
-        title="Salvar Relatório de Clientes em Word",
-        parent=parent_window, initialfile=initial_filename,
-        defaultextension=".docx", filetypes=[("Documentos Word", "*.docx")]
-    )
+    filepath = _perguntar_caminho(parent_window, "Salvar Relatório de Clientes em Word", ".docx", ("Documentos Word", "*.docx"))
     if not filepath: return
-    
-    try:
-        document = docx.Document()
-        document.add_heading('Relatório de Códigos de Cliente', level=1)
-        document.add_paragraph(f"Relatório gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-        
-        table = document.add_table(rows=1, cols=2)
-        table.style = 'Table Grid'
-        
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = 'Nome do Cliente'
-        hdr_cells[1].text = 'Código'
-        
-        for client in clients_list:
-            row_cells = table.add_row().cells
-            row_cells[0].text = client.get('name', '')
-            row_cells[1].text = client.get('code', '')
-            
-        document.save(filepath)
-        
-        if messagebox.askyesno("Sucesso", f"Relatório Word salvo com sucesso!\n\nDeseja abrir o arquivo agora?", parent=parent_window):
-            os.startfile(filepath)
 
-    except Exception as e:
-        messagebox.showerror("Erro ao Salvar Word", f"Ocorreu um erro ao salvar o arquivo Word:\n\n{e}", parent=parent_window)
\ No newline at end of file
+    clients_list = list(clients_list)
+    _executar_exportacao(fila, "Relatório de Clientes (Word)", lambda caminho, progresso: gravar_clientes_word(clients_list, caminho, progresso),
+                         filepath, "Relatório Word salvo com sucesso!", "Erro ao Salvar Word", parent_window)
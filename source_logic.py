@@ -0,0 +1,232 @@
+# =============================================================================
+# --- ARQUIVO: source_logic.py ---
+# (Origens dos XMLs do extrator: várias pastas, arquivos .zip e XMLs avulsos.
+#  Os XMLs de dentro de um .zip são lidos direto do pacote, sem arquivos temporários)
+# =============================================================================
+#
+# Leitura antecipada: ler_antecipado() entrega o conteúdo de cada XML na ordem pedida enquanto uma pool
+# de threads já lê os próximos (no máximo 'profundidade' arquivos à frente), sobrepondo a espera do disco
+# ou da rede (NAS, OneDrive) ao parsing. Arquivos a partir de LIMITE_MMAP são mapeados em memória em vez
+# de copiados; o lxml lê o mmap direto (etree.fromstring aceita qualquer buffer).
+#
+# Um XML dentro de um .zip é identificado por um caminho virtual "C:\pasta\lote.zip!/sub/nota.xml".
+# O resto do programa trata esse caminho como o de qualquer arquivo: abrir(), ler_cabecalho() e
+# estado() aceitam os dois tipos, e os processos do pool de extração abrem o pacote por conta própria
+# (cada um descompacta os seus XMLs, em paralelo). Os pacotes abertos ficam guardados por processo;
+# fechar_pacotes() os libera ao fim da extração.
+
+import os
+import re
+import mmap
+import zipfile
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+SEPARADOR_FONTES = ";"
+SEPARADOR_MEMBRO = "!/"
+EXTENSAO_XML = ".xml"
+EXTENSAO_ZIP = ".zip"
+_PADRAO_MEMBRO = re.compile(r'\.zip!/', re.IGNORECASE)
+
+PROFUNDIDADE_LEITURA = 8  # arquivos lidos à frente do parser (0 desliga a leitura antecipada)
+LIMITE_MMAP = 4 * 1024 * 1024  # a partir deste tamanho o XML é mapeado em vez de copiado para a memória
+
+_pacotes = {}  # caminho do .zip -> zipfile.ZipFile aberto neste processo
+_pid_pacotes = os.getpid()
+_lock_pacotes = threading.Lock()
+
+# --- Fontes (o texto do campo de origem) ---
+
+def separar_fontes(texto):
+    """'C:\\xml; D:\\lote.zip' -> ['C:\\xml', 'D:\\lote.zip'] (sem vazios nem repetidos)."""
+    fontes = []
+    for parte in (texto or "").split(SEPARADOR_FONTES):
+        parte = parte.strip().strip('"')
+        if parte and parte not in fontes: fontes.append(parte)
+    return fontes
+
+def juntar_fontes(fontes):
+    return f"{SEPARADOR_FONTES} ".join(fontes)
+
+def e_pacote(caminho):
+    return caminho.lower().endswith(EXTENSAO_ZIP)
+
+def fonte_valida(fonte):
+    return os.path.isdir(fonte) or (os.path.isfile(fonte) and (e_pacote(fonte) or fonte.lower().endswith(EXTENSAO_XML)))
+
+# --- Caminhos virtuais de XMLs dentro de pacotes ---
+
+def caminho_membro(pacote, membro):
+    return f"{pacote}{SEPARADOR_MEMBRO}{membro}"
+
+def dividir_membro(caminho):
+    """(caminho do .zip, nome do membro) se o caminho aponta para dentro de um pacote; senão None."""
+    encontrado = _PADRAO_MEMBRO.search(caminho)
+    if encontrado is None: return None
+    return caminho[:encontrado.start() + len(EXTENSAO_ZIP)], caminho[encontrado.end():]
+
+def _pacote(caminho_zip):
+    global _pacotes, _pid_pacotes
+    with _lock_pacotes:
+        if _pid_pacotes != os.getpid():
+            # Processo do pool criado por fork: os pacotes herdados dividem a posição de leitura com o pai.
+            _pacotes, _pid_pacotes = {}, os.getpid()
+        pacote = _pacotes.get(caminho_zip)
+        if pacote is None: pacote = _pacotes[caminho_zip] = zipfile.ZipFile(caminho_zip)
+        return pacote
+
+def fechar_pacotes():
+    """Fecha os .zip abertos neste processo (no Windows um pacote aberto não pode ser apagado nem movido)."""
+    with _lock_pacotes:
+        for pacote in _pacotes.values(): pacote.close()
+        _pacotes.clear()
+
+def abrir(caminho):
+    """Abre o XML para leitura binária; de um pacote, o membro é descompactado à medida que é lido."""
+    partes = dividir_membro(caminho)
+    if partes is None: return open(caminho, 'rb')
+    try:
+        return _pacote(partes[0]).open(partes[1])
+    except (KeyError, zipfile.BadZipFile, RuntimeError) as e:
+        raise OSError(f"Não foi possível ler '{partes[1]}' do pacote {os.path.basename(partes[0])}: {e}") from e
+
+def ler_cabecalho(caminho, tamanho):
+    with abrir(caminho) as arquivo: return arquivo.read(tamanho)
+
+def estado(caminho):
+    """
+    (tamanho, mtime_ns) do arquivo, como os.stat. Para um membro: o tamanho descompactado e o mtime do
+    pacote (regravar o .zip invalida o cache dos seus XMLs; o conteúdo decide, como num arquivo recopiado).
+    """
+    partes = dividir_membro(caminho)
+    if partes is None:
+        st = os.stat(caminho)
+        return st.st_size, st.st_mtime_ns
+    try:
+        info = _pacote(partes[0]).getinfo(partes[1])
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise OSError(f"'{partes[1]}' não encontrado no pacote {os.path.basename(partes[0])}: {e}") from e
+    return info.file_size, os.stat(partes[0]).st_mtime_ns
+
+# --- Leitura do conteúdo, com antecipação ---
+
+def ler_conteudo(caminho, limite_mmap=None):
+    """
+    Conteúdo inteiro do XML: bytes, ou um mmap somente leitura para arquivos (fora de pacotes) a partir de
+    'limite_mmap' bytes. Quem recebe deve chamar liberar() depois do parse.
+    """
+    limite_mmap = LIMITE_MMAP if limite_mmap is None else limite_mmap
+    if dividir_membro(caminho) is None:
+        with open(caminho, 'rb') as arquivo:
+            if limite_mmap and os.fstat(arquivo.fileno()).st_size >= limite_mmap:
+                return mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+            return arquivo.read()
+    with abrir(caminho) as arquivo: return arquivo.read()
+
+def liberar(conteudo):
+    """Desfaz o mapeamento de um conteúdo lido por ler_conteudo (no Windows, o arquivo mapeado fica travado)."""
+    if isinstance(conteudo, mmap.mmap): conteudo.close()
+
+def _ler_ou_none(caminho, limite_mmap, com_estado=False):
+    """(conteúdo, estado antes da leitura ou None); (None, None) se a leitura falhou."""
+    try:
+        estado_lido = estado(caminho) if com_estado else None
+        return ler_conteudo(caminho, limite_mmap), estado_lido
+    except (OSError, ValueError):
+        return None, None  # quem consome lê de novo por conta própria e registra o erro do arquivo
+
+def ler_antecipado(caminhos, profundidade=None, limite_mmap=None, com_estado=False):
+    """
+    Gera (caminho, conteúdo) na ordem de 'caminhos', com até 'profundidade' leituras em andamento numa pool
+    de threads. O conteúdo é None quando a leitura falhou. No máximo profundidade + 1 arquivos ficam na
+    memória ao mesmo tempo. Com 'com_estado', gera (caminho, conteúdo, estado()) com o estado tomado antes da
+    leitura: se o arquivo mudar depois, o estado guardado é o antigo e o cache não aceita o conteúdo lido.
+    """
+    profundidade = PROFUNDIDADE_LEITURA if profundidade is None else profundidade
+    if profundidade <= 0:
+        for caminho in caminhos:
+            conteudo, estado_lido = _ler_ou_none(caminho, limite_mmap, com_estado)
+            yield (caminho, conteudo, estado_lido) if com_estado else (caminho, conteudo)
+        return
+    restantes = iter(caminhos)
+    with ThreadPoolExecutor(max_workers=profundidade, thread_name_prefix="LeituraXML") as executor:
+        em_leitura = deque()
+        def agendar():
+            caminho = next(restantes, None)
+            if caminho is not None: em_leitura.append((caminho, executor.submit(_ler_ou_none, caminho, limite_mmap, com_estado)))
+        for _ in range(profundidade): agendar()
+        try:
+            while em_leitura:
+                caminho, futuro = em_leitura.popleft(); agendar()
+                conteudo, estado_lido = futuro.result()
+                yield (caminho, conteudo, estado_lido) if com_estado else (caminho, conteudo)
+        finally:
+            # Consumidor parou no meio: libera o que já foi lido e não será usado.
+            for _, futuro in em_leitura:
+                if futuro.cancel(): continue
+                liberar(futuro.result()[0])
+
+def mapear_antecipado(funcao, caminhos, profundidade=None):
+    """[funcao(caminho)] na ordem de 'caminhos', com até 'profundidade' chamadas simultâneas (leituras curtas, ex.: cabeçalhos)."""
+    profundidade = PROFUNDIDADE_LEITURA if profundidade is None else profundidade
+    if profundidade <= 0: return [funcao(caminho) for caminho in caminhos]
+    with ThreadPoolExecutor(max_workers=profundidade, thread_name_prefix="LeituraXML") as executor:
+        return list(executor.map(funcao, caminhos))
+
+# --- Listagem ---
+
+class ResultadoListagem:
+    """XMLs encontrados em todas as fontes, na ordem das fontes, e as fontes (ou pacotes) que não puderam ser lidos."""
+    __slots__ = ('arquivos', 'falhas', 'pacotes')
+
+    def __init__(self, arquivos=None, falhas=None, pacotes=0):
+        self.arquivos = arquivos or []; self.falhas = falhas or {}; self.pacotes = pacotes
+
+    def resumo(self):
+        return f"{self.pacotes} pacote(s) .zip lido(s) sem descompactar" if self.pacotes else ""
+
+def _infos_xml(pacote):
+    return [info for info in pacote.infolist() if not info.is_dir() and info.filename.lower().endswith(EXTENSAO_XML)]
+
+def _membros_xml(caminho_zip):
+    return [caminho_membro(caminho_zip, info.filename) for info in _infos_xml(_pacote(caminho_zip))]
+
+def estados_pacote(caminho_zip, mtime_ns):
+    """
+    {caminho virtual: estado()} dos XMLs do pacote, para o snapshot do monitor. Lê só o diretório central e
+    não guarda o pacote aberto (entre uma varredura e outra o .zip pode ser trocado ou apagado).
+    """
+    with zipfile.ZipFile(caminho_zip) as pacote:
+        return {caminho_membro(caminho_zip, info.filename): (info.file_size, mtime_ns) for info in _infos_xml(pacote)}
+
+def listar_xmls(fontes):
+    """
+    Todos os .xml das fontes: pastas (com subpastas, incluindo os .zip encontrados nelas), pacotes .zip e
+    XMLs avulsos. Um mesmo arquivo citado por duas fontes aparece uma vez só. Pacotes dentro de pacotes não
+    são abertos.
+    """
+    resultado = ResultadoListagem(); vistos = set()
+    def incluir(caminhos):
+        for caminho in caminhos:
+            if caminho not in vistos: vistos.add(caminho); resultado.arquivos.append(caminho)
+    def incluir_pacote(caminho_zip):
+        try:
+            membros = _membros_xml(caminho_zip)
+        except (OSError, zipfile.BadZipFile) as e:
+            logging.warning(f"Pacote ignorado ({os.path.basename(caminho_zip)}): {e}")
+            resultado.falhas[caminho_zip] = str(e); return
+        resultado.pacotes += 1; incluir(membros)
+    for fonte in fontes:
+        if os.path.isdir(fonte):
+            for dp, _, fn in os.walk(fonte):
+                for f in fn:
+                    caminho = os.path.join(dp, f)
+                    if f.lower().endswith(EXTENSAO_XML): incluir([caminho])
+                    elif e_pacote(f) and caminho not in vistos: vistos.add(caminho); incluir_pacote(caminho)
+        elif os.path.isfile(fonte) and e_pacote(fonte):
+            if fonte not in vistos: vistos.add(fonte); incluir_pacote(fonte)
+        elif os.path.isfile(fonte) and fonte.lower().endswith(EXTENSAO_XML): incluir([fonte])
+        else: resultado.falhas[fonte] = "não é uma pasta, um .zip ou um .xml"
+    return resultado
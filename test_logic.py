@@ -5,7 +5,16 @@
 import os
 import sys
 import auth_logic
+import cache_logic
 import core_logic
+import columnar_logic
+import export_logic
+import format_logic
+import job_logic
+import metrics_logic
+import report_logic
+import source_logic
+import watch_logic
 
 # Dicionário para guardar os resultados
 test_results = {}
@@ -30,6 +39,26 @@ def run_all_tests():
         
     if combined_data:
         test_dashboard_logic(combined_data)
+        test_dashboard_colunar(combined_data)
+        test_snapshot_parquet(combined_data)
+        test_relatorio_csv(combined_data)
+        test_relatorio_xlsx_rapido(combined_data)
+        test_particao_notas(combined_data)
+        test_indice_cancelamentos(combined_data)
+
+    test_motores_extracao_equivalentes()
+    test_deduplicacao_chave()
+    test_triagem_cabecalho()
+    test_origens_zip()
+    test_monitor_zip()
+    test_monitor_copias()
+    test_leitura_antecipada()
+    test_cache_hash_lido()
+    test_metricas_extracao()
+    test_fila_tarefas()
+    test_exportacao_cancelada()
+    test_canal_progresso()
+    test_formatacao_moeda()
         
     test_user_auth()
 
@@ -99,6 +128,234 @@ def test_parsing_dimnfe_xml():
         test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
         return None
 
+def test_motores_extracao_equivalentes():
+    """Confere se o leitor em streaming gera exatamente os mesmos dados que o leitor em árvore."""
+    test_name = "Extração (Motor Streaming x Árvore)"
+    try:
+        for nome_arquivo in ("narwal_test_note.xml", "dimnfe_test_note.xml"):
+            test_file_path = resource_path(os.path.join("test_assets", nome_arquivo))
+            if not os.path.exists(test_file_path):
+                raise FileNotFoundError(f"Arquivo '{nome_arquivo}' não encontrado.")
+            dados_arvore = core_logic.extrair_dados_nf(test_file_path, motor='arvore')
+            dados_stream = core_logic.extrair_dados_nf(test_file_path, motor='stream')
+            if not dados_arvore or not dados_stream: raise ValueError(f"A extração de '{nome_arquivo}' retornou None.")
+            for chave in set(dados_arvore) | set(dados_stream):
+                assert dados_arvore.get(chave) == dados_stream.get(chave), f"'{nome_arquivo}': campo '{chave}' difere ({dados_arvore.get(chave)} x {dados_stream.get(chave)})"
+        test_results[test_name] = ("OK", "Os dois motores geraram os mesmos dados.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_deduplicacao_chave():
+    """Espalha cópias das notas de teste (com e sem a chave no nome) e um CANCELADA_ por subpastas e confere o que é descartado."""
+    test_name = "Deduplicação por Chave de Acesso"
+    try:
+        import shutil, tempfile
+        with tempfile.TemporaryDirectory() as pasta:
+            os.makedirs(os.path.join(pasta, "copias"))
+            originais = [resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml")]
+            chave = core_logic.identificar_arquivo(originais[0])[1]
+            caminhos = list(originais)
+            for destino in (os.path.join(pasta, "copias", "narwal.xml"), os.path.join(pasta, f"NFe{chave}.xml"), os.path.join(pasta, f"CANCELADA_{chave}.xml")):
+                shutil.copy(originais[0], destino); caminhos.append(destino)
+            resultado = core_logic.deduplicar_por_chave(caminhos)
+        assert resultado.arquivos == originais + [caminhos[-1]], f"Arquivos mantidos: {[os.path.basename(c) for c in resultado.arquivos]}"
+        assert set(resultado.duplicados.values()) == {originais[0]}, "As cópias deveriam apontar para a primeira ocorrência."
+        assert resultado.pareados == 1, f"Esperado 1 cancelamento pareado, vieram {resultado.pareados}."
+        test_results[test_name] = ("OK", resultado.resumo())
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_triagem_cabecalho():
+    """Um CT-e e um evento que não é cancelamento devem ser descartados pelo cabeçalho; as notas de teste, não."""
+    test_name = "Triagem pelo Cabeçalho do XML"
+    try:
+        import tempfile
+        with tempfile.TemporaryDirectory() as pasta:
+            outros = {
+                "cte.xml": '<?xml version="1.0"?><!-- <nfeProc> --><cteProc xmlns="http://www.portalfiscal.inf.br/cte"><CTe/></cteProc>',
+                "ciencia.xml": '<procEventoNFe xmlns="http://www.portalfiscal.inf.br/nfe"><evento><infEvento><tpEvento>210210</tpEvento></infEvento></evento></procEventoNFe>',
+            }
+            caminhos = [resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml")]
+            for nome, conteudo in outros.items():
+                with open(os.path.join(pasta, nome), "w", encoding="utf-8") as f: f.write(conteudo)
+                caminhos.append(os.path.join(pasta, nome))
+            triagem = core_logic.triar_arquivos(caminhos)
+            assert triagem.arquivos == caminhos[:2], f"Seguiram para a extração: {[os.path.basename(c) for c in triagem.arquivos]}"
+            assert all(core_logic.extrair_dados_nf(c) is None for c in triagem.ignorados), "A triagem descartou um arquivo que a extração aproveitaria."
+        test_results[test_name] = ("OK", f"{len(triagem.ignorados)} arquivos descartados sem parsing.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_cache_hash_lido():
+    """
+    O cache deve gravar o estado e o hash da leitura feita pela extração, sem reler os arquivos, e não pode
+    servir dados antigos de um arquivo regravado entre a leitura e a gravação do cache.
+    """
+    test_name = "Cache de Extração (Hash do Conteúdo Lido)"
+    caminho_anterior, hash_arquivo, salvar_lote = cache_logic._cache_path, cache_logic._hash_arquivo, cache_logic.salvar_lote
+    try:
+        import shutil
+        import tempfile
+        import sqlite3
+        caminhos = [resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml")]
+        with tempfile.TemporaryDirectory() as pasta:
+            cache_logic.set_cache_dir(pasta); relidos = []
+            cache_logic._hash_arquivo = lambda caminho: relidos.append(caminho) or hash_arquivo(caminho)
+            extraidos = core_logic.extrair_lote(caminhos, workers=1)
+            assert not relidos, f"Arquivos lidos de novo só para o hash: {relidos}"
+            conn = sqlite3.connect(cache_logic._cache_path)
+            try: salvos = dict(conn.execute("SELECT caminho, hash FROM extracoes").fetchall())
+            finally: conn.close()
+            assert salvos == {c: hash_arquivo(c) for c in caminhos}, "O hash gravado difere do hash do arquivo."
+            assert set(cache_logic.buscar_lote(caminhos, core_logic.VERSAO_EXTRATOR)) == set(caminhos), "As notas gravadas não foram reaproveitadas."
+            assert [d.como_dict() for d in core_logic.extrair_lote(caminhos, workers=1)] == [d.como_dict() for d in extraidos]
+            # Arquivo trocado por outra nota depois de lido e antes de o cache ser gravado.
+            copia = os.path.join(pasta, "nota.xml"); shutil.copy(caminhos[0], copia)
+            def salvar_depois_de_trocar(itens, versao):
+                shutil.copy(caminhos[1], copia); salvar_lote(itens, versao)
+            cache_logic.salvar_lote = salvar_depois_de_trocar
+            core_logic.extrair_lote([copia], workers=1)
+            cache_logic.salvar_lote = salvar_lote
+            assert not cache_logic.buscar_lote([copia], core_logic.VERSAO_EXTRATOR), "O cache serviu os dados do arquivo anterior à troca."
+            assert core_logic.extrair_lote([copia], workers=1)[0]['numero_nf'] == extraidos[1]['numero_nf'], "A nota trocada não foi extraída de novo."
+            cache_logic.set_cache_dir(None)
+        test_results[test_name] = ("OK", f"{len(salvos)} arquivo(s) no cache com o hash da leitura da extração.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+    finally:
+        cache_logic._cache_path, cache_logic._hash_arquivo, cache_logic.salvar_lote = caminho_anterior, hash_arquivo, salvar_lote
+
+def test_metricas_extracao():
+    """O relatório da extração deve medir cada arquivo e cada etapa e sobreviver à ida e volta pelo log JSON Lines."""
+    test_name = "Métricas da Extração"
+    try:
+        import tempfile
+        caminhos = [resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml")]
+        relatorio = metrics_logic.RelatorioExtracao(origem="test_assets", motor="arvore")
+        with relatorio.cronometrar('extracao'):
+            resultados = core_logic.extrair_lote(caminhos, workers=1, usar_cache=False, motor="arvore", relatorio=relatorio)
+        resumo = relatorio.resumo()
+        assert all(resultados) and resumo['extraidos'] == 2 and resumo['falhas'] == 0, f"Resumo inesperado: {resumo}"
+        assert all({'leitura', 'parse', 'campos'} <= set(tempos) for _, _, tempos, _ in relatorio.arquivos), f"Etapas sem medição: {resumo['etapas']}"
+        assert resumo['mais_lentos'][0]['ms'] == resumo['max_ms'], "O arquivo mais lento não bate com o tempo máximo."
+        with tempfile.TemporaryDirectory() as pasta:
+            metrics_logic.set_metrics_dir(pasta)
+            try:
+                metrics_logic.registrar_execucao(relatorio)
+                assert metrics_logic.ler_execucoes() == [resumo], "A execução lida do log difere da gravada."
+            finally:
+                metrics_logic.set_metrics_dir(None)
+        test_results[test_name] = ("OK", metrics_logic.texto_resumo(resumo))
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_origens_zip():
+    """Uma pasta e um .zip juntos: os XMLs do pacote são extraídos sem descompactar e a cópia entre as origens é descartada."""
+    test_name = "Origens Múltiplas e Pacotes ZIP"
+    try:
+        import shutil
+        import tempfile
+        import zipfile
+        narwal, dimnfe = (resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml"))
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho_zip = os.path.join(pasta, "lote.zip"); subpasta = os.path.join(pasta, "xml"); os.makedirs(subpasta)
+            with zipfile.ZipFile(caminho_zip, "w", zipfile.ZIP_DEFLATED) as pacote:
+                pacote.write(narwal, "sub/narwal.xml"); pacote.write(dimnfe, "dimnfe.xml"); pacote.writestr("leia-me.txt", "fora da extração")
+            shutil.copy(narwal, subpasta)
+            try:
+                listagem = source_logic.listar_xmls(source_logic.separar_fontes(f"{subpasta}; {caminho_zip}"))
+                assert len(listagem.arquivos) == 3 and listagem.pacotes == 1 and not listagem.falhas, f"Listagem inesperada: {listagem.arquivos}"
+                triagem = core_logic.triar_arquivos(listagem.arquivos)
+                deduplicacao = core_logic.deduplicar_por_chave(triagem.arquivos, triagem.classificacoes)
+                assert len(deduplicacao.duplicados) == 1, "A cópia da nota entre a pasta e o .zip não foi descartada."
+                resultados = core_logic.extrair_lote(deduplicacao.arquivos, workers=1, usar_cache=False)
+                assert sorted(d['numero_nf'] for d in resultados if d) == ['1315', '1356'], f"Notas extraídas: {[d and d['numero_nf'] for d in resultados]}"
+            finally:
+                source_logic.fechar_pacotes()
+        test_results[test_name] = ("OK", f"{listagem.resumo()}; {deduplicacao.resumo()}.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_monitor_zip():
+    """O snapshot do monitor deve ver os XMLs de um .zip da pasta como a extração os viu (sem remoções falsas)."""
+    test_name = "Monitor de Pasta com Pacotes ZIP"
+    try:
+        import shutil
+        import tempfile
+        import time
+        import zipfile
+        narwal, dimnfe = (resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml"))
+        with tempfile.TemporaryDirectory() as pasta:
+            shutil.copy(narwal, os.path.join(pasta, "a.xml")); os.makedirs(os.path.join(pasta, "sub"))
+            caminho_zip = os.path.join(pasta, "sub", "lote.zip")
+            with zipfile.ZipFile(caminho_zip, "w") as pacote: pacote.write(dimnfe, "d.xml")
+            try:
+                inicial = watch_logic.snapshot_de_arquivos(source_logic.listar_xmls([pasta]).arquivos)
+            finally:
+                source_logic.fechar_pacotes()
+            atual = watch_logic.tirar_snapshot(pasta, inicial)
+            assert len(atual) == 2 and watch_logic.comparar_snapshots(inicial, atual) == ([], [], []), f"Diferenças falsas: {watch_logic.comparar_snapshots(inicial, atual)}"
+            with open(caminho_zip, "r+b") as arquivo: arquivo.truncate(10)  # .zip sendo recopiado
+            assert watch_logic.tirar_snapshot(pasta, atual) == atual, "Os XMLs de um .zip ilegível foram dados como removidos."
+            with zipfile.ZipFile(caminho_zip, "w") as pacote: pacote.write(dimnfe, "d.xml"); pacote.write(narwal, "n.xml")
+            os.utime(caminho_zip, ns=(time.time_ns(), atual[source_logic.caminho_membro(caminho_zip, "d.xml")][1] + 1_000_000_000))
+            adicionados, alterados, removidos = watch_logic.comparar_snapshots(atual, watch_logic.tirar_snapshot(pasta, atual))
+            assert adicionados == [source_logic.caminho_membro(caminho_zip, "n.xml")] and len(alterados) == 1 and not removidos, "O .zip regravado não gerou o delta esperado."
+        test_results[test_name] = ("OK", "Membros do .zip comparados sem remoções falsas.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_monitor_copias():
+    """Cópia de um XML já carregado ou repetida no mesmo delta não vira outra nota; sai o original, a cópia assume."""
+    test_name = "Monitor de Pasta (Cópias pela Chave)"
+    try:
+        import shutil
+        import tempfile
+        narwal, dimnfe = (resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml"))
+        with tempfile.TemporaryDirectory() as pasta:
+            original = os.path.join(pasta, "a.xml"); shutil.copy(narwal, original); os.makedirs(os.path.join(pasta, "sub"))
+            indice = core_logic.IndiceChaves(zip([original], core_logic.extrair_lote([original])))
+            deltas = []
+            monitor = watch_logic.MonitorPastaXML(pasta, lambda extraidos, removidos: deltas.append((extraidos, removidos)), snapshot_inicial=watch_logic.snapshot_de_arquivos([original]),
+                                                  carregados=indice.caminhos)
+            copia = os.path.join(pasta, "sub", "a.xml"); shutil.copy(narwal, copia)
+            novos = [os.path.join(pasta, nome) for nome in ("d1.xml", "d2.xml")]
+            for caminho in novos: shutil.copy(dimnfe, caminho)
+            assert monitor.verificar(), "O monitor não viu os arquivos novos."
+            extraidos, _ = deltas[-1]
+            assert extraidos[copia] is None, "A cópia do XML já carregado virou outra nota."
+            assert sum(1 for caminho in novos if extraidos[caminho]) == 1, "O mesmo XML repetido no delta virou duas notas."
+            assert monitor.copias.get(copia) == original, f"Cópia registrada errada: {monitor.copias}"
+            indice.adicionar(*next((caminho, extraidos[caminho]) for caminho in novos if extraidos[caminho]))
+            os.remove(original)
+            assert monitor.verificar(), "O monitor não viu a remoção."
+            extraidos, removidos = deltas[-1]
+            assert removidos == [original] and extraidos.get(copia), "Sem o original, a cópia não foi carregada."
+            assert copia not in monitor.copias, "A cópia carregada continuou registrada como cópia."
+        test_results[test_name] = ("OK", "Cópias ignoradas pela chave de acesso e promovidas quando o original sai.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_leitura_antecipada():
+    """A leitura antecipada deve manter a ordem, marcar a falha de leitura e gerar as mesmas notas, inclusive com mmap."""
+    test_name = "Leitura Antecipada dos XMLs"
+    try:
+        caminhos = [resource_path(os.path.join("test_assets", nome)) for nome in ("narwal_test_note.xml", "dimnfe_test_note.xml")]
+        inexistente = resource_path(os.path.join("test_assets", "nao_existe.xml"))
+        esperado = [core_logic.extrair_dados_nf(c).como_dict() for c in caminhos]
+        lidos = list(source_logic.ler_antecipado(caminhos + [inexistente], profundidade=2, limite_mmap=1))
+        try:
+            assert [c for c, _ in lidos] == caminhos + [inexistente], "A ordem dos arquivos não foi mantida."
+            assert lidos[-1][1] is None, "A falha de leitura não foi sinalizada."
+            for motor in core_logic.MOTORES_EXTRACAO:
+                obtido = [core_logic.extrair_dados_nf(c, motor, conteudo=conteudo).como_dict() for c, conteudo in lidos[:2]]
+                assert obtido == esperado, f"Motor '{motor}' extraiu dados diferentes a partir do conteúdo mapeado."
+        finally:
+            for _, conteudo in lidos: source_logic.liberar(conteudo)
+        test_results[test_name] = ("OK", "Mesmas notas lendo à frente do parser (com mmap).")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
 def test_dashboard_logic(parsed_data_list):
     """Testa a lógica de cálculo do dashboard com os dados combinados."""
     test_name = "Lógica de Cálculos do Dashboard"
@@ -113,6 +370,232 @@ def test_dashboard_logic(parsed_data_list):
     except Exception as e:
         test_results[test_name] = ("FALHOU", f"Erro nos cálculos. Detalhe: {e}")
 
+def test_dashboard_colunar(parsed_data_list):
+    """Confere se a tabela em colunas gera os mesmos totais do cálculo nota a nota, inclusive depois de uma edição."""
+    test_name = "Dashboard (Tabela em Colunas)"
+    try:
+        notas = [core_logic.NotaFiscal.de_dict(d.como_dict()) for d in parsed_data_list]
+        tabela = columnar_logic.TabelaNotas(enumerate(notas))
+        notas[0].editar(status_nf='Cancelada (Manual)'); tabela.atualizar([notas[0]])
+        esperado = core_logic.calcular_dados_dashboard(notas)['resumo_geral']
+        obtido = tabela.resumo_dashboard()['resumo_geral']
+        for chave in ('total_notas', 'notas_entrada', 'notas_saida', 'notas_canceladas', 'processos_unicos'):
+            assert esperado[chave] == obtido[chave], f"'{chave}' difere ({esperado[chave]} x {obtido[chave]})"
+        for chave in ('valor_total_entrada', 'valor_total_saida', 'valor_total_produtos'):
+            assert abs(esperado[chave] - obtido[chave]) < 0.005, f"'{chave}' difere ({esperado[chave]} x {obtido[chave]})"
+        test_results[test_name] = ("OK", "Totais iguais aos do cálculo nota a nota.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_snapshot_parquet(parsed_data_list):
+    """Grava as notas num snapshot Parquet temporário e confere se voltam iguais."""
+    test_name = "Snapshot Parquet (Exportar/Importar)"
+    if not columnar_logic.PYARROW_AVAILABLE:
+        test_results[test_name] = ("OK", "pyarrow não instalado; teste ignorado."); return
+    try:
+        import tempfile
+        pares = [(f"nota_{i}.xml", dados) for i, dados in enumerate(parsed_data_list)]
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "snapshot.parquet")
+            columnar_logic.exportar_snapshot(pares, caminho)
+            recarregados = columnar_logic.importar_snapshot(caminho)
+        assert len(recarregados) == len(pares), f"Esperadas {len(pares)} notas, vieram {len(recarregados)}"
+        for (caminho_a, original), (caminho_b, recarregada) in zip(pares, recarregados):
+            assert caminho_a == caminho_b and original.como_dict() == recarregada.como_dict(), f"Nota '{original.get('nome_arquivo')}' mudou no snapshot."
+        test_results[test_name] = ("OK", "Notas recarregadas sem diferenças.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_relatorio_csv(parsed_data_list):
+    """Gera a Planilha Completa em CSV e confere separador, decimal brasileiro e número de linhas."""
+    test_name = "Relatório CSV (Planilha Completa)"
+    try:
+        import csv, tempfile
+        planilha = core_logic.montar_planilha_completa(parsed_data_list, {}, export_logic.criar_escritor('csv'))
+        with tempfile.TemporaryDirectory() as pasta:
+            planilha.save(os.path.join(pasta, "relatorio.csv"))
+            linhas = {}
+            for arquivo in planilha.arquivos:
+                with open(arquivo, encoding='utf-8-sig', newline='') as f: linhas[os.path.basename(arquivo)] = list(csv.reader(f, delimiter=';'))
+        assert len(linhas) == len(planilha.abas), "Esperado um arquivo por aba."
+        entradas = sum(1 for dados in parsed_data_list if dados['tipo_nota'] == 'Entrada')
+        entrada = linhas["relatorio - Entrada.csv"]
+        assert entrada[0] == core_logic.CABECALHOS_COMPLETOS, "Cabeçalho da aba Entrada difere."
+        assert len(entrada) - 1 == entradas, f"Esperadas {entradas} linhas de Entrada, vieram {len(entrada) - 1}"
+        coluna = entrada[0].index("Valor Total")
+        for linha, dados in zip(entrada[1:], (d for d in parsed_data_list if d['tipo_nota'] == 'Entrada')):
+            assert linha[coluna] == f"{dados['valor_total_nf']:.2f}".replace('.', ','), f"Valor '{linha[coluna]}' fora do padrão brasileiro."
+        test_results[test_name] = ("OK", f"{len(linhas)} arquivos CSV gerados corretamente.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_relatorio_xlsx_rapido(parsed_data_list):
+    """O Excel rápido (xlsxwriter) deve sair com os mesmos valores e formatos, célula a célula, do Excel formatado."""
+    test_name = "Relatório Excel Rápido (Formatos)"
+    if not export_logic.XLSXWRITER_AVAILABLE:
+        test_results[test_name] = ("OK", "xlsxwriter não instalado; teste ignorado."); return
+    try:
+        import tempfile
+        from openpyxl import load_workbook
+        def celulas(caminho):
+            wb = load_workbook(caminho); abas = {}
+            for ws in wb.worksheets:
+                assert not any(dimensao.style != 'Normal' for dimensao in ws.column_dimensions.values()), f"Aba '{ws.title}' com formato na coluna inteira."
+                abas[ws.title] = [[(c.value, c.number_format, c.border.left.style, bool(c.font.b), c.fill.fgColor.rgb[-6:] if c.fill.fill_type else None) for c in linha] for linha in ws.iter_rows()]
+            return abas
+        with tempfile.TemporaryDirectory() as pasta:
+            obtidos = {}
+            for formato in ('xlsx', 'xlsx_rapido'):
+                caminho = os.path.join(pasta, f"{formato}.xlsx")
+                core_logic.montar_planilha_completa(parsed_data_list, {}, export_logic.criar_escritor(formato)).save(caminho)
+                obtidos[formato] = celulas(caminho)
+        esperado, obtido = obtidos['xlsx'], obtidos['xlsx_rapido']
+        assert list(esperado) == list(obtido), f"Abas diferentes: {list(esperado)} x {list(obtido)}"
+        for aba in esperado:
+            assert len(esperado[aba]) == len(obtido[aba]), f"Aba '{aba}': {len(esperado[aba])} x {len(obtido[aba])} linhas."
+            for numero, (linha_esperada, linha_obtida) in enumerate(zip(esperado[aba], obtido[aba]), 1):
+                for a, b in zip(linha_esperada, linha_obtida):
+                    assert a[1:] == b[1:] and (a[0] or None) == (b[0] or None), f"Aba '{aba}', linha {numero}: {a} x {b}"
+        test_results[test_name] = ("OK", f"{len(esperado)} aba(s) com os mesmos formatos do Excel formatado.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_particao_notas(parsed_data_list):
+    """Cancela uma nota já particionada e confere se a atualização incremental bate com a partição refeita do zero."""
+    test_name = "Partição de Notas (Atualização Incremental)"
+    try:
+        particao = core_logic.ParticaoNotas(enumerate(parsed_data_list))
+        assert len(particao.saida) + len(particao.entrada_planilha) == len(parsed_data_list), "Notas perdidas na partição."
+        nota = next((d for d in parsed_data_list if d['tipo_nota'] == 'Saída' and 'Cancelada' not in d['status_nf']), None)
+        if nota is not None:
+            copia = particao.copia_notas()
+            nota.editar(status_nf='Cancelada (Manual)'); particao.atualizar([nota])
+            try:
+                assert copia.contagem_saida(nota['processo_normalizado']) == particao.contagem_saida(nota['processo_normalizado']) + 1, "A cópia viu a edição feita depois dela."
+                copiadas = [n for n in copia.saida if n.numero_nf == nota.numero_nf]
+                assert copiadas and all('Cancelada' not in n['status_nf'] for n in copiadas), "A nota copiada foi alterada."
+                refeita = core_logic.ParticaoNotas(enumerate(parsed_data_list))
+                processo = nota['processo_normalizado']
+                assert particao.contagem_saida(processo) == refeita.contagem_saida(processo), "Contagem de Saídas não foi atualizada."
+                assert [id(n) for n in particao.servicos({})[0]] == [id(n) for n in refeita.servicos({})[0]], "Serviços autorizados divergem."
+            finally:
+                nota.reverter()
+        test_results[test_name] = ("OK", "Partição incremental igual à refeita.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_indice_cancelamentos(parsed_data_list):
+    """Um evento de cancelamento deve neutralizar a nota de mesma chave (chegando antes ou depois) e liberá-la ao sair."""
+    test_name = "Índice de Chaves (Cancelamento por Evento)"
+    try:
+        nota = next(d.copy() for d in parsed_data_list if d['status_nf'] == 'Autorizada')
+        valor = nota['valor_total_nf']
+        evento = core_logic.NotaFiscal(nome_arquivo="evento.xml", tipo_nota='N/A', status_nf="Cancelada", chave_acesso=nota['chave_acesso'])
+        indice = core_logic.IndiceChaves()
+        assert indice.adicionar("nota.xml", nota) == [], "Nota sem cancelamento não deveria ser alterada."
+        assert indice.adicionar("evento.xml", evento) == [nota], "O evento não neutralizou a nota."
+        assert nota['status_nf'] == core_logic.STATUS_CANCELADA_EVENTO and nota['valor_total_nf'] == 0.0, f"Nota ficou como '{nota['status_nf']}'."
+        assert indice.remover("evento.xml") == [nota] and nota['status_nf'] == 'Autorizada' and nota['valor_total_nf'] == valor, "A nota não voltou ao original."
+        indice.remover("nota.xml"); indice.adicionar("evento.xml", evento)
+        assert indice.adicionar("nota.xml", nota) == [nota], "Nota que chega depois do evento não foi neutralizada."
+        test_results[test_name] = ("OK", f"Nota {nota['numero_nf']} cancelada e restaurada pelo evento.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_fila_tarefas():
+    """Envia uma tarefa que só termina se for cancelada e outra comum, e confere o estado final de cada uma."""
+    test_name = "Fila de Tarefas (Cancelamento)"
+    try:
+        import time, threading
+        fila = job_logic.FilaTarefas(); iniciou = threading.Event()
+        def sem_fim(tarefa):
+            iniciou.set()
+            while True: tarefa.progresso(0, 1); time.sleep(0.01)
+        longa = fila.enviar("Sem fim", sem_fim); curta = fila.enviar("Curta", lambda tarefa: 42)
+        assert iniciou.wait(5), "A fila não iniciou a primeira tarefa."
+        fila.cancelar(longa)
+        limite = time.monotonic() + 5
+        while fila.pendentes() and time.monotonic() < limite: time.sleep(0.01)
+        assert longa.status == job_logic.CANCELADA, f"Tarefa cancelada terminou como '{longa.status}'."
+        assert curta.status == job_logic.CONCLUIDA and curta.resultado == 42, f"Tarefa seguinte terminou como '{curta.status}'."
+        fila.encerrar()
+        test_results[test_name] = ("OK", "Cancelamento atendido e a fila seguiu para a próxima tarefa.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_exportacao_cancelada():
+    """
+    Cancela o relatório de clientes (Excel) no meio da gravação: o arquivo é fechado, o incompleto é apagado e o
+    arquivo que já existia no destino continua intacto.
+    """
+    test_name = "Exportação Cancelada (Arquivo Fechado)"
+    try:
+        import tempfile
+        import time
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "clientes.xlsx"); fila = job_logic.FilaTarefas()
+            with open(caminho, "wb") as anterior: anterior.write(b"relatorio anterior")
+            clientes = [{'name': f"Cliente {i}", 'code': f"C{i:04d}"} for i in range(200)]; aberto_no_cancelamento = []
+            def arquivo_aberto(caminho):
+                if os.path.isdir("/proc/self/fd"):
+                    return os.path.realpath(caminho) in [os.path.realpath(os.path.join("/proc/self/fd", fd)) for fd in os.listdir("/proc/self/fd")]
+                try: os.replace(caminho, caminho + ".tmp"); os.replace(caminho + ".tmp", caminho); return False
+                except PermissionError: return True  # Windows: arquivo aberto não pode ser movido
+            def gravar(destino, progresso):
+                def progresso_cancelando(atual, total):
+                    if atual == 2: fila.cancelar_todas()  # depois de aberto o arquivo
+                    progresso(atual, total)
+                try: report_logic.gravar_clientes_excel(clientes, destino, progresso_cancelando)
+                except job_logic.TarefaCancelada:
+                    # Conferido antes de o traceback ser descartado (senão o coletor fecharia o arquivo por nós).
+                    aberto_no_cancelamento.append(arquivo_aberto(destino)); raise
+            report_logic._executar_exportacao(fila, "Clientes", gravar, caminho, "", "", None)
+            limite = time.monotonic() + 10
+            while (not fila.tarefas or fila.pendentes()) and time.monotonic() < limite: time.sleep(0.01)
+            tarefa = fila.tarefas[0]; fila.encerrar()
+            assert tarefa.status == job_logic.CANCELADA, f"Tarefa terminou como '{tarefa.status}'."
+            assert aberto_no_cancelamento == [False], "O arquivo continuou aberto depois do cancelamento."
+            assert os.listdir(pasta) == ["clientes.xlsx"], f"O arquivo incompleto não foi apagado: {os.listdir(pasta)}"
+            with open(caminho, "rb") as anterior: assert anterior.read() == b"relatorio anterior", "O arquivo que já existia foi alterado."
+        test_results[test_name] = ("OK", "Arquivo fechado, temporário removido e o anterior preservado.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_canal_progresso():
+    """Milhares de avisos de progresso entre dois pulsos devem virar uma única atualização da interface, com o último estado."""
+    test_name = "Canal de Progresso (Atualização Limitada)"
+    try:
+        pulsos, entregues = [], []
+        canal = job_logic.CanalProgresso(lambda ms, funcao: pulsos.append(funcao), lambda atual, total: entregues.append((atual, total))).iniciar()
+        for i in range(1, 5001): canal.informar(i, 10000)
+        pulsos.pop(0)()
+        for i in range(5001, 10001): canal.informar(i, 10000)
+        pulsos.pop(0)(); pulsos.pop(0)()  # o segundo pulso não tem novidade e não redesenha
+        canal.encerrar(); pulsos.pop(0)()  # depois de encerrado, o pulso pendente não se reagenda
+        assert entregues == [(5000, 10000), (10000, 10000)], f"Atualizações entregues: {entregues}"
+        assert not pulsos, "O canal continuou pulsando depois de encerrado."
+        test_results[test_name] = ("OK", "10000 avisos viraram 2 atualizações da interface.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
+def test_formatacao_moeda():
+    """Compara a formatação por valor e por coluna com a fórmula antiga dos replace."""
+    test_name = "Formatação de Moeda (R$)"
+    try:
+        import random
+        antiga = lambda v: f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        valores = [0.0, 0, 5, 0.005, 999.999, -1234.5, 1234567.891] + [round(random.uniform(-1e7, 1e7), 2) for _ in range(100)]
+        for valor in valores: assert format_logic.moeda_br(valor) == antiga(valor), f"moeda_br({valor!r}) = '{format_logic.moeda_br(valor)}'"
+        coluna = [random.choice(valores) for _ in range(5000)]
+        assert format_logic.formatar_moedas(coluna) == [antiga(v) for v in coluna], "Coluna grande formatada diferente."
+        assert format_logic.formatar_moedas([1.5, None, 'N/A', 2]) == ['R$ 1,50', '', 'N/A', 'R$ 2,00'], "Coluna mista formatada diferente."
+        assert format_logic.formatar_moedas([True, 1, 1.0, False, 0]) == [True, 'R$ 1,00', 'R$ 1,00', False, 'R$ 0,00'], "Booleano e número iguais dividindo o cache."
+        assert format_logic.formatar_moedas([1, True]) == ['R$ 1,00', True], "Número e booleano iguais dividindo o cache."
+        assert format_logic.decimal_br(1234.5) == '1234,50', "decimal_br fora do padrão."
+        test_results[test_name] = ("OK", f"{len(valores)} valores e {len(coluna)} linhas formatados como antes.")
+    except Exception as e:
+        test_results[test_name] = ("FALHOU", f"Detalhe: {e}")
+
 def test_user_auth():
     """Testa a lógica de verificação de senha (login)."""
     test_name = "Autenticação de Usuário"
@@ -310,6 +310,6 @@ class ReportPreviewWindow(ttk.Toplevel):
     def _get_visible_clients(self):
         visible_ids = self.client_tree.get_children()
         return [c for c in self.all_clients_cache if c['id'] in visible_ids]
-    def export_excel(self): report_logic.export_clients_to_excel(self._get_visible_clients(), self)
-    def export_pdf(self): report_logic.export_clients_to_pdf(self._get_visible_clients(), self)
-    def export_word(self): report_logic.export_clients_to_word(self._get_visible_clients(), self)
\ No newline at end of file
+    def export_excel(self): report_logic.export_clients_to_excel(self._get_visible_clients(), self, self.controller.tarefas)
+    def export_pdf(self): report_logic.export_clients_to_pdf(self._get_visible_clients(), self, self.controller.tarefas)
+    def export_word(self): report_logic.export_clients_to_word(self._get_visible_clients(), self, self.controller.tarefas)
\ No newline at end of file
@@ -7,6 +7,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import ttkbootstrap as ttk
 import dp_logic # Importa nossa nova lógica de DP
+import format_logic
 import threading
 
 class CompanyDialog(ttk.Toplevel):
@@ -547,7 +548,7 @@ class EmployeeManagementWindow(ttk.Toplevel):
         self.all_employees_list = employees
         self.selection_state.clear()
         for emp in self.all_employees_list:
-            salary_formatted = f"R$ {emp.get('salary', 0.0):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+            salary_formatted = format_logic.moeda_br(emp.get('salary', 0.0))
             item_id = self.tree.insert('', 'end', values=(emp['id'], emp['employee_code'], emp['full_name'], salary_formatted))
             if self.delete_mode:
                 self.selection_state[item_id] = False
@@ -12,6 +12,7 @@ from collections import defaultdict
 from ttkbootstrap.scrolled import ScrolledFrame
 from ttkbootstrap.tableview import Tableview
 import core_logic
+import format_logic
 
 class UpdateDownloadWindow(ttk.Toplevel):
     def __init__(self, controller, version_to_download):
@@ -138,7 +139,7 @@ class DashboardWindow(ttk.Toplevel):
 
     def update_dashboard_display(self):
         resumo_data = self.dashboard_data.get('resumo_geral', {})
-        def format_currency(value): return f"R$ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        format_currency = format_logic.moeda_br
         
         self.resumo_labels['total_notas'].set(resumo_data.get('total_notas', 0))
         self.resumo_labels['notas_entrada'].set(resumo_data.get('notas_entrada', 0))
@@ -157,10 +158,15 @@ class DashboardWindow(ttk.Toplevel):
 
     def recalculate_dashboard(self):
         nfe_tool_frame = self.controller.frames['NFeToolFrame']
-        self.dashboard_data = core_logic.calcular_dados_dashboard(nfe_tool_frame.dados_extraidos_em_memoria)
+        self.dashboard_data = nfe_tool_frame.recalcular_dashboard()
         self.update_dashboard_display()
         messagebox.showinfo("Recálculo", "Os totais do dashboard foram atualizados com sucesso.", parent=self)
 
+    def atualizar_dados(self, dashboard_data):
+        """Chamado pelo monitoramento da pasta quando chegam arquivos novos, alterados ou removidos."""
+        self.dashboard_data = dashboard_data
+        self.update_dashboard_display()
+
     def _collect_and_validate_counts(self):
         contagens_confirmadas = {}
         for processo, (entry, contagem_encontrada) in self.entry_widgets.items():
@@ -203,14 +209,89 @@ class StatusActionDialog(ttk.Toplevel):
     def on_cancel(self):
         self.result = None; self.destroy()
 
+class TabelaVirtual:
+    """
+    Treeview que só materializa as linhas visíveis. Guarda a lista completa (as notas) e, a cada rolagem
+    ou redimensionamento, recria apenas as linhas da janela visível, formatando só elas. A barra de rolagem
+    vertical é controlada aqui, já que a Treeview nunca tem mais linhas do que cabem na tela.
+    'formatar' recebe a lista de linhas da janela e devolve os valores de cada uma (formatação por coluna).
+    O iid de cada linha é a identidade da nota (iid_de): dois arquivos com o mesmo nome, de pastas ou .zip
+    diferentes, são linhas distintas.
+    """
+    ALTURA_LINHA_PADRAO = 20
+
+    def __init__(self, master, headers, formatar, tags=None):
+        self.headers = headers; self.formatar = formatar; self.tags = tags or (lambda dados: ())
+        self.linhas = []; self.inicio = 0; self.visiveis = 1; self.ordem = None
+        tree_frame = ttk.Frame(master); tree_frame.pack(expand=True, fill="both")
+        self.tree = ttk.Treeview(tree_frame, columns=headers, show='headings'); self.tree.pack(side="left", expand=True, fill="both")
+        self.ysb = ttk.Scrollbar(tree_frame, orient="vertical", command=self._rolar); self.ysb.pack(side="right", fill="y")
+        xsb = ttk.Scrollbar(master, orient="horizontal", command=self.tree.xview); xsb.pack(side="bottom", fill="x"); self.tree.configure(xscrollcommand=xsb.set)
+        self.tree.bind('<Configure>', lambda e: self.renderizar())
+        self.tree.bind('<MouseWheel>', lambda e: self._rolar('scroll', -3 if e.delta > 0 else 3, 'units'))
+        self.tree.bind('<Button-4>', lambda e: self._rolar('scroll', -3, 'units')); self.tree.bind('<Button-5>', lambda e: self._rolar('scroll', 3, 'units'))
+        for tecla, args in (('<Prior>', (-1, 'pages')), ('<Next>', (1, 'pages')), ('<Home>', None), ('<End>', None)):
+            self.tree.bind(tecla, lambda e, a=args, t=tecla: self._rolar('scroll', *a) if a else self._rolar('moveto', 0 if t == '<Home>' else 1))
+
+    def __len__(self): return len(self.linhas)
+
+    @staticmethod
+    def iid_de(dados): return f"nota{id(dados)}"
+
+    def definir_linhas(self, linhas):
+        """Troca os dados mantendo a posição da rolagem e a ordenação escolhida."""
+        self.linhas = list(linhas)
+        if self.ordem: self.linhas.sort(key=self.ordem[0], reverse=self.ordem[1])
+        self.renderizar()
+
+    def ordenar(self, chave, reverse):
+        self.ordem = (chave, reverse); self.linhas.sort(key=chave, reverse=reverse); self.inicio = 0; self.renderizar()
+
+    def _altura_linha(self):
+        try: return int(ttk.Style().lookup('Treeview', 'rowheight') or 0) or self.ALTURA_LINHA_PADRAO
+        except (tk.TclError, ValueError): return self.ALTURA_LINHA_PADRAO
+
+    def _capacidade(self):
+        altura = self.tree.winfo_height()
+        if altura <= 1: return 40  # ainda não desenhada; o <Configure> refaz com o tamanho real
+        primeiras = self.tree.get_children('')
+        caixa = self.tree.bbox(primeiras[0]) if primeiras else None
+        topo = caixa[1] if caixa else self._altura_linha() + 5  # altura do cabeçalho
+        return max(1, (altura - topo) // self._altura_linha())
+
+    def renderizar(self):
+        self.visiveis = self._capacidade()
+        self.inicio = max(0, min(self.inicio, len(self.linhas) - self.visiveis))
+        self.tree.delete(*self.tree.get_children(''))
+        janela = self.linhas[self.inicio:self.inicio + self.visiveis]
+        for dados, valores in zip(janela, self.formatar(janela)):
+            self.tree.insert('', 'end', iid=self.iid_de(dados), values=valores, tags=self.tags(dados))
+        total = len(self.linhas)
+        if total: self.ysb.set(self.inicio / total, min(1.0, (self.inicio + self.visiveis) / total))
+        else: self.ysb.set(0.0, 1.0)
+
+    def atualizar_linha(self, iid, dados):
+        """Refaz uma linha visível no lugar (sem mexer nas demais)."""
+        if self.tree.exists(iid): self.tree.item(iid, values=self.formatar([dados])[0], tags=self.tags(dados))
+
+    def _rolar(self, acao, quantidade, unidade=None):
+        if acao == 'moveto': self.inicio = int(float(quantidade) * len(self.linhas))
+        else: self.inicio += int(quantidade) * (self.visiveis if unidade == 'pages' else 1)
+        self.renderizar()
+        return "break"
+
 class PreviewWindow(ttk.Toplevel):
     def __init__(self, controller, parent_dashboard, all_extracted_data, contagens_confirmadas):
         super().__init__(title="Editar e Visualizar Dados", master=parent_dashboard)
         self.controller = controller
         self.parent_dashboard = parent_dashboard
         self.all_extracted_data = all_extracted_data
+        # iid das linhas (TabelaVirtual.iid_de) -> nota. Guardar a nota aqui também impede que o id dela seja
+        # reaproveitado por outra enquanto a janela estiver aberta.
+        self.nota_por_iid = {}
+        self.chaves_ordenacao = {}  # coluna -> {iid: chave}, preenchido conforme as colunas são ordenadas
         self.contagens_confirmadas = contagens_confirmadas
-        self.treeviews = {}
+        self.abas = {}  # nome -> (frame, TabelaVirtual)
         self.checked_items = {}
         self.geometry("1200x700"); self.grab_set()
         self.create_widgets()
@@ -229,8 +310,7 @@ class PreviewWindow(ttk.Toplevel):
         self.parent_dashboard.recalculate_dashboard(); self.destroy()
 
     def build_tabs(self):
-        for i in self.notebook.tabs(): self.notebook.forget(i)
-        self.treeviews.clear()
+        """Cria as abas na primeira vez; depois só troca os dados de cada uma (sem recriar as Treeviews)."""
         self.checked_items.clear()
         dados_entrada, dados_saida, dados_servico_auth, dados_servico_pend = self._process_data()
         cabecalhos = self._get_headers()
@@ -241,30 +321,36 @@ class PreviewWindow(ttk.Toplevel):
         self.update_action_button_state()
 
     def _process_data(self):
-        dados_entrada, dados_saida, dados_servico_auth, dados_servico_pend = [], [], [], []
-        processos_saida = defaultdict(list)
-        for dados in self.all_extracted_data:
-            if dados['tipo_nota'] == 'Saída' and 'Cancelada' not in dados.get('status_nf', ''):
-                processos_saida[dados.get('processo_normalizado', 'N/A')].append(dados)
-        for dados in self.all_extracted_data:
-            if dados['tipo_nota'] == "Saída": dados_saida.append(dados)
-            elif dados['tipo_nota'] == "Entrada": dados_entrada.append(dados)
-            if dados.get('valor_servico_trading', 0.0) > 0.0 and dados['tipo_nota'] == 'Entrada' and 'Cancelada' not in dados.get('status_nf', ''):
-                processo = dados.get('processo_normalizado', 'N/A')
-                nfs_encontradas = len(processos_saida.get(processo, []))
-                contagem_info = self.contagens_confirmadas.get(processo)
-                esperada = contagem_info.get('esperado') if contagem_info else None
-                auth = False
-                if processo in self.contagens_confirmadas:
-                    if esperada is not None and nfs_encontradas == esperada: auth = True
-                elif nfs_encontradas > 0: auth = True
-                
-                if auth: dados_servico_auth.append(dados)
-                else:
-                    dados['qtde_encontrada'] = nfs_encontradas; dados['qtde_esperada'] = esperada
-                    dados['qtde_a_emitir'] = esperada - nfs_encontradas if esperada is not None else 'N/A'
-                    dados_servico_pend.append(dados)
-        return dados_entrada, dados_saida, dados_servico_auth, dados_servico_pend
+        # Partição mantida pelo NFeToolFrame (mesmas notas desta janela), já atualizada em notas_editadas().
+        particao = self.controller.frames['NFeToolFrame'].particao_notas
+        return (particao.entrada, particao.saida) + self._process_servicos(particao)
+
+    def _process_servicos(self, particao):
+        """Divide só as notas de serviço (autorizados, pendentes), gravando as contagens nas pendentes."""
+        dados_servico_auth, pendentes = particao.servicos(self.contagens_confirmadas)
+        dados_servico_pend = []
+        for dados, nfs_encontradas, esperada, a_emitir in pendentes:
+            dados['qtde_encontrada'] = nfs_encontradas; dados['qtde_esperada'] = esperada; dados['qtde_a_emitir'] = a_emitir
+            dados_servico_pend.append(dados)
+        return dados_servico_auth, dados_servico_pend
+
+    def _atualizar_abas(self, alteradas):
+        """
+        Depois de cancelar/reverter, sem refazer as abas: o tipo da nota não muda, então Entrada e Saída só
+        redesenham as linhas editadas (se visíveis; as demais são formatadas ao rolar). Os serviços dependem
+        do status e das Saídas do processo: só as abas de serviço são redivididas, e só se alguma nota mudou
+        de aba; a de pendentes, pequena, é reordenada com as contagens novas.
+        """
+        self.checked_items.clear()  # as marcadas são justamente as editadas
+        cabecalhos = self._get_headers()
+        autorizados, pendentes = self._process_servicos(self.controller.frames['NFeToolFrame'].particao_notas)
+        for nome, chave_cabecalho, linhas in (("Serviços Autorizados", 'servico', autorizados), ("Serviços Pendentes", 'pendentes', pendentes)):
+            atuais = self.abas[nome][1].linhas if nome in self.abas else []
+            if {id(d) for d in linhas} != {id(d) for d in atuais}: self.create_tab(nome, cabecalhos[chave_cabecalho], linhas)
+            elif nome == "Serviços Pendentes" and linhas: self.abas[nome][1].definir_linhas(linhas)
+        for _, tabela in self.abas.values():
+            for data_dict in alteradas: tabela.atualizar_linha(self._iid(data_dict), data_dict)
+        self.update_action_button_state()
 
     def _get_headers(self):
         cabecalho_completo = ['Arquivo', 'Número da NF', 'Status da NF', 'Data de Emissão', 'Cliente', 'CNPJ/CPF Dest.', 'Nome do Processo', 'Valor Serviço Trading', 'CFOP', 'Valor Total dos Produtos', 'Valor II', 'Valor ICMS', 'Valor IPI', 'Valor PIS', 'Valor COFINS', 'Outras Despesas', 'Valor AFRMM', 'Frete Nacional', 'Valor Total']
@@ -275,56 +361,57 @@ class PreviewWindow(ttk.Toplevel):
         }
 
     def create_tab(self, sheet_name, headers, data_rows):
-        if not data_rows: return
-        tab = ttk.Frame(self.notebook, padding=5); self.notebook.add(tab, text=f"{sheet_name} ({len(data_rows)})")
-        tree_frame = ttk.Frame(tab); tree_frame.pack(expand=True, fill="both")
-        tree = ttk.Treeview(tree_frame, columns=headers, show='headings'); tree.pack(side="left", expand=True, fill="both")
-        ysb = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview); ysb.pack(side="right", fill="y"); tree.configure(yscrollcommand=ysb.set)
-        xsb = ttk.Scrollbar(tab, orient="horizontal", command=tree.xview); xsb.pack(side="bottom", fill="x"); tree.configure(xscrollcommand=xsb.set)
-
-        for header in headers:
-            anchor = 'e' if 'Valor' in header or 'Frete' in header else 'w'
-            tree.heading(header, text=header, command=lambda h=header, t=tree: self.sort_column(t, h, False))
-            tree.column(header, width=150, anchor=anchor, stretch=False)
-        
-        tree.column('select', width=40, stretch=False, anchor='center')
-        tree.heading('select', text='[ ]')
-        
-        tree.tag_configure('cancelled_row', foreground='gray', font='-slant italic')
-        self.populate_tree(tree, headers, data_rows)
-        self.treeviews[sheet_name] = tree
-        tree.bind('<Button-1>', self.toggle_check)
-
-    def populate_tree(self, tree, headers, data_rows):
-        tree.delete(*tree.get_children())
-        if not hasattr(self, 'checked_items'): self.checked_items = {}
-        for data_dict in data_rows:
-            iid = data_dict.get('nome_arquivo')
-            self.checked_items[iid] = self.checked_items.get(iid, False)
-            checkbox = '[x]' if self.checked_items[iid] else '[ ]'
-            values = [checkbox] + [self._format_value(data_dict, h) for h in headers[1:]]
-            tags = ('cancelled_row',) if 'Cancelada' in str(data_dict.get('status_nf', '')) else ()
-            tree.insert('', 'end', values=values, iid=iid, tags=tags)
-    
-    def toggle_check(self, event):
+        if sheet_name in self.abas:
+            tab, tabela = self.abas[sheet_name]; tabela.definir_linhas(data_rows)
+        else:
+            if not data_rows: return
+            tab = ttk.Frame(self.notebook, padding=5); self.notebook.add(tab, text=sheet_name)
+            tabela = TabelaVirtual(tab, headers, lambda linhas, h=headers: self._format_rows(linhas, h),
+                                   tags=lambda dados: ('cancelled_row',) if 'Cancelada' in str(dados.get('status_nf', '')) else ())
+            tree = tabela.tree
+            for header in headers:
+                anchor = 'e' if 'Valor' in header or 'Frete' in header else 'w'
+                tree.heading(header, text=header, command=lambda h=header, t=tabela: self.sort_column(t, h, False))
+                tree.column(header, width=150, anchor=anchor, stretch=False)
+            tree.column('select', width=40, stretch=False, anchor='center')
+            tree.heading('select', text='[ ]')
+            tree.tag_configure('cancelled_row', foreground='gray', font='-slant italic')
+            tree.bind('<Button-1>', lambda e, t=tabela: self.toggle_check(e, t))
+            tabela.definir_linhas(data_rows)
+            self.abas[sheet_name] = (tab, tabela)
+        # Aba sem linhas fica oculta (como quando não era criada); volta a aparecer se ganhar linhas.
+        if data_rows: self.notebook.add(tab, text=f"{sheet_name} ({len(data_rows)})")
+        else: self.notebook.hide(tab)
+
+    def _format_rows(self, linhas, headers):
+        """Formata as linhas visíveis coluna a coluna (as de valores de uma vez, via format_logic)."""
+        colunas = [['[x]' if self.checked_items.get(self._iid(d)) else '[ ]' for d in linhas]]
+        colunas += [format_logic.formatar_moedas([self._raw_value(d, h) for d in linhas]) for h in headers[1:]]
+        return [list(valores) for valores in zip(*colunas)]
+
+    def _iid(self, dados):
+        iid = TabelaVirtual.iid_de(dados); self.nota_por_iid[iid] = dados
+        return iid
+
+    def toggle_check(self, event, tabela):
         tree = event.widget; iid = tree.identify_row(event.y)
         if not iid: return
         self.checked_items[iid] = not self.checked_items.get(iid, False)
-        current_values = list(tree.item(iid, 'values'))
-        current_values[0] = '[x]' if self.checked_items[iid] else '[ ]'
-        tree.item(iid, values=current_values)
+        tree.set(iid, 'select', '[x]' if self.checked_items[iid] else '[ ]')
         self.update_action_button_state()
         
-    def _format_value(self, data_dict, header):
-        key = self._get_key_from_header(header); value = data_dict.get(key)
-        if header in ['Valor ICMS', 'Valor IPI', 'Valor PIS', 'Valor COFINS']: value = float(data_dict.get('impostos', {}).get(key, '0.00'))
-        if isinstance(value, (int, float)):
-            return f"R$ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        return value if value is not None else ''
+    def _raw_value(self, data_dict, header):
+        key = self._get_key_from_header(header)
+        if header in ['Valor ICMS', 'Valor IPI', 'Valor PIS', 'Valor COFINS']: return float(data_dict.get('impostos', {}).get(key, '0.00'))
+        return data_dict.get(key)
         
+    CHAVES_CABECALHO = { 'Arquivo': 'nome_arquivo', 'Número da NF': 'numero_nf', 'Status da NF': 'status_nf', 'Data de Emissão': 'data_emissao', 'Cliente': 'nome_cliente', 'CNPJ/CPF Dest.': 'cnpj_cpf_destinatario', 'Nome do Processo': 'nome_processo', 'CFOP': 'cfop_nf', 'Valor Total dos Produtos': 'valor_total_produtos', 'Valor II': 'vII', 'Valor ICMS': 'vICMS', 'Valor IPI': 'vIPI', 'Valor PIS': 'vPIS', 'Valor COFINS': 'vCOFINS', 'Outras Despesas': 'vOutras', 'Valor AFRMM': 'vAFRMM', 'Frete Nacional': 'valor_frete_nacional', 'Valor Total': 'valor_total_nf', 'Valor Serviço Trading': 'valor_servico_trading', 'Qtde Encontrada': 'qtde_encontrada', 'Qtde Esperada': 'qtde_esperada', 'Qtde a Emitir': 'qtde_a_emitir' }
+
+    # Recalculadas em _process_servicos a cada edição (cancelar uma Saída muda as contagens de outras notas).
+    COLUNAS_DERIVADAS = ('Qtde Encontrada', 'Qtde Esperada', 'Qtde a Emitir')
+
     def _get_key_from_header(self, header):
-        mapping = { 'Arquivo': 'nome_arquivo', 'Número da NF': 'numero_nf', 'Status da NF': 'status_nf', 'Data de Emissão': 'data_emissao', 'Cliente': 'nome_cliente', 'CNPJ/CPF Dest.': 'cnpj_cpf_destinatario', 'Nome do Processo': 'nome_processo', 'CFOP': 'cfop_nf', 'Valor Total dos Produtos': 'valor_total_produtos', 'Valor II': 'vII', 'Valor ICMS': 'vICMS', 'Valor IPI': 'vIPI', 'Valor PIS': 'vPIS', 'Valor COFINS': 'vCOFINS', 'Outras Despesas': 'vOutras', 'Valor AFRMM': 'vAFRMM', 'Frete Nacional': 'valor_frete_nacional', 'Valor Total': 'valor_total_nf', 'Valor Serviço Trading': 'valor_servico_trading', 'Qtde Encontrada': 'qtde_encontrada', 'Qtde Esperada': 'qtde_esperada', 'Qtde a Emitir': 'qtde_a_emitir' }
-        return mapping.get(header)
+        return self.CHAVES_CABECALHO.get(header)
 
     def update_action_button_state(self, event=None):
         any_checked = any(self.checked_items.values())
@@ -339,40 +426,47 @@ class PreviewWindow(ttk.Toplevel):
             self.apply_batch_status_change(checked_iids, dialog.result)
     
     def apply_batch_status_change(self, iids, action):
+        alteradas = []
         for iid in iids:
-            for i, data_dict in enumerate(self.all_extracted_data):
-                if data_dict.get('nome_arquivo') == iid:
-                    if action == 'cancel':
-                        self.all_extracted_data[i]['status_nf'] = 'Cancelada (Manual)'
-                        self.all_extracted_data[i]['valor_total_nf'] = 0.0
-                        self.all_extracted_data[i]['valor_total_produtos'] = 0.0
-                        self.all_extracted_data[i]['valor_frete_nacional'] = 0.0
-                        self.all_extracted_data[i]['vII'] = 0.0
-                        self.all_extracted_data[i]['vAFRMM'] = 0.0
-                        self.all_extracted_data[i]['vOutras'] = 0.0
-                        self.all_extracted_data[i]['impostos'] = defaultdict(lambda: '0.00')
-                    elif action == 'revert':
-                        if '_dados_originais' in data_dict:
-                            self.all_extracted_data[i] = data_dict['_dados_originais'].copy()
-                    break
-        self.build_tabs()
+            data_dict = self.nota_por_iid.get(iid)
+            if data_dict is None: continue
+            # A nota é editada no próprio objeto (o NFeToolFrame guarda as mesmas referências);
+            # a cópia dos valores originais só é feita aqui, na primeira edição.
+            if action == 'cancel':
+                core_logic.cancelar_nota(data_dict)
+            elif action == 'revert':
+                data_dict.reverter()
+            alteradas.append(data_dict)
+        self.controller.frames['NFeToolFrame'].notas_editadas(alteradas)
+        for col, chaves in self.chaves_ordenacao.items():
+            for data_dict in alteradas:
+                iid = self._iid(data_dict)
+                if iid in chaves: chaves[iid] = self._chave_ordenacao(data_dict, col)
+        self._atualizar_abas(alteradas)
     
-    def sort_column(self, tree, col, reverse):
+    def _chave_ordenacao(self, data_dict, col):
         key = self._get_key_from_header(col)
-        is_numeric = 'Valor' in col or 'Qtde' in col or 'Frete' in col or 'Número' in col
+        if col in ('Valor ICMS', 'Valor IPI', 'Valor PIS', 'Valor COFINS'): return float(data_dict.get('impostos', {}).get(key, 0.0))
+        val = data_dict.get(key)
+        if 'Valor' in col or 'Qtde' in col or 'Frete' in col or 'Número' in col:
+            if isinstance(val, (int, float)): return val
+            try: return float(val)  # Número da NF vem como texto ('000000118')
+            except (TypeError, ValueError): return 0.0
+        return '' if val is None else str(val)
+
+    def sort_column(self, tabela, col, reverse):
         try:
-            data_list = []
-            for iid in tree.get_children(''):
-                item_data = next((d for d in self.all_extracted_data if d.get('nome_arquivo') == iid), None)
-                if not item_data: continue
-                val = item_data.get(key, 0.0 if is_numeric else '')
-                if 'imposto' in col.lower(): val = float(item_data.get('impostos', {}).get(key, '0.00'))
-                if is_numeric and not isinstance(val, (int, float)): val = 0.0
-                data_list.append((val, iid))
-
-            data_list.sort(key=lambda t: t[0], reverse=reverse)
-            for index, (val, iid) in enumerate(data_list):
-                tree.move(iid, '', index)
-            tree.heading(col, command=lambda: self.sort_column(tree, col, not reverse))
+            # Cada chave é calculada uma vez por coluna e reaproveitada nas próximas ordenações; as colunas
+            # derivadas não entram no cache (a ordenação é refeita com os valores novos em definir_linhas).
+            if col in self.COLUNAS_DERIVADAS:
+                chave = lambda dados: self._chave_ordenacao(dados, col)
+            else:
+                chaves = self.chaves_ordenacao.setdefault(col, {})
+                def chave(dados):
+                    iid = self._iid(dados)
+                    if iid not in chaves: chaves[iid] = self._chave_ordenacao(dados, col)
+                    return chaves[iid]
+            tabela.ordenar(chave, reverse)
+            tabela.tree.heading(col, command=lambda: self.sort_column(tabela, col, not reverse))
         except Exception as e:
-            print(f"Erro ao ordenar coluna: {e}")
\ No newline at end of file
+            print(f"Erro ao ordenar coluna: {e}")
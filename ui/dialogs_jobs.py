@@ -0,0 +1,81 @@
+# ============================================================================
+# --- ARQUIVO: ui/dialogs_jobs.py ---
+# (Painel das tarefas em segundo plano: exportações na fila, em execução e o histórico)
+# ============================================================================
+
+import os
+import tkinter as tk
+from tkinter import ttk, messagebox
+import ttkbootstrap as ttk
+import job_logic
+
+class TarefasWindow(ttk.Toplevel):
+    """Lista as tarefas da FilaTarefas do controller e se atualiza a cada aviso da fila."""
+    def __init__(self, controller):
+        super().__init__(title="Tarefas em Segundo Plano", master=controller)
+        self.controller = controller; self.fila = controller.tarefas
+        self.geometry("900x400"); self.minsize(700, 300)
+        self.bind("<Escape>", lambda e: self.destroy())
+        self.create_widgets(); self.atualizar()
+        self.fila.ouvintes.append(self._on_tarefa)
+        self.bind("<Destroy>", self._on_destroy)
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10); main_frame.pack(expand=True, fill="both")
+        main_frame.rowconfigure(0, weight=1); main_frame.columnconfigure(0, weight=1)
+        colunas = ("id", "titulo", "status", "progresso", "inicio", "duracao", "detalhe")
+        self.tree = ttk.Treeview(main_frame, columns=colunas, show="headings", selectmode="browse")
+        for coluna, texto, largura in zip(colunas, ("#", "Tarefa", "Situação", "Progresso", "Início", "Duração", "Detalhe"), (40, 220, 90, 80, 70, 70, 300)):
+            self.tree.heading(coluna, text=texto); self.tree.column(coluna, width=largura, stretch=coluna in ("titulo", "detalhe"))
+        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.tree.yview); self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky="nsew"); scrollbar.grid(row=0, column=1, sticky="ns")
+        self.tree.bind("<Double-1>", lambda e: self.abrir_arquivo())
+        button_frame = ttk.Frame(main_frame); button_frame.grid(row=1, column=0, columnspan=2, pady=(10, 0), sticky="ew")
+        ttk.Button(button_frame, text="Cancelar Tarefa", command=self.cancelar_selecionada, bootstyle="danger-outline").pack(side="left", padx=(0, 5))
+        ttk.Button(button_frame, text="Cancelar Todas", command=self.fila.cancelar_todas, bootstyle="danger-outline").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Abrir Arquivo", command=self.abrir_arquivo, bootstyle="secondary").pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Limpar Histórico", command=self.fila.limpar_historico, bootstyle="secondary-outline").pack(side="right")
+
+    def _valores(self, tarefa):
+        progresso = f"{tarefa.percentual}%" if tarefa.status in (job_logic.EXECUTANDO, job_logic.CONCLUIDA) else ""
+        inicio = tarefa.iniciada_em.strftime("%H:%M:%S") if tarefa.iniciada_em else tarefa.criada_em.strftime("%H:%M:%S")
+        duracao = f"{tarefa.duracao:.1f}s" if tarefa.duracao is not None else ""
+        detalhe = tarefa.mensagem
+        if tarefa.status == job_logic.CONCLUIDA and tarefa.resultado: detalhe = "; ".join(os.path.basename(a) for a in _arquivos(tarefa))
+        elif tarefa.cancelamento_pedido and not tarefa.finalizada: detalhe = "Cancelando..."
+        return (tarefa.id, tarefa.titulo, tarefa.status, progresso, inicio, duracao, detalhe)
+
+    def atualizar(self):
+        selecionada = self.tree.selection()
+        self.tree.delete(*self.tree.get_children())
+        for tarefa in reversed(self.fila.tarefas): self.tree.insert("", "end", iid=str(tarefa.id), values=self._valores(tarefa))
+        if selecionada and self.tree.exists(selecionada[0]): self.tree.selection_set(selecionada[0])
+
+    def _on_tarefa(self, tarefa):
+        if not self.winfo_exists(): return
+        if tarefa is not None and self.tree.exists(str(tarefa.id)): self.tree.item(str(tarefa.id), values=self._valores(tarefa))
+        else: self.atualizar()
+
+    def _on_destroy(self, event):
+        if event.widget is self and self._on_tarefa in self.fila.ouvintes: self.fila.ouvintes.remove(self._on_tarefa)
+
+    def _tarefa_selecionada(self):
+        selecionada = self.tree.selection()
+        if not selecionada: return None
+        return next((tarefa for tarefa in self.fila.tarefas if str(tarefa.id) == selecionada[0]), None)
+
+    def cancelar_selecionada(self):
+        tarefa = self._tarefa_selecionada()
+        if tarefa is not None: self.fila.cancelar(tarefa)
+
+    def abrir_arquivo(self):
+        tarefa = self._tarefa_selecionada()
+        if tarefa is None or tarefa.status != job_logic.CONCLUIDA or not _arquivos(tarefa): return
+        try: os.startfile(_arquivos(tarefa)[0])
+        except Exception as e: messagebox.showerror("Erro", f"Não foi possível abrir o arquivo.\n{e}", parent=self)
+
+def _arquivos(tarefa):
+    """Arquivos gerados pela tarefa: o resultado pode ser um caminho ou uma lista deles."""
+    resultado = tarefa.resultado
+    if isinstance(resultado, str): return [resultado]
+    return [a for a in (resultado or []) if isinstance(a, str)]
@@ -0,0 +1,82 @@
+# ============================================================================
+# --- ARQUIVO: ui/dialogs_metrics.py ---
+# (Desempenho das extrações: histórico do log de métricas, etapas, arquivos mais lentos e sistemas emissores)
+# ============================================================================
+
+import tkinter as tk
+from tkinter import ttk
+import ttkbootstrap as ttk
+import metrics_logic
+
+def _ms(valor):
+    return f"{valor:.1f}" if valor is not None else "-"
+
+class DesempenhoWindow(ttk.Toplevel):
+    """Lista as execuções gravadas por metrics_logic; a selecionada é detalhada nas abas de baixo."""
+    def __init__(self, controller):
+        super().__init__(title="Desempenho das Extrações", master=controller)
+        self.controller = controller; self.execucoes = []
+        self.geometry("1000x600"); self.minsize(800, 450)
+        self.bind("<Escape>", lambda e: self.destroy())
+        self.create_widgets(); self.atualizar()
+
+    def _tabela(self, master, colunas):
+        """Treeview com barra de rolagem; colunas = [(id, título, largura, expande)]."""
+        frame = ttk.Frame(master); frame.rowconfigure(0, weight=1); frame.columnconfigure(0, weight=1)
+        tree = ttk.Treeview(frame, columns=[c[0] for c in colunas], show="headings")
+        for coluna, texto, largura, expande in colunas:
+            tree.heading(coluna, text=texto); tree.column(coluna, width=largura, stretch=expande, anchor="w" if expande else "e")
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview); tree.configure(yscrollcommand=scrollbar.set)
+        tree.grid(row=0, column=0, sticky="nsew"); scrollbar.grid(row=0, column=1, sticky="ns")
+        return frame, tree
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10); main_frame.pack(expand=True, fill="both")
+        main_frame.columnconfigure(0, weight=1); main_frame.rowconfigure(0, weight=1); main_frame.rowconfigure(2, weight=1)
+        frame, self.tree = self._tabela(main_frame, [
+            ("data", "Data", 140, False), ("origem", "Origem", 260, True), ("motor", "Motor", 60, False), ("arquivos", "Arquivos", 70, False),
+            ("cache", "Do cache", 70, False), ("segundos", "Tempo (s)", 70, False), ("taxa", "Arq/s", 60, False),
+            ("p50", "p50 (ms)", 70, False), ("p95", "p95 (ms)", 70, False), ("max", "Máx (ms)", 70, False)])
+        frame.grid(row=0, column=0, sticky="nsew"); self.tree.configure(selectmode="browse")
+        self.tree.bind("<<TreeviewSelect>>", lambda e: self.mostrar_detalhes())
+        self.resumo_var = tk.StringVar(); ttk.Label(main_frame, textvariable=self.resumo_var, wraplength=950).grid(row=1, column=0, sticky="w", pady=5)
+        notebook = ttk.Notebook(main_frame); notebook.grid(row=2, column=0, sticky="nsew")
+        frame, self.tree_etapas = self._tabela(notebook, [("etapa", "Etapa", 250, True), ("segundos", "Tempo (s)", 100, False), ("parcela", "% do total", 100, False)])
+        notebook.add(frame, text="Etapas")
+        frame, self.tree_lentos = self._tabela(notebook, [("arquivo", "Arquivo", 350, True), ("ms", "Tempo (ms)", 90, False), ("sistema", "Sistema Emissor", 200, True), ("etapa", "Etapa dominante", 150, False)])
+        notebook.add(frame, text="Arquivos mais lentos")
+        frame, self.tree_emissores = self._tabela(notebook, [("sistema", "Sistema Emissor", 300, True), ("arquivos", "Arquivos", 80, False), ("p50", "p50 (ms)", 80, False), ("p95", "p95 (ms)", 80, False), ("segundos", "Tempo (s)", 80, False)])
+        notebook.add(frame, text="Por sistema emissor")
+        button_frame = ttk.Frame(main_frame); button_frame.grid(row=3, column=0, pady=(10, 0), sticky="ew")
+        ttk.Button(button_frame, text="Atualizar", command=self.atualizar, bootstyle="secondary").pack(side="left")
+        ttk.Button(button_frame, text="Fechar", command=self.destroy, bootstyle="secondary-outline").pack(side="right")
+
+    def atualizar(self):
+        self.execucoes = metrics_logic.ler_execucoes()
+        self.tree.delete(*self.tree.get_children())
+        for i, execucao in enumerate(self.execucoes):
+            self.tree.insert("", "end", iid=str(i), values=(
+                execucao.get('data', '').replace('T', ' '), execucao.get('origem', ''), execucao.get('motor', ''), execucao.get('arquivos', 0),
+                execucao.get('em_cache', 0), f"{execucao['segundos']:.2f}" if execucao.get('segundos') is not None else "-",
+                f"{execucao['arquivos_por_segundo']:.0f}" if execucao.get('arquivos_por_segundo') else "-",
+                _ms(execucao.get('p50_ms')), _ms(execucao.get('p95_ms')), _ms(execucao.get('max_ms'))))
+        if self.execucoes: self.tree.selection_set("0")
+        else: self.resumo_var.set("Nenhuma extração registrada ainda."); self.mostrar_detalhes()
+
+    def mostrar_detalhes(self):
+        for tree in (self.tree_etapas, self.tree_lentos, self.tree_emissores): tree.delete(*tree.get_children())
+        selecao = self.tree.selection()
+        if not selecao: return
+        execucao = self.execucoes[int(selecao[0])]
+        self.resumo_var.set(metrics_logic.texto_resumo(execucao))
+        fases = execucao.get('fases', {}); etapas = execucao.get('etapas', {})
+        total = sum(fases.values()) or sum(etapas.values()) or 1.0
+        for fase, segundos in fases.items():
+            self.tree_etapas.insert("", "end", values=(metrics_logic.NOMES_FASES.get(fase, fase), f"{segundos:.3f}", f"{100 * segundos / total:.1f}%"))
+        # As etapas por arquivo são somadas entre os processos do pool: podem passar do tempo de parede da extração.
+        for etapa, segundos in etapas.items():
+            self.tree_etapas.insert("", "end", values=(f"    {metrics_logic.NOMES_ETAPAS.get(etapa, etapa)} (soma dos arquivos)", f"{segundos:.3f}", ""))
+        for lento in execucao.get('mais_lentos', []):
+            self.tree_lentos.insert("", "end", values=(lento['arquivo'], f"{lento['ms']:.1f}", lento['sistema'], metrics_logic.NOMES_ETAPAS.get(lento['etapa'], lento['etapa'] or "-")))
+        for sistema, numeros in execucao.get('por_emissor', {}).items():
+            self.tree_emissores.insert("", "end", values=(sistema, numeros['arquivos'], _ms(numeros['p50_ms']), _ms(numeros['p95_ms']), f"{numeros['segundos']:.3f}"))
@@ -7,9 +7,13 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import ttkbootstrap as ttk
 import auth_logic
+import cache_logic
+import export_logic
 import threading
 import webbrowser
 
+MOTORES_LEITURA = {"arvore": "Padrão (árvore completa)", "stream": "Streaming (menos memória)"}
+
 class SettingsWindow(ttk.Toplevel):
     def __init__(self, controller):
         super().__init__(title="Configurações Gerais", master=controller)
@@ -22,6 +26,10 @@ class SettingsWindow(ttk.Toplevel):
         self.filename_pattern_var = tk.StringVar(value=self.controller.output_filename_pattern)
         self.confirm_on_exit_var = tk.BooleanVar(value=self.controller.confirm_on_exit)
         self.ask_to_open_excel_var = tk.BooleanVar(value=self.controller.ask_to_open_excel)
+        self.detailed_log_var = tk.BooleanVar(value=self.controller.detailed_log)
+        self.extraction_engine_var = tk.StringVar(value=MOTORES_LEITURA.get(self.controller.extraction_engine, MOTORES_LEITURA["arvore"]))
+        self.formatos_relatorio = {formato: export_logic.FORMATOS_RELATORIO[formato][0] for formato in export_logic.formatos_disponiveis()}
+        self.report_format_var = tk.StringVar(value=self.formatos_relatorio.get(self.controller.report_format, self.formatos_relatorio[export_logic.FORMATO_PADRAO]))
         self.create_widgets()
 
     def create_widgets(self):
@@ -49,6 +57,14 @@ class SettingsWindow(ttk.Toplevel):
         prefs_frame.pack(fill="x", pady=20)
         ttk.Checkbutton(prefs_frame, text="Perguntar antes de sair do programa", variable=self.confirm_on_exit_var).pack(anchor='w', padx=5)
         ttk.Checkbutton(prefs_frame, text="Perguntar para abrir o Excel após salvar", variable=self.ask_to_open_excel_var).pack(anchor='w', padx=5)
+        ttk.Checkbutton(prefs_frame, text="Log detalhado (uma linha por arquivo; deixa a extração mais lenta)", variable=self.detailed_log_var).pack(anchor='w', padx=5)
+        engine_frame = ttk.Frame(prefs_frame); engine_frame.pack(anchor='w', padx=5, pady=(10, 0))
+        ttk.Label(engine_frame, text="Leitura dos XMLs:").pack(side='left')
+        ttk.Combobox(engine_frame, textvariable=self.extraction_engine_var, values=list(MOTORES_LEITURA.values()), state="readonly", width=28).pack(side='left', padx=(5, 0))
+        report_frame = ttk.Frame(prefs_frame); report_frame.pack(anchor='w', padx=5, pady=(10, 0))
+        ttk.Label(report_frame, text="Formato das planilhas:").pack(side='left')
+        ttk.Combobox(report_frame, textvariable=self.report_format_var, values=list(self.formatos_relatorio.values()), state="readonly", width=42).pack(side='left', padx=(5, 0))
+        ttk.Button(prefs_frame, text="Limpar Cache de Extração", command=self.clear_extraction_cache, bootstyle="secondary-outline").pack(anchor='w', padx=5, pady=(10, 0))
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(pady=10)
         ttk.Button(button_frame, text="Salvar e Fechar", command=self.save_and_close, bootstyle="primary").pack(side='left', padx=10)
@@ -60,12 +76,20 @@ class SettingsWindow(ttk.Toplevel):
     def select_output_path(self):
         folder_path = filedialog.askdirectory(title="Selecione a Pasta Padrão para Salvar Planilhas")
         if folder_path: self.output_path_var.set(folder_path)
+    def clear_extraction_cache(self):
+        if not messagebox.askyesno("Confirmação", "Todos os XMLs serão lidos novamente na próxima extração. Deseja continuar?", parent=self): return
+        success, message = cache_logic.limpar_cache()
+        if success: messagebox.showinfo("Cache", message, parent=self)
+        else: messagebox.showerror("Erro", message, parent=self)
     def save_and_close(self):
         self.controller.default_xml_path = self.xml_path_var.get()
         self.controller.default_output_path = self.output_path_var.get()
         self.controller.output_filename_pattern = self.filename_pattern_var.get()
         self.controller.confirm_on_exit = self.confirm_on_exit_var.get()
         self.controller.ask_to_open_excel = self.ask_to_open_excel_var.get()
+        self.controller.detailed_log = self.detailed_log_var.get(); self.controller.apply_log_level()
+        self.controller.extraction_engine = next((motor for motor, rotulo in MOTORES_LEITURA.items() if rotulo == self.extraction_engine_var.get()), "arvore")
+        self.controller.report_format = next((formato for formato, rotulo in self.formatos_relatorio.items() if rotulo == self.report_format_var.get()), export_logic.FORMATO_PADRAO)
         self.controller.save_config()
         messagebox.showinfo("Sucesso", "Configurações salvas com sucesso!", parent=self)
         self.destroy()
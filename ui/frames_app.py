@@ -7,20 +7,30 @@ import os
 import re
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext, simpledialog
-from collections import defaultdict
 from PIL import Image, ImageTk, ImageEnhance, ImageOps
 import ttkbootstrap as ttk
 from ttkbootstrap.tooltip import ToolTip
 from datetime import datetime
 import logging
-from openpyxl import Workbook
 import threading
 
 import core_logic
 import auth_logic
+import watch_logic
+import columnar_logic
+import export_logic
+import job_logic
+import metrics_logic
+import source_logic
 from .dialogs_flow import DashboardWindow, PreviewWindow
 
 
+def _listar_arquivos(linhas, limite=30):
+    """Texto para as caixas de aviso: uma linha por arquivo, cortado em 'limite' linhas."""
+    linhas = list(linhas)
+    excedente = len(linhas) - limite
+    return "\n".join(linhas[:limite]) + (f"\n... e mais {excedente}." if excedente > 0 else "")
+
 class HomeFrame(ttk.Frame):
     def __init__(self, parent, controller, *args): 
         super().__init__(parent)
@@ -123,7 +133,10 @@ class ExtractionToolsFrame(ttk.Frame):
 
 class NFeToolFrame(ttk.Frame):
     def __init__(self, parent, controller, *args):
-        super().__init__(parent); self.controller = controller; self.dados_extraidos_em_memoria = []
+        super().__init__(parent); self.controller = controller; self.dados_extraidos_em_memoria = []; self.extracao_em_andamento = False
+        self.dados_por_caminho = {}; self.tabela_notas = columnar_logic.TabelaNotas(); self.particao_notas = core_logic.ParticaoNotas(); self.indice_chaves = core_logic.IndiceChaves()
+        self.monitor = None; self.pasta_carregada = None; self.snapshot_carregado = {}; self.copias_carregadas = {}; self.dashboard_window = None; self.canal_progresso = None
+        self.monitorar_var = tk.BooleanVar(value=False)
         self.columnconfigure(0, weight=1); self.rowconfigure(3, weight=1); self.create_widgets()
 
     def create_widgets(self):
@@ -133,19 +146,27 @@ class NFeToolFrame(ttk.Frame):
         btn_voltar = ttk.Button(top_frame, text="< Voltar", command=lambda: self.controller.pulse_and_navigate(btn_voltar, "ExtractionToolsFrame")); btn_voltar.grid(row=0, column=0, padx=10, sticky='w')
         ttk.Label(top_frame, text="Extrator de NFe", font=("Helvetica", 18, "bold")).grid(row=0, column=1)
         path_frame = ttk.Frame(self, padding="10"); path_frame.grid(row=1, column=0, sticky='ew'); path_frame.columnconfigure(1, weight=1)
-        ttk.Label(path_frame, text="Pasta XML:").grid(row=0, column=0, padx=(0,5), sticky='w')
+        ttk.Label(path_frame, text="Pastas XML/ZIP:").grid(row=0, column=0, padx=(0,5), sticky='w')
         self.path_entry = ttk.Entry(path_frame); self.path_entry.grid(row=0, column=1, padx=5, sticky='ew')
         if self.controller.default_xml_path: self.path_entry.insert(0, self.controller.default_xml_path)
+        ToolTip(self.path_entry, text="Uma ou mais pastas e arquivos .zip, separados por ';'. Os .zip são lidos sem descompactar.")
         ttk.Button(path_frame, text="Selecionar", command=self.selecionar_pasta_origem).grid(row=0, column=2, padx=(5,0))
+        ttk.Button(path_frame, text="+ Pasta", command=self.adicionar_pasta_origem, bootstyle="secondary-outline").grid(row=0, column=3, padx=(5,0))
+        ttk.Button(path_frame, text="+ ZIP", command=self.adicionar_zip_origem, bootstyle="secondary-outline").grid(row=0, column=4, padx=(5,0))
+        ttk.Checkbutton(path_frame, text="Monitorar pasta (atualizar os dados automaticamente)", variable=self.monitorar_var, command=self.alternar_monitoramento, bootstyle="round-toggle").grid(row=1, column=1, padx=5, pady=(5,0), sticky='w')
         self.progress_bar = ttk.Progressbar(self, mode='determinate'); self.progress_bar.grid(row=2, column=0, sticky='ew', padx=10, pady=5)
         ttk.Frame(self).grid(row=3, column=0) 
         self.status_var = tk.StringVar(value="Pronto.")
         status_frame = ttk.Frame(self, padding=(10, 5)); status_frame.grid(row=4, column=0, sticky='ew'); status_frame.columnconfigure(0, weight=1)
         ttk.Label(status_frame, textvariable=self.status_var, font=("Helvetica", 8)).grid(row=0, column=0, sticky='w')
         controls_frame = ttk.Frame(self, padding="10"); controls_frame.grid(row=5, column=0, pady=5, sticky='ew'); controls_frame.columnconfigure(0, weight=1)
-        ttk.Button(controls_frame, text="Importar e Analisar XMLs", command=self.extrair_dados_e_analisar, width=30).grid(row=0, column=0, pady=5, sticky='ew', padx=5)
-        ttk.Button(controls_frame, text="Gerar Diagnóstico de Processos", command=self.gerar_diagnostico, bootstyle="info").grid(row=1, column=0, pady=5, padx=5, sticky='ew')
-        ttk.Button(controls_frame, text="Limpar", command=self.limpar_dados_e_interface).grid(row=2, column=0, pady=5, padx=5, sticky='ew')
+        self.btn_importar = ttk.Button(controls_frame, text="Importar e Analisar XMLs", command=self.extrair_dados_e_analisar, width=30); self.btn_importar.grid(row=0, column=0, pady=5, sticky='ew', padx=5)
+        ttk.Button(controls_frame, text="Ver Painel Atual", command=self.abrir_painel, bootstyle="secondary").grid(row=1, column=0, pady=5, padx=5, sticky='ew')
+        ttk.Button(controls_frame, text="Gerar Diagnóstico de Processos", command=self.gerar_diagnostico, bootstyle="info").grid(row=2, column=0, pady=5, padx=5, sticky='ew')
+        snapshot_frame = ttk.Frame(controls_frame); snapshot_frame.grid(row=3, column=0, sticky='ew'); snapshot_frame.columnconfigure((0, 1), weight=1)
+        ttk.Button(snapshot_frame, text="Exportar Snapshot (Parquet)", command=self.exportar_snapshot, bootstyle="secondary-outline").grid(row=0, column=0, pady=5, padx=5, sticky='ew')
+        ttk.Button(snapshot_frame, text="Abrir Snapshot", command=self.abrir_snapshot, bootstyle="secondary-outline").grid(row=0, column=1, pady=5, padx=5, sticky='ew')
+        ttk.Button(controls_frame, text="Limpar", command=self.limpar_dados_e_interface).grid(row=4, column=0, pady=5, padx=5, sticky='ew')
         signature_frame = ttk.Frame(self, padding=(10, 5)); signature_frame.grid(row=6, column=0, sticky='ew'); signature_frame.columnconfigure(0, weight=1)
         ttk.Label(signature_frame, text="Desenvolvido por Bruno Silva - Analista Contábil", font=("Helvetica", 8)).pack()
 
@@ -168,124 +189,281 @@ class NFeToolFrame(ttk.Frame):
 
     def gerar_diagnostico(self):
         if not self.dados_extraidos_em_memoria:
-            self.extrair_dados_e_analisar(run_dashboard=False)
-            if not self.dados_extraidos_em_memoria: return
+            # A extração roda em segundo plano; o diagnóstico continua quando ela terminar.
+            self.extrair_dados_e_analisar(run_dashboard=False, on_complete=self.gerar_diagnostico); return
         caminho_saida = filedialog.asksaveasfilename(title="Salvar Diagnóstico", initialfile="diagnostico_processos.txt", defaultextension=".txt", filetypes=[("Arquivos de Texto", "*.txt")])
         if not caminho_saida: return
-        success, message = core_logic.gerar_diagnostico_processos(self.dados_extraidos_em_memoria, caminho_saida)
-        if success:
-            messagebox.showinfo("Sucesso", message, parent=self)
+        dados = list(self.dados_extraidos_em_memoria)
+        def executar(tarefa):
+            try: success, message = core_logic.gerar_diagnostico_processos(dados, caminho_saida, tarefa.progresso)
+            except job_logic.TarefaCancelada:
+                if os.path.exists(caminho_saida): os.remove(caminho_saida)
+                raise
+            if not success: raise RuntimeError(message)
+            return caminho_saida
+        def concluir(_caminho):
+            self.update_status("Diagnóstico gerado com sucesso.")
             if messagebox.askyesno("Abrir Arquivo", "Deseja abrir o diagnóstico?"): os.startfile(caminho_saida)
-        else: messagebox.showerror("Erro", message, parent=self)
+        self._enviar_tarefa("Diagnóstico de Processos", executar, concluir)
         
-    def extrair_dados_e_analisar(self, run_dashboard=True):
+    def exportar_snapshot(self):
+        if not self.dados_extraidos_em_memoria: messagebox.showerror("Erro", "Nenhum dado extraído."); return
+        if not columnar_logic.PYARROW_AVAILABLE: messagebox.showerror("Dependência Ausente", "Para exportar snapshots instale a biblioteca 'pyarrow':\npip install pyarrow", parent=self); return
+        initial_dir = self.controller.default_output_path or os.path.expanduser("~")
+        caminho = filedialog.asksaveasfilename(title="Exportar Snapshot", initialdir=initial_dir, initialfile=f"snapshot_nfe_{datetime.now().strftime('%Y-%m-%d')}.parquet", defaultextension=".parquet", filetypes=[("Parquet", "*.parquet"), ("Arrow IPC", "*.arrow")])
+        if not caminho: return
+        pares = list(self.dados_por_caminho.items())
+        def executar(tarefa):
+            tarefa.progresso(0, len(pares), "Gravando snapshot..."); columnar_logic.exportar_snapshot(pares, caminho)
+            return caminho
+        self._enviar_tarefa("Snapshot (Parquet)", executar, lambda _caminho: self.update_status(f"Snapshot salvo: {len(pares)} notas em {os.path.basename(caminho)}."))
+
+    def abrir_snapshot(self):
+        """Carrega um snapshot salvo no lugar da extração atual e abre o painel, sem ler os XMLs."""
+        if self.extracao_em_andamento: return
+        if not columnar_logic.PYARROW_AVAILABLE: messagebox.showerror("Dependência Ausente", "Para abrir snapshots instale a biblioteca 'pyarrow':\npip install pyarrow", parent=self); return
+        initial_dir = self.controller.default_output_path or os.path.expanduser("~")
+        caminho = filedialog.askopenfilename(title="Abrir Snapshot", initialdir=initial_dir, filetypes=[("Snapshots", "*.parquet *.arrow *.feather")])
+        if not caminho: return
         try:
-            self.dados_extraidos_em_memoria = []; self.progress_bar['value'] = 0; self.update_status("Iniciando extração...")
-            pasta_xml = self.path_entry.get()
-            if not pasta_xml or not os.path.isdir(pasta_xml): self.update_status("Erro: Pasta inválida."); messagebox.showerror("Erro", "Caminho inválido."); return
-            arquivos_xml = [os.path.join(dp, f) for dp, _, fn in os.walk(pasta_xml) for f in fn if f.lower().endswith('.xml')]
+            metadados = columnar_logic.ler_metadados_snapshot(caminho); pares = columnar_logic.importar_snapshot(caminho)
+        except Exception as e:
+            logging.error("Erro ao abrir snapshot.", exc_info=True); messagebox.showerror("Erro", f"Não foi possível abrir o snapshot:\n{e}", parent=self); return
+        self._parar_monitor(); self.monitorar_var.set(False); self._limpar_estado_extracao()
+        for caminho_xml, dados in pares: self._registrar_dados(caminho_xml, dados)
+        if metadados.get('versao_extrator') != core_logic.VERSAO_EXTRATOR:
+            logging.warning(f"Snapshot gerado por outra versão do extrator ({metadados.get('versao_extrator')}); reimporte os XMLs para atualizar os dados.")
+        self.update_status(f"Snapshot carregado: {len(pares)} notas de {os.path.basename(caminho)} (gerado em {metadados.get('gerado_em', '?')}).")
+        if pares: self.dashboard_window = DashboardWindow(self.controller, self.tabela_notas.resumo_dashboard())
+
+    def extrair_dados_e_analisar(self, run_dashboard=True, on_complete=None):
+        if self.extracao_em_andamento: return
+        try:
+            self._parar_monitor(); self._limpar_estado_extracao(); self.progress_bar['value'] = 0; self.update_status("Iniciando extração...")
+            pasta_xml = self.path_entry.get().strip(); fontes = source_logic.separar_fontes(pasta_xml)
+            invalidas = [fonte for fonte in fontes if not source_logic.fonte_valida(fonte)]
+            if not fontes or invalidas:
+                self.update_status("Erro: Pasta inválida."); messagebox.showerror("Erro", "Caminho inválido." + (f"\n\n{_listar_arquivos(invalidas)}" if invalidas else "")); return
+            # Pastas, .zip (soltos ou dentro das pastas) e XMLs avulsos viram uma lista só: triagem, deduplicação e progresso valem para o conjunto.
+            listagem = source_logic.listar_xmls(fontes); arquivos_xml = listagem.arquivos
             total = len(arquivos_xml); self.progress_bar['maximum'] = total; self.update_status(f"Encontrados {total} arquivos XML.")
-            if total == 0: messagebox.showinfo("Aviso", "Nenhum XML encontrado."); self.update_status("Pronto."); return
+            if total == 0: source_logic.fechar_pacotes(); messagebox.showinfo("Aviso", "Nenhum XML encontrado."); self.update_status("Pronto."); return
+            self.extracao_em_andamento = True; self.btn_importar.config(state="disabled")
+            # Os arquivos informam o progresso ao canal; a barra e o status só são redesenhados a cada pulso do after().
+            self.canal_progresso = job_logic.CanalProgresso(self.after, self._atualizar_progresso_extracao).iniciar()
+            threading.Thread(target=self._executar_extracao, args=(pasta_xml, listagem, run_dashboard, on_complete), daemon=True).start()
+        except Exception as e:
+            logging.error("Erro na extração.", exc_info=True); messagebox.showerror("Erro Crítico", f"Ocorreu um erro:\n{e}"); self.update_status("Erro crítico.")
+
+    def _executar_extracao(self, pasta_xml, listagem, run_dashboard, on_complete):
+        """Roda fora da thread do Tk; o progresso e o resultado voltam pela fila do after()."""
+        arquivos_xml = listagem.arquivos
+        try:
+            # O snapshot é tirado antes do parsing: o que mudar durante a extração aparece depois para o monitor.
+            snapshot = watch_logic.snapshot_de_arquivos(arquivos_xml)
+            motor = getattr(self.controller, 'extraction_engine', None); profundidade = getattr(self.controller, 'read_ahead_depth', None)
+            relatorio = metrics_logic.RelatorioExtracao(origem=pasta_xml, motor=motor)
+            # Pelo cabeçalho: XMLs que não são NFe/cancelamento e cópias do mesmo XML em outras subpastas ficam fora da extração.
+            with relatorio.cronometrar('triagem'): triagem = core_logic.triar_arquivos(arquivos_xml, profundidade)
+            with relatorio.cronometrar('deduplicacao'): deduplicacao = core_logic.deduplicar_por_chave(triagem.arquivos, triagem.classificacoes)
+            with relatorio.cronometrar('extracao'):
+                resultados = core_logic.extrair_lote(deduplicacao.arquivos, progress_callback=self.canal_progresso.informar, motor=motor, relatorio=relatorio, profundidade_leitura=profundidade)
+            metrics_logic.registrar_execucao(relatorio)
+            self.after(0, self._finalizar_extracao, pasta_xml, snapshot, listagem, triagem, deduplicacao, resultados, run_dashboard, on_complete)
+        except Exception as e:
+            logging.error("Erro na extração.", exc_info=True)
+            self.after(0, self._falha_extracao, e)
+        finally:
+            source_logic.fechar_pacotes()
+
+    def _atualizar_progresso_extracao(self, processados, total):
+        self.progress_bar['value'] = processados; self.status_var.set(f"Processando {processados}/{total} arquivos...")
+
+    def _encerrar_progresso(self):
+        if self.canal_progresso: self.canal_progresso.encerrar(); self.canal_progresso = None
+
+    def _finalizar_extracao(self, pasta_xml, snapshot, listagem, triagem, deduplicacao, resultados, run_dashboard, on_complete):
+        self._encerrar_progresso(); self.extracao_em_andamento = False; self.btn_importar.config(state="normal")
+        try:
             erros = []
-            for i, arq_path in enumerate(arquivos_xml):
-                self.update_status(f"Processando {i + 1}/{total}: {os.path.basename(arq_path)}"); self.progress_bar['value'] = i + 1
-                dados = core_logic.extrair_dados_nf(arq_path)
-                if dados: self.dados_extraidos_em_memoria.append(dados)
+            for arq_path, dados in zip(deduplicacao.arquivos, resultados):
+                if dados: self._registrar_dados(arq_path, dados)
                 else: erros.append(os.path.basename(arq_path))
-            if erros: messagebox.showwarning("Aviso", "Falha ao processar:\n" + "\n".join(erros))
-            self.update_status(f"Extração concluída. Calculando resumo...")
+            canceladas = len(self.indice_chaves.neutralizadas)
+            self.pasta_carregada, self.snapshot_carregado, self.copias_carregadas = pasta_xml, snapshot, dict(deduplicacao.duplicados)
+            if self.monitorar_var.get() and os.path.isdir(pasta_xml): self._iniciar_monitor(pasta_xml, snapshot)
+            avisos = []
+            if listagem.falhas: avisos.append("Origens não lidas:\n" + _listar_arquivos(f"{os.path.basename(c)} - {erro}" for c, erro in listagem.falhas.items()))
+            if erros: avisos.append("Falha ao processar:\n" + _listar_arquivos(erros))
+            if triagem.ignorados: avisos.append("Ignorados (não são NFe nem cancelamento):\n" + _listar_arquivos(f"{os.path.basename(c)} - {motivo}" for c, motivo in triagem.ignorados.items()))
+            if avisos: messagebox.showwarning("Aviso", "\n\n".join(avisos))
+            resumo = "; ".join(r for r in (listagem.resumo(), triagem.resumo(), deduplicacao.resumo(), f"{canceladas} nota(s) cancelada(s) pelo evento" if canceladas else "") if r)
+            resumo = f" ({resumo})" if resumo else ""
+            self.update_status(f"Extração concluída{resumo}. Calculando resumo...")
             if run_dashboard:
-                dashboard_data = core_logic.calcular_dados_dashboard(self.dados_extraidos_em_memoria)
-                DashboardWindow(self.controller, dashboard_data); self.update_status(f"Análise concluída.")
+                self.dashboard_window = DashboardWindow(self.controller, self.tabela_notas.resumo_dashboard()); self.update_status(f"Análise concluída{resumo}.")
+            else: self.update_status(f"Extração concluída{resumo}.")
+            if on_complete and self.dados_extraidos_em_memoria: on_complete()
         except Exception as e:
             logging.error("Erro na extração.", exc_info=True); messagebox.showerror("Erro Crítico", f"Ocorreu um erro:\n{e}"); self.update_status("Erro crítico.")
+
+    def _limpar_estado_extracao(self):
+        self.dados_extraidos_em_memoria = []; self.dados_por_caminho = {}
+        self.tabela_notas = columnar_logic.TabelaNotas(); self.particao_notas = core_logic.ParticaoNotas(); self.indice_chaves = core_logic.IndiceChaves()
+        self.pasta_carregada = None; self.snapshot_carregado = {}; self.copias_carregadas = {}
+
+    def _registrar_dados(self, caminho, dados):
+        # O índice vem antes: a nota que já chega cancelada por um evento do lote entra assim nas demais estruturas.
+        alteradas = self.indice_chaves.adicionar(caminho, dados)
+        self.dados_por_caminho[caminho] = dados; self.dados_extraidos_em_memoria.append(dados)
+        self.tabela_notas.adicionar(caminho, dados); self.particao_notas.adicionar(caminho, dados)
+        if alteradas: self.notas_editadas(alteradas)
+
+    def _descartar_dados(self, caminhos):
+        removidas = set()
+        for caminho in caminhos:
+            dados = self.dados_por_caminho.pop(caminho, None)
+            if dados is None: continue
+            self.tabela_notas.remover(caminho); self.particao_notas.remover(caminho); removidas.add(id(dados))
+            alteradas = self.indice_chaves.remover(caminho)
+            if alteradas: self.notas_editadas(alteradas)
+        # Filtra por identidade, numa única passada por delta: cópias do mesmo XML em pastas diferentes geram dicionários iguais.
+        if removidas: self.dados_extraidos_em_memoria[:] = [nota for nota in self.dados_extraidos_em_memoria if id(nota) not in removidas]
+
+    def recalcular_dashboard(self):
+        """Totais do dashboard a partir da tabela em colunas (as notas editadas já foram marcadas em notas_editadas)."""
+        return self.tabela_notas.resumo_dashboard()
+
+    def notas_editadas(self, notas):
+        """Chamado pela pré-visualização depois de alterar notas no próprio objeto."""
+        self.tabela_notas.atualizar(notas); self.particao_notas.atualizar(notas)
+
+    def abrir_painel(self):
+        if not self.dados_extraidos_em_memoria: messagebox.showinfo("Aviso", "Nenhum dado extraído ainda.", parent=self); return
+        self.dashboard_window = DashboardWindow(self.controller, self.tabela_notas.resumo_dashboard())
+
+    def alternar_monitoramento(self):
+        if not self.monitorar_var.get(): self._parar_monitor(); self.update_status("Monitoramento desativado."); return
+        pasta_xml = self.path_entry.get().strip()
+        if not pasta_xml or not os.path.isdir(pasta_xml):
+            self.monitorar_var.set(False)
+            if len(source_logic.separar_fontes(pasta_xml)) > 1 or source_logic.e_pacote(pasta_xml): messagebox.showerror("Erro", "O monitoramento funciona com uma única pasta (sem .zip).")
+            else: messagebox.showerror("Erro", "Caminho inválido.")
+            return
+        if self.extracao_em_andamento: return  # O monitor é iniciado ao final da extração em curso.
+        if self.pasta_carregada != pasta_xml:
+            # Pasta nova: o monitor parte de um snapshot vazio e carrega tudo na primeira varredura.
+            self._limpar_estado_extracao(); self.pasta_carregada = pasta_xml
+        self._iniciar_monitor(pasta_xml, self.snapshot_carregado)
+        self.update_status(f"Monitorando a pasta: {pasta_xml}")
+
+    def _iniciar_monitor(self, pasta_xml, snapshot):
+        self._parar_monitor()
+        # 'carregados' roda na thread do monitor e só consulta o índice de chaves (sem percorrê-lo).
+        self.monitor = watch_logic.MonitorPastaXML(pasta_xml, self._on_delta_monitor, snapshot_inicial=snapshot, motor=getattr(self.controller, 'extraction_engine', None),
+                                                   carregados=lambda chave, cancelamento: self.indice_chaves.caminhos(chave, cancelamento), copias_iniciais=self.copias_carregadas)
+        self.monitor.iniciar()
+
+    def _parar_monitor(self):
+        if self.monitor: self.monitor.parar(); self.monitor = None
+
+    def _on_delta_monitor(self, extraidos, removidos):
+        self.after(0, self._aplicar_delta_monitor, extraidos, removidos)
+
+    def _aplicar_delta_monitor(self, extraidos, removidos):
+        if not self.monitor: return
+        self._descartar_dados(list(removidos) + list(extraidos))
+        for caminho, dados in extraidos.items():
+            if dados: self._registrar_dados(caminho, dados)
+        self.snapshot_carregado, self.copias_carregadas = self.monitor.snapshot, self.monitor.copias
+        self.status_var.set(f"Pasta atualizada às {datetime.now().strftime('%H:%M:%S')}: {len(self.dados_extraidos_em_memoria)} notas em memória.")
+        if self.dashboard_window is not None and self.dashboard_window.winfo_exists():
+            self.dashboard_window.atualizar_dados(self.tabela_notas.resumo_dashboard())
+
+    def _falha_extracao(self, erro):
+        self._encerrar_progresso(); self.extracao_em_andamento = False; self.btn_importar.config(state="normal")
+        messagebox.showerror("Erro Crítico", f"Ocorreu um erro:\n{erro}"); self.update_status("Erro crítico.")
             
     def salvar_dados_basicos(self):
         if not self.dados_extraidos_em_memoria: messagebox.showerror("Erro", "Nenhum dado extraído."); return
-        filename = self.controller.output_filename_pattern.format(data=datetime.now().strftime('%Y-%m-%d'))
-        initial_dir = self.controller.default_output_path or os.path.expanduser("~")
-        caminho_excel = filedialog.asksaveasfilename(initialdir=initial_dir, initialfile=filename, defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")])
+        caminho_excel = self._perguntar_caminho_excel()
         if not caminho_excel: return
-        self.update_status("Gerando Excel Básico..."); wb = Workbook()
-        saida_ws, entrada_ws = wb.create_sheet("Saída"), wb.create_sheet("Entrada"); del wb['Sheet']
-        cabecalhos = ['Arquivo', 'Número da NF', 'Cliente', 'Data de Emissão', 'Sistema Emissor', 'Valor Total', 'Status da NF']
-        core_logic.setup_headers(entrada_ws, cabecalhos); core_logic.setup_headers(saida_ws, cabecalhos)
-        row_in, row_out = 2, 2
-        for dados in self.dados_extraidos_em_memoria:
-            if dados['tipo_nota'] == "Saída": core_logic.write_data_to_excel(saida_ws, row_out, dados, cabecalhos); row_out += 1
-            else: core_logic.write_data_to_excel(entrada_ws, row_in, dados, cabecalhos); row_in += 1
-        core_logic.add_totals_row(entrada_ws, cabecalhos); core_logic.add_totals_row(saida_ws, cabecalhos); self.salvar_arquivo(wb, caminho_excel)
+        notas = [nota.copy() for nota in self.dados_extraidos_em_memoria]
+        self.salvar_arquivo("Excel Básico", lambda escritor, progresso: core_logic.montar_planilha_basica(notas, escritor, progresso), caminho_excel, len(notas))
 
     def salvar_planilha_completa(self, contagens_confirmadas):
         if not self.dados_extraidos_em_memoria: messagebox.showerror("Erro", "Nenhum dado extraído."); return
+        caminho_excel = self._perguntar_caminho_excel()
+        if not caminho_excel: return
+        particao = self.particao_notas.copia_notas(); contagens_confirmadas = dict(contagens_confirmadas)
+        self.salvar_arquivo("Planilha Completa", lambda escritor, progresso: core_logic.montar_planilha_completa(particao, contagens_confirmadas, escritor, progresso), caminho_excel, len(particao))
+
+    def _formato_relatorio(self):
+        formato = getattr(self.controller, 'report_format', export_logic.FORMATO_PADRAO)
+        return formato if export_logic.formato_disponivel(formato) else export_logic.FORMATO_PADRAO
+
+    def _perguntar_caminho_excel(self):
         filename = self.controller.output_filename_pattern.format(data=datetime.now().strftime('%Y-%m-%d'))
         initial_dir = self.controller.default_output_path or os.path.expanduser("~")
-        caminho_excel = filedialog.asksaveasfilename(initialdir=initial_dir, initialfile=filename, defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")])
-        if not caminho_excel: return
-        self.update_status("Gerando Planilha Completa..."); wb = Workbook()
-        saida_ws, entrada_ws = wb.create_sheet("Saída"), wb.create_sheet("Entrada")
-        servico_ws, pendentes_ws = wb.create_sheet("Serviços Autorizados"), wb.create_sheet("Serviços Pendentes"); del wb['Sheet']
-        cabecalhos_completos = ['Arquivo', 'Número da NF', 'Status da NF', 'Data de Emissão', 'Cliente', 'CNPJ/CPF Dest.', 'Razão Social Dest.', 'UF Destino', 'Nome do Processo', 'CFOP', 'Valor Total dos Produtos', 'Valor II', 'Valor ICMS', 'Valor IPI', 'Valor PIS', 'Valor COFINS', 'Outras Despesas', 'Valor AFRMM', 'Frete Nacional', 'Valor Total', 'Sistema Emissor']
-        cabecalhos_servico = ['Número da NF', 'Cliente', 'Data de Emissão', 'Sistema Emissor', 'Nome do Processo', 'Valor Serviço Trading']
-        cabecalhos_pendentes = cabecalhos_servico + ['Qtde Encontrada', 'Qtde Esperada', 'Qtde a Emitir']
-        core_logic.setup_headers(entrada_ws, cabecalhos_completos); core_logic.setup_headers(saida_ws, cabecalhos_completos)
-        core_logic.setup_headers(servico_ws, cabecalhos_servico); core_logic.setup_headers(pendentes_ws, cabecalhos_pendentes)
-        
-        # --- [INÍCIO DA CORREÇÃO] ---
-        # Define os formatos padrão aqui
-        currency_format = 'R$ #,##0.00'
-        text_format = '@'
-        # --- [FIM DA CORREÇÃO] ---
-
-        row_in, row_out, row_serv, row_pend = 2, 2, 2, 2
-        processos_saida = defaultdict(list)
-        for dados in self.dados_extraidos_em_memoria:
-            if dados['tipo_nota'] == 'Saída': processos_saida[dados.get('processo_normalizado', 'N/A')].append(dados)
-        for dados in self.dados_extraidos_em_memoria:
-            if dados['tipo_nota'] == "Saída": core_logic.write_data_to_excel(saida_ws, row_out, dados, cabecalhos_completos); row_out += 1
-            else: core_logic.write_data_to_excel(entrada_ws, row_in, dados, cabecalhos_completos); row_in += 1
-            if dados.get('valor_servico_trading', 0.0) > 0.0 and dados['tipo_nota'] == 'Entrada':
-                linha_serv = [dados['numero_nf'], dados['nome_cliente'], dados['data_emissao'], dados.get('sistema_emissor'), dados['nome_processo'], dados['valor_servico_trading']]
-                processo = dados.get('processo_normalizado', 'N/A')
-                nfs_encontradas = len(processos_saida.get(processo, [])); esperada = contagens_confirmadas.get(processo, {}).get('esperado')
-                auth = (esperada is not None and nfs_encontradas == esperada) or (nfs_encontradas > 0 and processo not in contagens_confirmadas)
-                if auth:
-                    # --- [INÍCIO DA CORREÇÃO 1] ---
-                    for col, val in enumerate(linha_serv, 1): 
-                        cell = servico_ws.cell(row=row_serv, column=col, value=val)
-                        cell.number_format = currency_format if col == 6 else text_format
-                    # --- [FIM DA CORREÇÃO 1] ---
-                    row_serv += 1
-                else:
-                    a_emitir = esperada - nfs_encontradas if esperada is not None else 'N/A'
-                    linha_pend = linha_serv + [nfs_encontradas, esperada, a_emitir]
-                    # --- [INÍCIO DA CORREÇÃO 2] ---
-                    for col, val in enumerate(linha_pend, 1): 
-                        cell = pendentes_ws.cell(row=row_pend, column=col, value=val)
-                        cell.number_format = currency_format if col == 6 else text_format
-                    # --- [FIM DA CORREÇÃO 2] ---
-                    row_pend += 1
-        core_logic.add_totals_row(entrada_ws, cabecalhos_completos); core_logic.add_totals_row(saida_ws, cabecalhos_completos)
-        core_logic.add_totals_row(servico_ws, cabecalhos_servico); core_logic.add_totals_row(pendentes_ws, cabecalhos_pendentes)
-        self.salvar_arquivo(wb, caminho_excel)
-
-    def salvar_arquivo(self, wb, caminho):
-        try:
-            wb.save(caminho); self.update_status(f"Arquivo salvo!");
-            if self.controller.ask_to_open_excel and messagebox.askyesno("Abrir", "Deseja abrir o arquivo?"): os.startfile(caminho)
-        except Exception as e:
-            # --- [MODIFICADO] Adiciona o print(e) para diagnóstico ---
-            print(f"Erro detalhado ao salvar: {e}")
-            self.update_status(f"Erro ao salvar."); logging.error(f"Erro ao salvar: {e}", exc_info=True); messagebox.showerror("Erro", f"Erro ao salvar o arquivo: {e}")
+        extensao = export_logic.extensao_formato(self._formato_relatorio())
+        tipo = ("CSV (uma planilha por aba)", "*.csv") if extensao == '.csv' else ("Excel", "*.xlsx")
+        return filedialog.asksaveasfilename(initialdir=initial_dir, initialfile=filename, defaultextension=extensao, filetypes=[tipo])
+
+    def salvar_arquivo(self, titulo, montar, caminho, total):
+        """
+        Monta e grava a planilha numa tarefa em segundo plano. 'montar(escritor, progresso)' preenche o escritor do
+        formato escolhido a partir de cópias das notas (NotaFiscal.copy) feitas por quem chama: a pré-visualização
+        edita as notas da tela no próprio objeto, e a gravação na fila não pode ver uma edição pela metade.
+        """
+        formato = self._formato_relatorio()
+        def executar(tarefa):
+            escritor = export_logic.criar_escritor(formato)
+            try:
+                montar(escritor, tarefa.progresso); tarefa.progresso(total, total, "Gravando o arquivo...")
+            except BaseException:
+                escritor.descartar(); raise
+            escritor.save(caminho)
+            return getattr(escritor, 'arquivos', None) or [caminho]
+        def concluir(arquivos):
+            self.update_status(f"Arquivo salvo!" if len(arquivos) == 1 else f"{len(arquivos)} arquivos salvos!");
+            if self.controller.ask_to_open_excel and messagebox.askyesno("Abrir", "Deseja abrir o arquivo?"): os.startfile(arquivos[0])
+        self._enviar_tarefa(titulo, executar, concluir)
+
+    def _enviar_tarefa(self, titulo, executar, ao_concluir):
+        """Coloca a exportação na fila de tarefas do programa (Arquivo > Tarefas em Segundo Plano)."""
+        def falhar(erro):
+            self.update_status(f"Erro em '{titulo}'."); messagebox.showerror("Erro", f"Erro ao salvar o arquivo: {erro}")
+        tarefa = self.controller.tarefas.enviar(titulo, executar, ao_concluir=ao_concluir, ao_falhar=falhar, ao_progresso=self._progresso_tarefa)
+        na_frente = len(self.controller.tarefas.pendentes()) - 1
+        self.update_status(f"Gerando {titulo}..." if not na_frente else f"{titulo} na fila ({na_frente} tarefa(s) antes).")
+        return tarefa
+
+    def _progresso_tarefa(self, tarefa):
+        if self.extracao_em_andamento or tarefa.finalizada: return
+        self.progress_bar['maximum'] = tarefa.total or 1; self.progress_bar['value'] = tarefa.atual
+        self.status_var.set(f"{tarefa.titulo}: {tarefa.mensagem or f'{tarefa.atual}/{tarefa.total} notas'}")
 
     def limpar_dados_e_interface(self):
         if messagebox.askyesno("Confirmação", "Limpar todos os dados?"):
-            self.dados_extraidos_em_memoria.clear(); self.path_entry.delete(0, tk.END); self.progress_bar.config(value=0)
+            self._parar_monitor(); self.monitorar_var.set(False)
+            self._limpar_estado_extracao(); self.path_entry.delete(0, tk.END); self.progress_bar.config(value=0)
             self.update_status("Pronto."); logging.info("Interface limpa.")
     def selecionar_pasta_origem(self):
         initial_dir = self.controller.default_xml_path or os.path.expanduser("~")
         folder_path = filedialog.askdirectory(title="Selecione a pasta XML", initialdir=initial_dir)
-        if folder_path: self.path_entry.delete(0, tk.END); self.path_entry.insert(0, folder_path); self.update_status(f"Pasta selecionada: {folder_path}")
+        if folder_path:
+            if self.monitor and self.monitor.pasta != folder_path: self._parar_monitor(); self.monitorar_var.set(False)
+            self.path_entry.delete(0, tk.END); self.path_entry.insert(0, folder_path); self.update_status(f"Pasta selecionada: {folder_path}")
+    def _adicionar_origens(self, novas):
+        fontes = source_logic.separar_fontes(self.path_entry.get()); fontes += [fonte for fonte in novas if fonte not in fontes]
+        if self.monitor: self._parar_monitor(); self.monitorar_var.set(False)
+        self.path_entry.delete(0, tk.END); self.path_entry.insert(0, source_logic.juntar_fontes(fontes)); self.update_status(f"{len(fontes)} origem(ns) selecionada(s).")
+    def adicionar_pasta_origem(self):
+        folder_path = filedialog.askdirectory(title="Adicionar pasta XML", initialdir=self.controller.default_xml_path or os.path.expanduser("~"))
+        if folder_path: self._adicionar_origens([folder_path])
+    def adicionar_zip_origem(self):
+        zip_paths = filedialog.askopenfilenames(title="Adicionar arquivos .zip", initialdir=self.controller.default_xml_path or os.path.expanduser("~"), filetypes=[("Arquivos ZIP", "*.zip"), ("Todos os arquivos", "*.*")])
+        if zip_paths: self._adicionar_origens(list(zip_paths))
     def show_preview_window(self, contagens_confirmadas):
         if not self.dados_extraidos_em_memoria: messagebox.showinfo("Aviso", "Não há dados para pré-visualizar.", parent=self.controller); return
         PreviewWindow(controller=self.controller, all_extracted_data=self.dados_extraidos_em_memoria, contagens_confirmadas=contagens_confirmadas)
\ No newline at end of file
@@ -0,0 +1,161 @@
+# =============================================================================
+# --- ARQUIVO: watch_logic.py ---
+# (Monitoramento da pasta de XMLs: detecta arquivos novos, alterados e removidos)
+# =============================================================================
+
+import os
+import zipfile
+import logging
+import threading
+
+import core_logic
+import source_logic
+
+INTERVALO_PADRAO = 5.0  # segundos entre varreduras
+
+def tirar_snapshot(pasta, anterior=None):
+    """
+    Retorna {caminho: (tamanho, mtime_ns)} de todos os .xml da pasta e subpastas, inclusive os de dentro
+    dos .zip (caminhos virtuais, como em source_logic.listar_xmls), com a mesma assinatura de
+    snapshot_de_arquivos. Usa os.scandir, que no Windows já traz o stat junto da listagem (sem abrir os
+    arquivos). Um .zip ilegível (ex.: ainda sendo copiado) mantém os membros do snapshot 'anterior'.
+    """
+    snapshot = {}
+    pendentes = [pasta]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            with os.scandir(atual) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pendentes.append(entrada.path)
+                        elif entrada.name.lower().endswith(source_logic.EXTENSAO_XML):
+                            st = entrada.stat()
+                            snapshot[entrada.path] = (st.st_size, st.st_mtime_ns)
+                        elif source_logic.e_pacote(entrada.name):
+                            snapshot.update(_estados_pacote(entrada, anterior))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.warning(f"Não foi possível listar a pasta '{atual}': {e}")
+    return snapshot
+
+def _estados_pacote(entrada, anterior):
+    try:
+        return source_logic.estados_pacote(entrada.path, entrada.stat().st_mtime_ns)
+    except (OSError, zipfile.BadZipFile) as e:
+        logging.warning(f"Pacote não lido nesta varredura ({entrada.name}): {e}")
+        prefixo = source_logic.caminho_membro(entrada.path, "")
+        return {caminho: assinatura for caminho, assinatura in (anterior or {}).items() if caminho.startswith(prefixo)}
+
+def snapshot_de_arquivos(caminhos):
+    """Monta o snapshot de uma lista de arquivos já conhecida (ex.: os que acabaram de ser extraídos, inclusive de .zip)."""
+    snapshot = {}
+    for caminho in caminhos:
+        try:
+            snapshot[caminho] = source_logic.estado(caminho)
+        except OSError:
+            continue
+    return snapshot
+
+def comparar_snapshots(anterior, atual):
+    """Retorna (adicionados, alterados, removidos) entre dois snapshots."""
+    adicionados = [c for c in atual if c not in anterior]
+    alterados = [c for c, assinatura in atual.items() if c in anterior and anterior[c] != assinatura]
+    removidos = [c for c in anterior if c not in atual]
+    return adicionados, alterados, removidos
+
+class MonitorPastaXML:
+    """
+    Varre a pasta periodicamente numa thread própria e, a cada mudança, extrai só os arquivos
+    afetados. on_delta(extraidos, removidos) recebe {caminho: dados ou None} dos arquivos novos
+    ou alterados e a lista dos caminhos removidos. O callback roda na thread do monitor.
+    Cópias do mesmo documento (mesma chave de acesso) entram no delta sem dados, como na extração completa:
+    as do próprio delta e as de algo já carregado, que 'carregados(chave, cancelamento)' informa (ex.:
+    IndiceChaves.caminhos). Quando o arquivo mantido sai ou muda, as cópias dele voltam a ser avaliadas.
+    """
+    def __init__(self, pasta, on_delta, intervalo=INTERVALO_PADRAO, snapshot_inicial=None, motor=None, carregados=None, copias_iniciais=None):
+        self.pasta = pasta
+        self.motor = motor
+        self.on_delta = on_delta
+        self.intervalo = intervalo
+        self.carregados = carregados
+        self._snapshot = dict(snapshot_inicial or {})
+        self._copias = dict(copias_iniciais or {})  # cópia -> arquivo mantido
+        self._parar = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self):
+        """Cópia do último estado conhecido da pasta."""
+        return dict(self._snapshot)
+
+    @property
+    def copias(self):
+        """Cópia de {arquivo ignorado: arquivo mantido} das cópias que estão na pasta."""
+        return dict(self._copias)
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        if self.ativo: return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        logging.info(f"Monitoramento iniciado: {self.pasta}")
+
+    def parar(self):
+        self._parar.set()
+        logging.info(f"Monitoramento encerrado: {self.pasta}")
+
+    def _loop(self):
+        espera = 0
+        while not self._parar.wait(espera):
+            espera = self.intervalo
+            try:
+                self.verificar()
+            except Exception:
+                logging.error("Erro no monitoramento da pasta de XMLs.", exc_info=True)
+
+    def verificar(self):
+        """Executa uma varredura e notifica a diferença. Retorna True se houve mudança."""
+        atual = tirar_snapshot(self.pasta, self._snapshot)
+        adicionados, alterados, removidos = comparar_snapshots(self._snapshot, atual)
+        if not (adicionados or alterados or removidos): return False
+        em_revisao = set(adicionados) | set(alterados) | set(removidos)
+        # Cópias cujo arquivo mantido saiu ou mudou são reavaliadas (uma delas pode passar a ser a mantida).
+        reavaliadas = [c for c, original in self._copias.items() if original in em_revisao and c in atual and c not in em_revisao]
+        caminhos = adicionados + alterados + reavaliadas
+        # Os que a triagem descarta pelo cabeçalho e as cópias entram no delta sem dados, como as falhas de extração.
+        try:
+            triagem = core_logic.triar_arquivos(caminhos)
+            copias = self._copias_no_delta(triagem, em_revisao)
+            arquivos = [c for c in triagem.arquivos if c not in copias]
+            resultados = core_logic.extrair_lote(arquivos, motor=self.motor) if arquivos else []
+        finally:
+            source_logic.fechar_pacotes()  # o .zip não fica travado entre as varreduras
+        if self._parar.is_set(): return False
+        self._snapshot = atual
+        self._copias = {c: original for c, original in self._copias.items() if c not in em_revisao and c not in caminhos}
+        self._copias.update(copias)
+        logging.info(f"Pasta monitorada: {len(adicionados)} novo(s), {len(alterados)} alterado(s), {len(removidos)} removido(s), {len(copias)} cópia(s) ignorada(s).")
+        extraidos = dict.fromkeys(caminhos); extraidos.update(zip(arquivos, resultados))
+        self.on_delta(extraidos, removidos)
+        return True
+
+    def _copias_no_delta(self, triagem, em_revisao):
+        """{cópia: arquivo mantido} dos arquivos do delta, entre eles e contra os já carregados fora do delta."""
+        copias = dict(core_logic.deduplicar_por_chave(triagem.arquivos, triagem.classificacoes).duplicados)
+        if self.carregados is None: return copias
+        for caminho in triagem.arquivos:
+            identidade = triagem.classificacoes[caminho].identidade
+            if caminho in copias or identidade is None: continue
+            tipo, chave = identidade
+            mantido = next((c for c in self.carregados(chave, tipo != core_logic.TIPO_NFE) if c not in em_revisao), None)
+            if mantido is not None: copias[caminho] = mantido
+        # Cópia de um arquivo do delta que também virou cópia aponta para o que ficou carregado.
+        for copia, mantido in copias.items(): copias[copia] = copias.get(mantido, mantido)
+        return copias